@@ -0,0 +1,207 @@
+"""
+Cluster Profiling
+-----------------
+
+    After clustering, every cluster is described by its size, the mean/std and a few quantiles of the numeric
+    features, and the share of every category of the categorical features.
+
+    ClusterProfiler computes all of these in one grouped pass over the data, and can be fed chunk by chunk
+    (e.g. from StreamingMixedKMeans.predict_chunks), so millions of rows are profiled with flat memory:
+        - count, mean and std come from per-cluster sums (np.bincount with weights)
+        - quantiles come from a per-cluster histogram sketch on fixed bin edges, so they are approximate,
+          within one bin width of the exact value. The edges span the range of every column, which has to hold the
+          values of all the chunks: streamed data needs its global ranges (e.g. the min/max learned by
+          StreamingMixedKMeans.fit_statistics), and values outside of them raise a ValueError instead of
+          silently skewing the quantiles
+        - category shares come from per-cluster value counts
+
+    Plotting every point of millions of rows takes minutes and shows nothing but overplotting, so plot_clusters
+    draws either a random sample of the points or one hexbin density per cluster.
+"""
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+
+class ClusterProfiler:
+    """
+      Accumulates per-cluster statistics over one or more chunks of data.
+      Args:
+        * numeric_cols -> columns summarized with count, mean, std and quantiles
+        * categorical_cols -> columns summarized with the share of every category
+        * quantiles -> quantiles estimated for every numeric column
+        * bins -> number of histogram bins of the quantile sketch
+        * ranges -> dict column -> (low, high) bin range of the quantile sketch, holding all the values of the
+                    column; columns without a range use the min/max of the first chunk, which is only enough when
+                    the data comes in a single chunk. Values outside of the range raise a ValueError
+      """
+
+    def __init__(self, numeric_cols, categorical_cols=(), quantiles=(.25, .5, .75), bins=512, ranges=None):
+        self.numeric_cols_ = list(numeric_cols)
+        self.categorical_cols_ = list(categorical_cols)
+        self.quantiles_ = list(quantiles)
+        self.bins_ = bins
+        self.ranges_ = dict(ranges or {})
+        self.n_clusters = 0
+        self._count = np.zeros(0)
+        self._shift = None
+        self._sum = None
+        self._sumsq = None
+        self._hist = None
+        self._edges = None
+        self._categories = {col: None for col in self.categorical_cols_}
+
+    def _grow(self, n_clusters):
+        extra = n_clusters - self.n_clusters
+        if extra <= 0:
+            return
+        n_num = len(self.numeric_cols_)
+        self._count = np.concatenate((self._count, np.zeros(extra)))
+        self._sum = np.vstack((self._sum, np.zeros((extra, n_num))))
+        self._sumsq = np.vstack((self._sumsq, np.zeros((extra, n_num))))
+        self._hist = np.concatenate((self._hist, np.zeros((n_num, extra, self.bins_))), axis=1)
+        self.n_clusters = n_clusters
+
+    def _init_sketch(self, values):
+        n_num = len(self.numeric_cols_)
+        # sums are taken around a shift (first chunk mean) to avoid cancellation in the variance
+        self._shift = np.nanmean(values, axis=0) if values.shape[0] else np.zeros(n_num)
+        self._sum = np.zeros((0, n_num))
+        self._sumsq = np.zeros((0, n_num))
+        self._hist = np.zeros((n_num, 0, self.bins_))
+        self._edges = []
+        for j, col in enumerate(self.numeric_cols_):
+            low, high = self.ranges_.get(col, (np.nanmin(values[:, j]), np.nanmax(values[:, j])))
+            if high <= low:
+                high = low + 1.0
+            self._edges.append(np.linspace(low, high, self.bins_ + 1))
+
+    def _check_ranges(self, values):
+        # checked before anything is accumulated, so that a failed update leaves the profile unchanged
+        low, high = np.nanmin(values, axis=0, initial=np.inf), np.nanmax(values, axis=0, initial=-np.inf)
+        for j, col in enumerate(self.numeric_cols_):
+            edges = self._edges[j]
+            if low[j] < edges[0] or high[j] > edges[-1]:
+                raise ValueError("values of %s in [%g, %g] are outside the quantile sketch range [%g, %g], "
+                                 "pass its global range in ranges" % (col, low[j], high[j], edges[0], edges[-1]))
+
+    def update(self, df, labels):
+        """
+        Adds a chunk of data to the profile
+        Args:
+          * df -> DataFrame with the numeric and categorical columns
+          * labels -> non negative integer cluster label of every row
+        """
+        labels = np.asarray(labels, dtype=int)
+        values = df[self.numeric_cols_].to_numpy(dtype=float)
+        if self._shift is None:
+            self._init_sketch(values)
+        self._check_ranges(values)
+        self._grow(labels.max() + 1 if labels.size else 0)
+        k = self.n_clusters
+
+        self._count += np.bincount(labels, minlength=k)
+        shifted = values - self._shift
+        for j in range(len(self.numeric_cols_)):
+            valid = ~np.isnan(shifted[:, j])
+            lab = labels[valid]
+            self._sum[:, j] += np.bincount(lab, weights=shifted[valid, j], minlength=k)
+            self._sumsq[:, j] += np.bincount(lab, weights=shifted[valid, j] ** 2, minlength=k)
+            edges = self._edges[j]
+            b = np.clip(np.searchsorted(edges, values[valid, j], side='right') - 1, 0, self.bins_ - 1)
+            self._hist[j] += np.bincount(lab * self.bins_ + b, minlength=k * self.bins_).reshape(k, self.bins_)
+
+        for col in self.categorical_cols_:
+            counts = pd.Series(labels, index=df.index).groupby([labels, df[col].to_numpy()]).size()
+            prev = self._categories[col]
+            self._categories[col] = counts if prev is None else prev.add(counts, fill_value=0)
+        return self
+
+    def _quantiles(self, j):
+        hist = self._hist[j]
+        edges = self._edges[j]
+        cum = np.cumsum(hist, axis=1)
+        total = cum[:, -1:]
+        out = np.full((self.n_clusters, len(self.quantiles_)), np.nan)
+        for qi, q in enumerate(self.quantiles_):
+            target = q * total[:, 0]
+            b = np.minimum((cum < target[:, None]).sum(axis=1), self.bins_ - 1)
+            below = np.where(b > 0, cum[np.arange(self.n_clusters), b - 1], 0)
+            in_bin = hist[np.arange(self.n_clusters), b]
+            # linear interpolation inside the bin that holds the target rank
+            frac = np.where(in_bin > 0, (target - below) / np.where(in_bin > 0, in_bin, 1), 0)
+            out[:, qi] = np.where(total[:, 0] > 0, edges[b] + frac * (edges[b + 1] - edges[b]), np.nan)
+        return out
+
+    def profile(self):
+        """
+        Returns a DataFrame with one row per cluster; columns are (feature, statistic) pairs for the numeric
+        columns and (column, category) shares for the categorical columns
+        """
+        assert self._shift is not None, "First run update"
+        parts = {('size', 'count'): self._count}
+        for j, col in enumerate(self.numeric_cols_):
+            n = self._hist[j].sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = self._sum[:, j] / n
+                var = (self._sumsq[:, j] - n * mean ** 2) / (n - 1)
+            parts[(col, 'count')] = n
+            parts[(col, 'mean')] = mean + self._shift[j]
+            parts[(col, 'std')] = np.sqrt(np.maximum(var, 0))
+            for q, values in zip(self.quantiles_, self._quantiles(j).T):
+                parts[(col, 'q%g' % (q * 100))] = values
+        result = pd.DataFrame(parts, index=pd.RangeIndex(self.n_clusters, name='clusters'))
+
+        for col in self.categorical_cols_:
+            counts = self._categories[col].unstack(fill_value=0).reindex(result.index, fill_value=0)
+            shares = counts.div(counts.sum(axis=1).replace(0, np.nan), axis=0)
+            shares.columns = pd.MultiIndex.from_product([[col], shares.columns])
+            result = result.join(shares)
+        return result
+
+
+def profile_clusters(df, labels, numeric_cols, categorical_cols=(), quantiles=(.25, .5, .75), bins=512):
+    """
+    Profiles an in-memory DataFrame in one grouped pass, see ClusterProfiler
+    """
+    profiler = ClusterProfiler(numeric_cols, categorical_cols, quantiles=quantiles, bins=bins)
+    return profiler.update(df, labels).profile()
+
+
+def plot_clusters(df, x, y, labels, kind='sample', max_points=5000, gridsize=50, random_state=None):
+    """
+    Plots two features per cluster without drawing every point
+    Args:
+      * df -> DataFrame with columns x and y
+      * labels -> cluster label of every row
+      * kind -> 'sample' scatters a random sample of at most max_points rows coloured by cluster,
+                'hexbin' draws one hexbin density per cluster on shared axes
+      * gridsize -> number of hexagons in the x direction for kind='hexbin'
+    """
+    labels = np.asarray(labels)
+    if kind == 'sample':
+        rng = np.random.RandomState(random_state)
+        rows = np.arange(len(df))
+        if rows.size > max_points:
+            rows = np.sort(rng.choice(rows, max_points, replace=False))
+        fig, ax = plt.subplots()
+        points = ax.scatter(df[x].to_numpy()[rows], df[y].to_numpy()[rows], c=labels[rows], s=8, cmap='tab10')
+        ax.legend(*points.legend_elements(), title='clusters')
+        ax.set_title('Clusters %s vs %s (%d of %d points)' % (x, y, rows.size, len(df)))
+    elif kind == 'hexbin':
+        clusters = np.unique(labels)
+        fig, axes = plt.subplots(1, clusters.size, sharex=True, sharey=True, figsize=(4 * clusters.size, 4),
+                                 squeeze=False)
+        extent = (df[x].min(), df[x].max(), df[y].min(), df[y].max())
+        for ax, c in zip(axes[0], clusters):
+            members = labels == c
+            ax.hexbin(df[x].to_numpy()[members], df[y].to_numpy()[members], gridsize=gridsize, extent=extent,
+                      bins='log', mincnt=1)
+            ax.set_title('Cluster %s (%d points)' % (c, members.sum()))
+        ax = axes[0, 0]
+    else:
+        raise ValueError("kind has to be 'sample' or 'hexbin'")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    return fig
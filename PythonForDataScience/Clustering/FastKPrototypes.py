@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Parallel, vectorized k-prototypes
+---------------------------------
+
+    k-prototypes (Huang, 1997) clusters mixed data: the dissimilarity between a point and a prototype is the squared
+    euclidean distance on the numerical attributes plus gamma times the number of mismatching categorical attributes.
+
+    kmodes' KPrototypes works on object arrays and moves points one at a time, which makes large runs (e.g. the
+    1e5 x 10, K=20 benchmark in KPrototype02.py) slow. This driver
+        - works on a float numeric block and an integer-coded categorical block,
+        - computes the numeric and matching distances of a chunk of points to all prototypes at once
+          (batch assignment, like Lloyd's k-means), and updates means and modes with np.bincount,
+        - runs the n_init initializations in parallel processes (joblib) and keeps the lowest-cost solution.
+"""
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from MixedData import MixedMatrix
+
+CHUNK_SIZE = 16384
+
+
+def assign(Xnum, Xcat, num_centroids, cat_centroids, gamma, chunk_size=CHUNK_SIZE):
+    """
+    Closest prototype of every point, and its cost, computed chunk by chunk.
+    Args:
+      * Xnum -> (n, n_num) numeric block
+      * Xcat -> (n, n_cat) integer-coded categorical block
+      * num_centroids, cat_centroids -> numeric and categorical parts of the K prototypes
+      * gamma -> weight of the categorical (matching) dissimilarity
+    """
+    n = Xnum.shape[0] if Xnum.size else Xcat.shape[0]
+    labels = np.empty(n, dtype=np.intp)
+    costs = np.empty(n)
+    centroid_sq = (num_centroids.astype(float) ** 2).sum(axis=1)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        num = Xnum[start:stop].astype(float, copy=False)
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2
+        dist = (num ** 2).sum(axis=1)[:, None] - 2 * num.dot(num_centroids.T) + centroid_sq
+        np.maximum(dist, 0, out=dist)
+        cat = Xcat[start:stop]
+        for j in range(Xcat.shape[1]):
+            dist += gamma * (cat[:, j, None] != cat_centroids[None, :, j])
+        labels[start:stop] = dist.argmin(axis=1)
+        costs[start:stop] = dist[np.arange(stop - start), labels[start:stop]]
+    return labels, costs
+
+
+def update(Xnum, Xcat, labels, n_clusters, n_levels):
+    """
+    New prototypes: mean of the numeric attributes and mode of every categorical attribute per cluster.
+    Returns the numeric and categorical prototypes and the size of every cluster.
+    """
+    counts = np.bincount(labels, minlength=n_clusters)
+    num_centroids = np.empty((n_clusters, Xnum.shape[1]))
+    for j in range(Xnum.shape[1]):
+        num_centroids[:, j] = np.bincount(labels, weights=Xnum[:, j], minlength=n_clusters)
+    num_centroids /= np.maximum(counts, 1)[:, None]
+    cat_centroids = np.empty((n_clusters, Xcat.shape[1]), dtype=Xcat.dtype)
+    for j in range(Xcat.shape[1]):
+        freq = np.bincount(labels * n_levels[j] + Xcat[:, j], minlength=n_clusters * n_levels[j])
+        cat_centroids[:, j] = freq.reshape(n_clusters, n_levels[j]).argmax(axis=1)
+    return num_centroids, cat_centroids, counts
+
+
+def init_centroids(Xnum, Xcat, n_clusters, init, n_levels, rng):
+    """
+    Initial prototypes.
+      * 'Cao' -> categorical parts chosen by density and dissimilarity (Cao et al., 2009), numeric parts drawn
+                 around the mean (as in kmodes)
+      * 'Huang' -> categorical parts sampled from the attribute frequencies and snapped to the closest actual
+                   point (Huang, 1998), numeric parts drawn around the mean
+      * 'random' -> K distinct random points
+    """
+    n = Xcat.shape[0]
+    if init == 'random':
+        rows = rng.choice(n, n_clusters, replace=False)
+        return Xnum[rows].astype(float), Xcat[rows].copy()
+
+    freqs = [np.bincount(Xcat[:, j], minlength=n_levels[j]) for j in range(Xcat.shape[1])]
+    if init == 'Cao':
+        density = np.zeros(n)
+        for j, f in enumerate(freqs):
+            density += f[Xcat[:, j]]
+        density /= max(Xcat.shape[1], 1) * n
+        rows = [int(density.argmax())]
+        # every next prototype maximizes min over the chosen ones of density * dissimilarity
+        score = np.full(n, np.inf)
+        for _ in range(1, n_clusters):
+            score = np.minimum(score, density * (Xcat != Xcat[rows[-1]]).sum(axis=1))
+            rows.append(int(score.argmax()))
+        cat_centroids = Xcat[rows].copy()
+    elif init == 'Huang':
+        cat_centroids = np.empty((n_clusters, Xcat.shape[1]), dtype=Xcat.dtype)
+        for j, f in enumerate(freqs):
+            cat_centroids[:, j] = rng.choice(n_levels[j], n_clusters, p=f / float(f.sum()))
+        # snap every sampled prototype to the closest point not used yet
+        used = np.zeros(n, dtype=bool)
+        for i in range(n_clusters):
+            dist = (Xcat != cat_centroids[i]).sum(axis=1).astype(float)
+            dist[used] = np.inf
+            row = dist.argmin()
+            used[row] = True
+            cat_centroids[i] = Xcat[row]
+    else:
+        raise ValueError("Init method %s is not supported" % init)
+
+    mean = Xnum.mean(axis=0) if Xnum.size else np.zeros(Xnum.shape[1])
+    std = Xnum.std(axis=0) if Xnum.size else np.zeros(Xnum.shape[1])
+    num_centroids = mean + rng.randn(n_clusters, Xnum.shape[1]) * std
+    return num_centroids, cat_centroids
+
+
+def k_prototypes_single(Xnum, Xcat, n_clusters, max_iter, gamma, init, n_levels, seed, chunk_size=CHUNK_SIZE):
+    """
+    One run of batch k-prototypes from one initialization.
+    Returns (num_centroids, cat_centroids, labels, cost, n_iter)
+    """
+    rng = np.random.RandomState(seed)
+    num_centroids, cat_centroids = init_centroids(Xnum, Xcat, n_clusters, init, n_levels, rng)
+    labels, costs = assign(Xnum, Xcat, num_centroids, cat_centroids, gamma, chunk_size)
+    cost = costs.sum()
+    # prototypes that the kept labels were assigned to
+    best_num, best_cat = num_centroids.copy(), cat_centroids.copy()
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        num_centroids, cat_centroids, counts = update(Xnum, Xcat, labels, n_clusters, n_levels)
+        # an empty cluster is re-seeded with the point that is currently the most expensive
+        for empty in np.where(counts == 0)[0]:
+            worst = costs.argmax()
+            num_centroids[empty], cat_centroids[empty] = Xnum[worst], Xcat[worst]
+            costs[worst] = 0
+        new_labels, costs = assign(Xnum, Xcat, num_centroids, cat_centroids, gamma, chunk_size)
+        new_cost = costs.sum()
+        converged = np.array_equal(new_labels, labels) or new_cost >= cost
+        if new_cost <= cost:
+            labels, cost = new_labels, new_cost
+            best_num, best_cat = num_centroids.copy(), cat_centroids.copy()
+        if converged:
+            break
+    return best_num, best_cat, labels, cost, n_iter
+
+
+class FastKPrototypes:
+    """
+      k-prototypes clustering with parallel initializations and vectorized, chunked distances.
+      Args:
+        * n_clusters -> number of clusters
+        * max_iter -> maximum number of iterations of a single run
+        * init -> 'Cao', 'Huang' or 'random'
+        * n_init -> number of runs with different seeds; the lowest-cost run is kept
+        * gamma -> weight of the categorical dissimilarity; defaults to half the std of the numeric data (as kmodes)
+        * n_jobs -> processes running the initializations (-1 uses all cores)
+        * chunk_size -> number of points whose distances to all prototypes are computed at once
+        * cluster_centroids_ -> (numeric prototypes, categorical prototypes as codes)
+        * cluster_categories_ -> categorical prototypes decoded to their categories (set by fit_mixed)
+        * gamma_ -> weight of the categorical dissimilarity used by fit (gamma, or its estimate)
+        * labels_, cost_, n_iter_ -> result of the best run
+      """
+
+    def __init__(self, n_clusters=8, max_iter=100, init='Cao', n_init=10, gamma=None, n_jobs=-1,
+                 chunk_size=CHUNK_SIZE, random_state=None, verbose=0):
+        self.n_clusters = n_clusters
+        self.max_iter = max_iter
+        self.init = init
+        self.n_init = n_init
+        self.gamma = gamma
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+        self.verbose = verbose
+        self.cluster_centroids_ = None
+        self.cluster_categories_ = None
+        self.gamma_ = None
+        self.labels_ = None
+        self.cost_ = None
+        self.n_iter_ = None
+
+    def fit(self, Xnum, Xcat, n_levels=None):
+        """
+        Fits on a numeric block and an integer-coded categorical block
+        Args:
+          * Xnum -> (n, n_num) numeric array
+          * Xcat -> (n, n_cat) array of non negative integer codes
+          * n_levels -> number of categories of every categorical column (max code + 1 by default)
+        """
+        Xnum = np.asarray(Xnum)
+        Xcat = np.asarray(Xcat)
+        if n_levels is None:
+            n_levels = Xcat.max(axis=0).astype(int) + 1 if Xcat.size else np.zeros(Xcat.shape[1], dtype=int)
+        gamma = self.gamma
+        if gamma is None:
+            gamma = 0.5 * Xnum.std() if Xnum.size else 1.0
+
+        rng = np.random.RandomState(self.random_state)
+        seeds = rng.randint(np.iinfo(np.int32).max, size=self.n_init)
+        # the arrays are memory-mapped into the workers by joblib, so they are not copied per process
+        runs = Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(
+            delayed(k_prototypes_single)(Xnum, Xcat, self.n_clusters, self.max_iter, gamma, self.init,
+                                         n_levels, seed, self.chunk_size)
+            for seed in seeds)
+        best = min(runs, key=lambda run: run[3])
+        num_centroids, cat_centroids, self.labels_, self.cost_, self.n_iter_ = best
+        self.cluster_centroids_ = (num_centroids, cat_centroids)
+        self.gamma_ = gamma
+        if self.verbose:
+            print("Run costs: %s" % [run[3] for run in runs])
+        return self
+
+    def fit_mixed(self, mixed):
+        """
+        Fits on the numeric and coded categorical blocks of a MixedMatrix (see MixedData.py)
+        """
+        self.fit(mixed.numeric, mixed.categorical, n_levels=mixed.n_levels)
+        self.cluster_categories_ = mixed.decode(self.cluster_centroids_[1])
+        return self
+
+    def fit_predict(self, X, categorical):
+        """
+        kmodes compatible entry point: X is one matrix and categorical the indices of its categorical columns.
+        X is converted to a MixedMatrix (float32 numeric block, integer-coded categorical block) before fitting.
+        """
+        return self.fit_mixed(MixedMatrix.from_array(X, categorical)).labels_
+
+    def predict(self, Xnum, Xcat):
+        """
+        Closest prototype of every point
+        """
+        assert self.cluster_centroids_ is not None, "First run fit"
+        return assign(np.asarray(Xnum), np.asarray(Xcat), self.cluster_centroids_[0], self.cluster_centroids_[1],
+                      self.gamma_, self.chunk_size)[0]
@@ -1,2 +1,38 @@
+"""
+Hierarchical Clustering
+-----------------------
+
+    Agglomerative (bottom-up) hierarchical clustering starts with every point as its own cluster and repeatedly merges the
+    two closest clusters, which gives a tree (dendrogram) that can be cut at any number of clusters.
+
+    The naive algorithm needs the distance between every pair of points, i.e. O(n^2) memory, which limits it to a few tens
+    of thousands of rows. For larger data, MicroClusterHierarchy first pre-aggregates the points into micro-clusters
+    (k-means++ seeded mini-batch k-means, or BIRCH) and runs the linkage on those only, keeping the distances as a
+    condensed float32 vector. The dendrogram is then drawn truncated to its last merges.
+"""
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
 from sklearn import preprocessing
-normalized_data = preprocessing.normalize(df_encodeddata)
\ No newline at end of file
+from MicroClusterHierarchy import MicroClusterHierarchy
+
+data = pd.read_csv('Data/Wholesale customers data.csv')
+df_encodeddata = pd.get_dummies(data, columns=['Channel', 'Region'])
+normalized_data = preprocessing.normalize(df_encodeddata)
+
+# Example 01: small data, every point is a micro-cluster, so this is plain ward linkage.
+hc = MicroClusterHierarchy(method='ward').fit(normalized_data)
+hc.dendrogram(p=30)
+plt.title('Dendrogram (Wholesale customers)')
+plt.show()
+print(pd.Series(hc.labels(n_clusters=4)).value_counts())
+
+# Example 02: 200k rows in bounded memory. The linkage only sees 2000 micro-clusters,
+# so the condensed distances take 2000 * 1999 / 2 * 4 bytes = 8 MB instead of 160 GB.
+large_data = np.repeat(normalized_data, 455, axis=0) + np.random.normal(scale=0.01, size=(440 * 455, normalized_data.shape[1]))
+hc_large = MicroClusterHierarchy(n_micro=2000, method='ward', random_state=0).fit(large_data)
+hc_large.dendrogram(p=30)
+plt.title('Truncated dendrogram (200k rows)')
+plt.show()
+print(pd.Series(hc_large.labels(n_clusters=4)).value_counts())
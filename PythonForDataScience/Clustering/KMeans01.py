@@ -32,11 +32,13 @@ from scipy import stats
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 import seaborn as sns
+from StreamingKMeans import StreamingMixedKMeans
+from ClusterProfile import ClusterProfiler, profile_clusters, plot_clusters
 
 df = pd.read_csv('C:/.../Dataset.csv',sep=';')
 
-#Make a copy of DF
-df_tr = df
+#Make a copy of DF (plain assignment would only create a second reference, and the clusters would be written into df)
+df_tr = df.copy()
 
 #Transsform the timeOfDay to dummies
 df_tr = pd.get_dummies(df_tr, columns=['timeOfDay'])
@@ -58,12 +60,37 @@ clmns.extend(['clusters'])
 #Lets analyze the clusters
 print(df_tr[clmns].groupby(['clusters']).mean())
 
+#The profile gives count, mean, std, quartiles and category shares of every cluster in one grouped pass
+print(profile_clusters(df, labels, numeric_cols=['Wattage', 'Duration'], categorical_cols=['timeOfDay']).T)
+
 #Scatter plot of Wattage and Duration
-sns.lmplot('Wattage', 'Duration',
+sns.lmplot(x='Wattage', y='Duration',
            data=df_tr,
            fit_reg=False,
            hue="clusters",
            scatter_kws={"marker": "D", "s": 100})
 plt.title('Clusters Wattage vs Duration')
 plt.xlabel('Wattage')
-plt.ylabel('Duration')
\ No newline at end of file
+plt.ylabel('Duration')
+
+#On millions of rows, drawing every point takes minutes; plot a sample of the points or one hexbin density per cluster instead
+plot_clusters(df, 'Wattage', 'Duration', labels, kind='sample', max_points=5000)
+plot_clusters(df, 'Wattage', 'Duration', labels, kind='hexbin')
+plt.show()
+
+# Out-of-core version of the same pipeline, for multi-GB meter data that does not fit in memory.
+# The one-hot categories and the z-score statistics are learned in one streaming pass over the CSV,
+# MiniBatchKMeans is then fitted chunk by chunk, and every chunk is labelled and written out,
+# so memory stays flat whatever the size of the file.
+skm = StreamingMixedKMeans(numeric_cols=['Wattage', 'Duration'], categorical_cols=['timeOfDay'],
+                           n_clusters=2, chunksize=500000, random_state=0, sep=';')
+skm.fit('C:/.../Dataset.csv')
+skm.predict_to_csv('C:/.../Dataset.csv', 'C:/.../Dataset_clusters.csv', sep=';')
+
+# The clusters of the large file are profiled chunk by chunk as well. The quantile sketch needs the range of
+# every numeric column over the whole file, learned in the statistics pass of skm.
+ranges = dict(zip(skm.numeric_cols_, zip(skm.min, skm.max)))
+profiler = ClusterProfiler(numeric_cols=['Wattage', 'Duration'], categorical_cols=['timeOfDay'], ranges=ranges)
+for chunk in skm.predict_chunks('C:/.../Dataset.csv'):
+    profiler.update(chunk, chunk['clusters'])
+print(profiler.profile().T)
@@ -4,10 +4,12 @@
 
 import numpy as np
 from kmodes.kprototypes import KPrototypes
+from MixedData import load_mixed_csv
+from FastKPrototypes import FastKPrototypes
 
 # stocks with their market caps, sectors and countries
 syms = np.genfromtxt('Data/stocks.csv', dtype=str, delimiter=',')[:, 0]
-X = np.genfromtxt('stocks.csv', dtype=object, delimiter=',')[:, 1:]
+X = np.genfromtxt('Data/stocks.csv', dtype=object, delimiter=',')[:, 1:]
 X[:, 0] = X[:, 0].astype(float)
 
 kproto = KPrototypes(n_clusters=4, init='Cao', verbose=2)
@@ -21,3 +23,19 @@ print(kproto.n_iter_)
 
 for s, c in zip(syms, clusters):
     print("Symbol: {}, cluster:{}".format(s, c))
+
+# The object array above stores every cell as a Python object, and every distance computation compares Python objects.
+# load_mixed_csv reads the same columns into a float32 numeric block and a uint8 coded categorical block, with the
+# category dictionary stored next to it, and FastKPrototypes clusters the two blocks directly.
+stocks = load_mixed_csv('Data/stocks.csv', numeric_cols=[1], categorical_cols=[2, 3], header=None)
+print("Object array: {} bytes, coded blocks: {} bytes".format(
+    X.nbytes + sum(v.__sizeof__() for v in X.ravel()), stocks.nbytes))
+
+fast_kproto = FastKPrototypes(n_clusters=4, init='Cao', random_state=0).fit_mixed(stocks)
+print(fast_kproto.cluster_centroids_[0])
+print(fast_kproto.cluster_categories_)
+print(fast_kproto.cost_)
+print(fast_kproto.n_iter_)
+
+for s, c in zip(syms, fast_kproto.labels_):
+    print("Symbol: {}, cluster:{}".format(s, c))
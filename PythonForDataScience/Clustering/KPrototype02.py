@@ -4,6 +4,8 @@
 import timeit
 import numpy as np
 from kmodes.kprototypes import KPrototypes
+from FastKPrototypes import FastKPrototypes
+from MixedData import MixedMatrix
 
 # number of clusters
 K = 20
@@ -17,6 +19,8 @@ MN = 5
 T = 3
 
 data = np.random.randint(1, 1000, (N, M))
+# FastKPrototypes works on a float32 numeric block and an integer-coded categorical block
+data_mixed = MixedMatrix.from_array(data, categorical=list(range(M - MN, M)))
 
 
 def huang():
@@ -27,9 +31,20 @@ def cao():
     KPrototypes(n_clusters=K, init='Cao', verbose=2).fit_predict(data, categorical=list(range(M - MN, M)))
 
 
+def fast_huang():
+    model = FastKPrototypes(n_clusters=K, init='Huang', n_init=1).fit_mixed(data_mixed)
+    print('Cost: {:.6g}, iterations: {}'.format(model.cost_, model.n_iter_))
+
+
+def fast_cao():
+    # same n_init as kmodes' default, the initializations run in parallel processes
+    model = FastKPrototypes(n_clusters=K, init='Cao', n_init=10, n_jobs=-1).fit_mixed(data_mixed)
+    print('Cost: {:.6g}, iterations: {}'.format(model.cost_, model.n_iter_))
+
+
 if __name__ == '__main__':
 
-    for cm in ('huang', 'cao'):
+    for cm in ('huang', 'cao', 'fast_huang', 'fast_cao'):
         print(cm.capitalize() + ': {:.2} seconds'.format(
             timeit.timeit(cm + '()',
                           setup='from __main__ import ' + cm,
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+K-Prototypes Benchmark Harness
+------------------------------
+
+    KPrototype02.py times a single configuration. This harness sweeps
+        - N        : number of points
+        - K        : number of clusters
+        - MC       : number of categorical columns (next to MN numerical ones)
+        - init     : 'Huang' / 'Cao'
+        - backend  : 'kmodes'   -> kmodes' KPrototypes on one object matrix (object comparisons)
+                     'serial'   -> FastKPrototypes on coded MixedMatrix blocks, one process
+                     'parallel' -> FastKPrototypes on coded MixedMatrix blocks, initializations in parallel
+    and records wall time, iterations to converge, final cost and peak RSS of every run. All the backends get the
+    same object matrix (integer numeric columns, string categories).
+
+    Every run executes in a fresh worker process, so the memory of one run does not leak into the next. The peak RSS
+    is measured the same way for every backend: the total RSS of the run process and all its descendants (the joblib
+    workers of the 'parallel' backend, which stay alive after the fit and so never show up in RUSAGE_CHILDREN) is
+    sampled from the start of the fit, once the data is generated, to its end. It needs psutil, and is NaN without it.
+    Results are saved as JSON and CSV to plot scaling curves; passing a previous CSV as baseline flags the
+    configurations that got slower.
+
+    Usage:
+        python Clustering/KPrototype03.py --N 10000 100000 --K 8 20 --MC 5 --backend kmodes serial parallel
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class TreeRSSMonitor:
+    """
+      Samples, in a background thread, the total RSS of this process and all its descendants (e.g. the joblib
+      workers); peak_mb is the largest total seen, NaN without psutil.
+      Args:
+        * interval -> seconds between two samples
+      """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb = np.nan
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _tree_rss(self, process):
+        total = 0
+        for p in [process] + process.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # a worker that exits between the listing and the sample
+                pass
+        return total / 2.0 ** 20
+
+    def _sample(self):
+        process = psutil.Process()
+        # one sample when the block starts, every interval, and one when it ends
+        while True:
+            self.peak_mb = np.nanmax([self.peak_mb, self._tree_rss(process)])
+            if self._stop.is_set():
+                return
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if psutil is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        return False
+
+
+def make_data(N, MN, MC, levels, seed):
+    """
+    Object matrix with MN integer columns followed by MC categorical columns of string categories
+    """
+    rng = np.random.RandomState(seed)
+    categories = np.array(['c%d' % i for i in range(levels)], dtype=object)
+    return np.column_stack((rng.randint(1, 1000, (N, MN)).astype(object), categories[rng.randint(0, levels, (N, MC))]))
+
+
+def run_one(config):
+    """
+    Runs one configuration and returns its measurements; meant to be executed in a fresh process
+    """
+    from kmodes.kprototypes import KPrototypes
+    from FastKPrototypes import FastKPrototypes
+    from MixedData import MixedMatrix
+
+    data = make_data(config['N'], config['MN'], config['MC'], config['levels'], config['seed'])
+    categorical = list(range(config['MN'], config['MN'] + config['MC']))
+    parallel = config['backend'] == 'parallel'
+    with TreeRSSMonitor() as monitor:
+        start = time.perf_counter()
+        if config['backend'] == 'kmodes':
+            model = KPrototypes(n_clusters=config['K'], init=config['init'], n_init=config['n_init'],
+                                random_state=config['seed']).fit(data, categorical=categorical)
+        else:
+            mixed = MixedMatrix.from_array(data, categorical)
+            model = FastKPrototypes(n_clusters=config['K'], init=config['init'], n_init=config['n_init'],
+                                    n_jobs=-1 if parallel else 1, random_state=config['seed']).fit_mixed(mixed)
+        wall = time.perf_counter() - start
+    result = dict(config)
+    result.update(wall_time=wall, n_iter=int(model.n_iter_), cost=float(model.cost_),
+                  peak_rss_mb=monitor.peak_mb)
+    return result
+
+
+def run_benchmark(N, K, MC, inits, backends, MN=5, levels=100, n_init=4, seed=0, verbose=True):
+    """
+    Runs every combination of the parameters and returns a DataFrame with one row per run
+    """
+    configs = [dict(N=n, K=k, MN=MN, MC=mc, levels=levels, init=init, backend=backend, n_init=n_init, seed=seed)
+               for n, k, mc, init, backend in itertools.product(N, K, MC, inits, backends)]
+    results = []
+    for config in configs:
+        # a new executor per run gives every run its own process, hence its own peak RSS; unlike
+        # multiprocessing.Pool workers, executor workers are not daemonic and can start the joblib pool
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_one, config).result()
+        if verbose:
+            print('{backend:>8} {init:>5} N={N:<8} K={K:<3} MC={MC:<3}: {wall_time:8.2f}s, {n_iter:3d} iterations, '
+                  'cost {cost:.6g}, peak RSS {peak_rss_mb:.0f} MB'.format(**result))
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Joins the results with a baseline run and flags configurations more than tolerance slower
+    """
+    keys = ['N', 'K', 'MN', 'MC', 'levels', 'init', 'backend', 'n_init']
+    merged = results.merge(baseline[keys + ['wall_time', 'cost']], on=keys, how='left', suffixes=('', '_baseline'))
+    merged['slowdown'] = merged['wall_time'] / merged['wall_time_baseline']
+    merged['regression'] = merged['slowdown'] > 1 + tolerance
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='k-prototypes scaling benchmark')
+    parser.add_argument('--N', type=int, nargs='+', default=[10000, 30000, 100000])
+    parser.add_argument('--K', type=int, nargs='+', default=[8, 20])
+    parser.add_argument('--MC', type=int, nargs='+', default=[5])
+    parser.add_argument('--MN', type=int, default=5)
+    parser.add_argument('--levels', type=int, default=100, help='number of categories of every categorical column')
+    parser.add_argument('--init', nargs='+', default=['Huang', 'Cao'])
+    parser.add_argument('--backend', nargs='+', default=['kmodes', 'serial', 'parallel'])
+    parser.add_argument('--n_init', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='kprototype_benchmark', help='prefix of the .json and .csv result files')
+    parser.add_argument('--baseline', help='CSV of a previous run to compare against')
+    args = parser.parse_args()
+
+    df = run_benchmark(args.N, args.K, args.MC, args.init, args.backend, MN=args.MN, levels=args.levels,
+                       n_init=args.n_init, seed=args.seed)
+    if args.baseline:
+        df = compare_to_baseline(df, pd.read_csv(args.baseline))
+        print(df[df['regression']])
+    df.to_csv(args.out + '.csv', index=False)
+    with open(args.out + '.json', 'w') as f:
+        json.dump(df.to_dict(orient='records'), f, indent=2)
+    print(df.pivot_table(index=['init', 'N', 'K', 'MC'], columns='backend', values='wall_time'))
@@ -0,0 +1,223 @@
+"""
+Hierarchical Clustering for Large Datasets
+------------------------------------------
+
+    Agglomerative clustering needs the full pairwise distance matrix, i.e. O(n^2) memory: 200k rows would need
+    160 GB in float64. The usual way around it (the global phase of BIRCH) is to pre-aggregate the points into
+    a few thousand micro-clusters, and then run the linkage on the micro-cluster centres only.
+
+    Memory is bounded by the number of micro-clusters m (at most n_micro), not by n:
+        - the micro-cluster distances are kept in condensed form (m * (m - 1) / 2 values) as float32
+        - every point only keeps the id of its micro-cluster
+    A micro-cluster stands for all of its points: Ward merges are weighted by the number of points of every
+    micro-cluster (its Ward distance to another one grows with both sizes), so the tree is the Ward tree of the
+    points with every micro-cluster collapsed to its centre. Single and complete linkage do not depend on the sizes
+    and run on the centre distances; the other scipy methods would treat a micro-cluster of thousands of points as
+    one point, so they are not offered.
+    The dendrogram is drawn truncated to the last p merges, with the number of points under every leaf.
+"""
+
+import numpy as np
+from scipy.cluster.hierarchy import dendrogram, fcluster, linkage
+from sklearn.cluster import Birch, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances
+
+
+def weighted_ward_linkage(centers, sizes):
+    """
+    Ward linkage of weighted points: a point of weight w counts as w points at the same place, and the Ward
+    distance of two clusters is sqrt(2 * na * nb / (na + nb)) * |ca - cb| (scipy's convention, the distance of two
+    single points is their euclidean distance). Built with the nearest-neighbour chain algorithm in O(m^2) time and
+    O(m) memory, and returned as a scipy linkage matrix (the fourth column counts the merged points of centers).
+    Args:
+      * centers -> (points,attributes) format
+      * sizes -> weight of every point
+    """
+    centers = np.array(centers, dtype=float)
+    weights = np.asarray(sizes, dtype=float).copy()
+    m = centers.shape[0]
+    active = np.ones(m, dtype=bool)
+    merges = []
+    chain = []
+    for _ in range(m - 1):
+        if not chain:
+            chain.append(int(np.flatnonzero(active)[0]))
+        # follow nearest neighbours until two clusters are each other's nearest neighbour
+        while True:
+            x = chain[-1]
+            w = weights[x]
+            dist = np.sqrt(2 * w * weights / (w + weights) * ((centers - centers[x]) ** 2).sum(axis=1))
+            dist[~active] = np.inf
+            dist[x] = np.inf
+            y = int(dist.argmin())
+            if len(chain) > 1 and dist[chain[-2]] <= dist[y]:
+                y = chain[-2]
+                break
+            chain.append(y)
+        chain = chain[:-2]
+        merges.append((x, y, dist[y]))
+        # the merged cluster takes the place of y
+        centers[y] = (w * centers[x] + weights[y] * centers[y]) / (w + weights[y])
+        weights[y] += w
+        active[x] = False
+
+    # merges in order of distance (Ward is reducible, so this order is a valid agglomeration), numbered as scipy does
+    merges.sort(key=lambda merge: merge[2])
+    node = np.arange(m)
+    count = np.ones(2 * m - 1)
+    parent = np.arange(m)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    Z = np.empty((m - 1, 4))
+    for i, (x, y, d) in enumerate(merges):
+        rx, ry = root(x), root(y)
+        a, b = sorted((node[rx], node[ry]))
+        count[m + i] = count[a] + count[b]
+        Z[i] = a, b, d, count[m + i]
+        parent[rx] = ry
+        node[ry] = m + i
+    return Z
+
+
+def condensed_distances(points, dtype=np.float32, chunk_size=1024):
+    """
+    Condensed (upper triangle, row by row) euclidean distance vector, as returned by scipy's pdist,
+    but filled block by block and stored in the requested dtype.
+    Args:
+      * points -> (examples,attributes) format
+      * dtype -> dtype of the returned vector
+      * chunk_size -> number of rows of the distance matrix computed at once
+    """
+    m = points.shape[0]
+    condensed = np.empty(m * (m - 1) // 2, dtype=dtype)
+    for start in range(0, m, chunk_size):
+        stop = min(start + chunk_size, m)
+        block = pairwise_distances(points[start:stop], points[start:])
+        for i in range(start, stop):
+            # row i of the upper triangle starts at m*i - i*(i+1)/2 and holds distances to i+1 .. m-1
+            offset = m * i - i * (i + 1) // 2
+            condensed[offset:offset + m - i - 1] = block[i - start, i - start + 1:]
+    return condensed
+
+
+class MicroClusterHierarchy:
+    """
+      Hierarchical clustering on micro-clusters.
+      Args:
+        * n_micro -> number of micro-clusters the points are pre-aggregated into
+        * method -> 'ward' (weighted by the micro-cluster sizes), 'single' or 'complete'
+        * reducer -> 'kmeans' (MiniBatchKMeans with k-means++ seeds) or 'birch'
+        * birch_threshold -> radius of a BIRCH subcluster, only used by the 'birch' reducer; when BIRCH finds more
+                             than n_micro subclusters, they are grouped into n_micro by MiniBatchKMeans weighted by
+                             their number of points
+        * centers -> micro-cluster centres
+        * sizes -> number of points in every micro-cluster
+        * micro_labels -> micro-cluster id of every point seen by fit
+        * distances -> condensed float32 distances between the micro-cluster centres
+        * linkage_matrix -> scipy linkage matrix over the micro-clusters
+      """
+
+    def __init__(self, n_micro=2000, method='ward', reducer='kmeans', birch_threshold=0.5, random_state=None):
+        assert reducer in ('kmeans', 'birch'), "reducer has to be 'kmeans' or 'birch'"
+        assert method in ('ward', 'single', 'complete'), "method has to be 'ward', 'single' or 'complete'"
+        self.n_micro_ = n_micro
+        self.method_ = method
+        self.reducer_ = reducer
+        self.birch_threshold_ = birch_threshold
+        self.random_state_ = random_state
+        self.centers = None
+        self.sizes = None
+        self.micro_labels = None
+        self.distances = None
+        self.linkage_matrix = None
+
+    def fit(self, data):
+        """
+        Pre-aggregates the data into micro-clusters and builds the hierarchy on top of them
+        Args:
+          * data -> (examples,attributes) format
+        """
+        data = np.asarray(data, dtype=float)
+        if data.shape[0] <= self.n_micro_:
+            # small data: every point is its own micro-cluster
+            self.centers = data
+            self.micro_labels = np.arange(data.shape[0])
+        elif self.reducer_ == 'birch':
+            birch = Birch(threshold=self.birch_threshold_, n_clusters=None).fit(data)
+            self.centers = birch.subcluster_centers_
+            self.micro_labels = birch.labels_
+            if self.centers.shape[0] > self.n_micro_:
+                # too many subclusters for the threshold: group them into n_micro, weighted by their points
+                km = self._kmeans().fit(self.centers, sample_weight=np.bincount(self.micro_labels,
+                                                                                minlength=self.centers.shape[0]))
+                self.centers = km.cluster_centers_
+                self.micro_labels = km.labels_[self.micro_labels]
+        else:
+            km = self._kmeans().fit(data)
+            self.centers = km.cluster_centers_
+            self.micro_labels = km.labels_
+
+        # drop micro-clusters that ended up empty and renumber the rest
+        used, self.micro_labels = np.unique(self.micro_labels, return_inverse=True)
+        self.centers = self.centers[used]
+        self.sizes = np.bincount(self.micro_labels)
+
+        self.distances = condensed_distances(self.centers)
+        if self.method_ == 'ward':
+            self.linkage_matrix = weighted_ward_linkage(self.centers, self.sizes)
+        else:
+            self.linkage_matrix = linkage(self.distances, method=self.method_)
+        return self
+
+    def _kmeans(self):
+        return MiniBatchKMeans(n_clusters=self.n_micro_, batch_size=max(4096, 3 * self.n_micro_), n_init=1,
+                               random_state=self.random_state_)
+
+    def predict(self, data, n_clusters):
+        """
+        Assigns points to n_clusters clusters through their closest micro-cluster
+        Args:
+          * data -> (examples,attributes) format
+          * n_clusters -> number of clusters to cut the tree into
+        """
+        assert self.linkage_matrix is not None, "First run fit"
+        micro = pairwise_distances(np.asarray(data, dtype=float), self.centers).argmin(axis=1)
+        return self.micro_cluster_labels(n_clusters)[micro]
+
+    def labels(self, n_clusters):
+        """
+        Cluster labels (0 based) of the points seen by fit, after cutting the tree into n_clusters clusters
+        """
+        assert self.linkage_matrix is not None, "First run fit"
+        return self.micro_cluster_labels(n_clusters)[self.micro_labels]
+
+    def micro_cluster_labels(self, n_clusters):
+        return fcluster(self.linkage_matrix, n_clusters, criterion='maxclust') - 1
+
+    def node_sizes(self):
+        """
+        Number of points under every node of the tree (micro-clusters first, then the merges in order)
+        """
+        m = self.sizes.size
+        sizes = np.concatenate((self.sizes, np.zeros(m - 1, dtype=self.sizes.dtype)))
+        for i, (a, b) in enumerate(self.linkage_matrix[:, :2].astype(int)):
+            sizes[m + i] = sizes[a] + sizes[b]
+        return sizes
+
+    def dendrogram(self, p=30, ax=None, **kwargs):
+        """
+        Draws the dendrogram truncated to the last p merges; every leaf is labelled with its number of points
+        Args:
+          * p -> number of leaves shown
+          * ax -> matplotlib axes to draw on
+          * kwargs -> passed to scipy's dendrogram
+        """
+        assert self.linkage_matrix is not None, "First run fit"
+        sizes = self.node_sizes()
+        return dendrogram(self.linkage_matrix, truncate_mode='lastp', p=p, ax=ax,
+                          leaf_label_func=lambda node: '(%d)' % sizes[node], **kwargs)
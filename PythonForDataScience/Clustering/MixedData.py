@@ -0,0 +1,126 @@
+"""
+Compact Mixed-Data Matrix
+-------------------------
+
+    Mixed data is often loaded as one object array (np.genfromtxt(..., dtype=object)), where every cell is a Python
+    object: 8 bytes for the pointer plus the object itself, and every comparison in a distance computation is a
+    Python-level comparison.
+
+    MixedMatrix keeps the same data as two compact blocks:
+        - numeric     : float32 array of the numeric columns
+        - categorical : uint8 / uint16 / uint32 codes of the categorical columns (the smallest type that fits),
+                        with the category dictionary of every column stored next to it
+    Clustering (see FastKPrototypes) runs on the two blocks directly, and the dictionary is only used to decode
+    results, e.g. cluster prototypes, back to the original categories.
+    Missing categorical values get a category of their own (NaN) at the end of the dictionary.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def code_dtype(n_levels):
+    """
+    Smallest unsigned integer type that can hold n_levels codes
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_levels <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.uint64
+
+
+def encode_column(values):
+    """
+    Integer codes and category dictionary of one categorical column (hash based, categories in sorted order)
+    """
+    codes, categories = pd.factorize(pd.Series(values), sort=True, use_na_sentinel=True)
+    if (codes < 0).any():
+        # missing values become the last category
+        codes = np.where(codes < 0, len(categories), codes)
+        categories = np.append(np.asarray(categories, dtype=object), np.nan)
+    categories = np.asarray(categories)
+    return codes.astype(code_dtype(len(categories))), categories
+
+
+class MixedMatrix:
+    """
+      Numeric float32 block plus integer-coded categorical block.
+      Args:
+        * numeric -> (n, n_num) float32 array
+        * categorical -> (n, n_cat) array of codes
+        * categories -> category dictionary (array of values) of every categorical column
+        * numeric_names, categorical_names -> column names of the two blocks
+      """
+
+    def __init__(self, numeric, categorical, categories, numeric_names=None, categorical_names=None):
+        self.numeric = numeric
+        self.categorical = categorical
+        self.categories = categories
+        self.numeric_names = list(numeric_names if numeric_names is not None else range(numeric.shape[1]))
+        self.categorical_names = list(categorical_names if categorical_names is not None
+                                      else range(categorical.shape[1]))
+
+    @property
+    def n_levels(self):
+        return np.array([len(c) for c in self.categories], dtype=int)
+
+    @property
+    def nbytes(self):
+        return self.numeric.nbytes + self.categorical.nbytes
+
+    def __len__(self):
+        return self.numeric.shape[0]
+
+    def decode(self, codes):
+        """
+        Object array with the categories of a (rows, n_cat) array of codes
+        """
+        codes = np.atleast_2d(codes)
+        return np.column_stack([self.categories[j][codes[:, j]] for j in range(codes.shape[1])])
+
+    def to_frame(self):
+        """
+        DataFrame with the numeric columns and the decoded categorical columns
+        """
+        frame = pd.DataFrame(self.numeric, columns=self.numeric_names)
+        for j, name in enumerate(self.categorical_names):
+            frame[name] = self.categories[j][self.categorical[:, j]]
+        return frame
+
+    @classmethod
+    def from_frame(cls, df, numeric_cols, categorical_cols):
+        """
+        Builds the two blocks from the given columns of a DataFrame
+        """
+        numeric = df[list(numeric_cols)].to_numpy(dtype=np.float32)
+        encoded = [encode_column(df[col]) for col in categorical_cols]
+        dtype = code_dtype(max([len(c) for _, c in encoded] or [1]))
+        categorical = np.empty((len(df), len(encoded)), dtype=dtype)
+        for j, (codes, _) in enumerate(encoded):
+            categorical[:, j] = codes
+        return cls(numeric, categorical, [c for _, c in encoded], numeric_cols, categorical_cols)
+
+    @classmethod
+    def from_array(cls, X, categorical):
+        """
+        Builds the two blocks from one (object) matrix and the indices of its categorical columns
+        """
+        frame = pd.DataFrame(np.asarray(X))
+        categorical = [categorical] if isinstance(categorical, int) else list(categorical)
+        numeric = [j for j in range(frame.shape[1]) if j not in categorical]
+        return cls.from_frame(frame, numeric, categorical)
+
+
+def load_mixed_csv(path, numeric_cols, categorical_cols, **read_csv_kwargs):
+    """
+    Reads the given columns of a CSV file straight into a MixedMatrix. The numeric columns are parsed as float32
+    and the categorical ones as pandas categories, so no object array of the whole file is ever built.
+    Args:
+      * path -> CSV file
+      * numeric_cols, categorical_cols -> column names (or positions when header=None)
+      * read_csv_kwargs -> extra arguments for pd.read_csv
+    """
+    dtype = dict((col, np.float32) for col in numeric_cols)
+    dtype.update((col, 'category') for col in categorical_cols)
+    df = pd.read_csv(path, usecols=list(numeric_cols) + list(categorical_cols), dtype=dtype, **read_csv_kwargs)
+    return MixedMatrix.from_frame(df, numeric_cols, categorical_cols)
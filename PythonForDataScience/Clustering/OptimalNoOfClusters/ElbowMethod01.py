@@ -37,6 +37,7 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
+from KSweep import KSweep
 
 # Read in data and inspect the first 5 records.
 data = pd.read_csv('Data/Wholesale customers data.csv')
@@ -69,6 +70,13 @@ for k in K:
     km = km.fit(data_transformed)
     Sum_of_squared_distances.append(km.inertia_)
 
+# The loop above fits every k one after the other and from scratch. For large datasets the KSweep engine runs the same sweep
+# across a process pool (or warm-starts k+1 from the k solution with warm_start=True) and scores inertia, silhouette (on a sample)
+# and Calinski-Harabasz in the same pass. The result is a tidy table with one row per k, plus an automatic elbow pick.
+sweep = KSweep(L=1, K=15, n_jobs=-1, random_state=0).fit(data_transformed)
+print(sweep.table)
+print("Elbow picked at k = %d" % sweep.bestK)
+
 # As k increases, the sum of squared distance tends to zero.
 # Imagine we set k to its maximum value n (where n is number of samples) each sample will form its own cluster meaning sum of squared distances equals zero.
 
@@ -0,0 +1,165 @@
+"""
+K Sweep Engine
+--------------
+
+    Fits k-means for every k in a range and scores each solution in the same pass, so that the elbow method,
+    silhouette analysis and the Calinski-Harabasz index can all be read from one table.
+
+    Two strategies are available to keep large sweeps (1M+ rows) in the range of minutes:
+        - parallel      : every k is fitted independently in a process pool (joblib).
+        - warm_start    : k+1 is seeded from the k solution plus one extra centre drawn with the k-means++ rule,
+                          so each fit starts close to convergence and only a single init is needed.
+
+    Silhouette is O(n^2) and is therefore estimated from a stratified sample of the rows, each scored exactly
+    against all the data (see Silhouette.py); the table carries its confidence bounds.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import calinski_harabasz_score
+
+from Silhouette import sampled_silhouette
+
+# above this number of rows the sweep switches to MiniBatchKMeans unless told otherwise
+MINI_BATCH_THRESHOLD = 100000
+
+
+def find_elbow(ks, inertias):
+    """
+    Picks the knee of an inertia curve (Kneedle): both axes are scaled to [0, 1] and the k
+    whose point lies furthest below the chord joining the first and the last point is returned.
+    Args:
+      * ks -> increasing sequence of cluster numbers
+      * inertias -> sum of squared distances for every k
+    """
+    ks = np.asarray(ks, dtype=float)
+    inertias = np.asarray(inertias, dtype=float)
+    if ks.size < 3:
+        return int(ks[0])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertias - inertias.min()) / (np.ptp(inertias) or 1.0)
+    # the chord goes from (0, y[0]) to (1, y[-1]); distance below it marks the bend
+    chord = y[0] + (y[-1] - y[0]) * x
+    return int(ks[np.argmax(chord - y)])
+
+
+def _make_model(k, init, mini_batch, random_state):
+    n_init = 1 if isinstance(init, np.ndarray) else 3
+    if mini_batch:
+        return MiniBatchKMeans(n_clusters=k, init=init, n_init=n_init, batch_size=4096,
+                               random_state=random_state)
+    return KMeans(n_clusters=k, init=init, n_init=n_init, random_state=random_state)
+
+
+def _score(data, km, silhouette_sample, random_state):
+    labels = km.labels_
+    n_labels = np.unique(labels).size
+    silhouette = lower = upper = calinski = np.nan
+    if 1 < n_labels < data.shape[0]:
+        silhouette, _, lower, upper, _ = sampled_silhouette(data, labels, sample_size=silhouette_sample,
+                                                            random_state=random_state)
+        calinski = calinski_harabasz_score(data, labels)
+    return {'k': km.n_clusters, 'inertia': km.inertia_, 'silhouette': silhouette,
+            'silhouette_lower': lower, 'silhouette_upper': upper,
+            'calinski_harabasz': calinski, 'n_iter': km.n_iter_}
+
+
+def _fit_k(data, k, init, mini_batch, silhouette_sample, random_state):
+    start = time.perf_counter()
+    km = _make_model(k, init, mini_batch, random_state).fit(data)
+    row = _score(data, km, silhouette_sample, random_state)
+    row['fit_time'] = time.perf_counter() - start
+    return row, km.cluster_centers_
+
+
+def _next_centre(data, centers, rng, sample_size=100000):
+    """
+    Draws one extra centre with the k-means++ rule (probability proportional to the squared
+    distance to the closest existing centre), working on a row sample to bound the cost.
+    """
+    if data.shape[0] > sample_size:
+        data = data[rng.choice(data.shape[0], sample_size, replace=False)]
+    closest = np.full(data.shape[0], np.inf)
+    for c in centers:
+        np.minimum(closest, ((data - c) ** 2).sum(axis=1), out=closest)
+    total = closest.sum()
+    if total == 0:
+        return data[rng.randint(data.shape[0])]
+    return data[rng.choice(data.shape[0], p=closest / total)]
+
+
+class KSweep:
+    """
+      Runs k-means for k in range(L, K) and collects inertia, silhouette (on a sample) and
+      Calinski-Harabasz index for each k.
+      Args:
+        * L -> smallest number of clusters to try
+        * K -> biggest number of clusters to try (exclusive, like range)
+        * n_jobs -> processes used when the sweep is parallel (-1 uses all cores)
+        * warm_start -> seed k+1 from the k solution instead of fitting each k from scratch
+                        (the sweep then runs sequentially, as every k depends on the previous one)
+        * silhouette_sample -> number of rows used to estimate the silhouette (stratified by cluster)
+        * mini_batch -> use MiniBatchKMeans; None picks it automatically for large data
+        * table -> DataFrame with one row per k (k, inertia, silhouette with its confidence bounds,
+                   calinski_harabasz, n_iter, fit_time)
+        * centers -> cluster centres for every k
+        * bestK -> elbow (knee) of the inertia curve
+      """
+
+    def __init__(self, L=1, K=15, n_jobs=-1, warm_start=False, silhouette_sample=2000,
+                 mini_batch=None, random_state=None):
+        assert 1 <= L < K, "L has to be at least 1 and smaller than K"
+        self.L_ = L
+        self.K_ = K
+        self.n_jobs_ = n_jobs
+        self.warm_start_ = warm_start
+        self.silhouette_sample_ = silhouette_sample
+        self.mini_batch_ = mini_batch
+        self.random_state_ = random_state
+        self.table = None
+        self.centers = None
+        self.bestK = None
+
+    def fit(self, data, verbose=False):
+        """
+        Fits k-means for every k and fills table, centers and bestK
+        Args:
+          * data -> (examples,attributes) format
+          * verbose -> should print or not
+        """
+        data = np.ascontiguousarray(data, dtype=float)
+        mini_batch = self.mini_batch_
+        if mini_batch is None:
+            mini_batch = data.shape[0] > MINI_BATCH_THRESHOLD
+        ks = range(self.L_, self.K_)
+
+        if self.warm_start_:
+            results = self._fit_warm(data, ks, mini_batch, verbose)
+        else:
+            results = Parallel(n_jobs=self.n_jobs_, verbose=10 if verbose else 0)(
+                delayed(_fit_k)(data, k, 'k-means++', mini_batch, self.silhouette_sample_, self.random_state_)
+                for k in ks)
+
+        self.table = pd.DataFrame([row for row, _ in results])
+        self.centers = {row['k']: centers for row, centers in results}
+        self.bestK = find_elbow(self.table['k'], self.table['inertia'])
+        return self
+
+    def _fit_warm(self, data, ks, mini_batch, verbose):
+        rng = np.random.RandomState(self.random_state_)
+        results = []
+        centers = None
+        for k in ks:
+            if centers is None:
+                init = 'k-means++' if k > 1 else data.mean(axis=0, keepdims=True)
+            else:
+                init = np.vstack([centers, _next_centre(data, centers, rng)])
+            row, centers = _fit_k(data, k, init, mini_batch, self.silhouette_sample_, self.random_state_)
+            if verbose:
+                print("At k = %d, inertia = %.4f (%.2fs)" % (k, row['inertia'], row['fit_time']))
+            results.append((row, centers))
+        return results
@@ -17,6 +17,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import seaborn as sns
+from sklearn.preprocessing import StandardScaler
+from sklearn.cluster import KMeans
+from KSweep import KSweep
+from Silhouette import silhouette_score_chunked
 
 beers = pd.read_csv("Data/beers.csv")
 
@@ -27,4 +31,32 @@ Attribute Description
     sodium
     alcohol - percentage present
     cost - in dollars
-'''
\ No newline at end of file
+'''
+# Keep the numeric attributes only and scale them, so that every feature contributes equally to the distances.
+features = beers.select_dtypes(include=[np.number]).drop(columns=['Unnamed: 0', 'id', 'brewery_id'], errors='ignore').dropna()
+scaled_features = StandardScaler().fit_transform(features)
+
+# Elbow Method and Silhouette Score Analysis
+# KSweep fits k-means for every k and scores inertia, silhouette and Calinski-Harabasz in the same pass.
+# The exact silhouette is O(n^2), so it is estimated from a stratified sample that is scored against all the rows
+# (chunked, the full distance matrix is never built). The table carries the confidence bounds of the estimate.
+sweep = KSweep(L=1, K=11, silhouette_sample=1000, random_state=0).fit(scaled_features)
+print(sweep.table)
+
+fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+ax1.plot(sweep.table['k'], sweep.table['inertia'], 'bx-')
+ax1.axvline(sweep.bestK, color='grey', linestyle='--')
+ax1.set_xlabel('k')
+ax1.set_ylabel('Sum_of_squared_distances')
+ax1.set_title('Elbow Method For Optimal k')
+ax2.errorbar(sweep.table['k'], sweep.table['silhouette'],
+             yerr=[sweep.table['silhouette'] - sweep.table['silhouette_lower'],
+                   sweep.table['silhouette_upper'] - sweep.table['silhouette']], fmt='o-')
+ax2.set_xlabel('k')
+ax2.set_ylabel('Silhouette score')
+ax2.set_title('Silhouette Score Analysis')
+plt.show()
+
+# For a single clustering the exact silhouette can still be computed on large data, block by block.
+labels = KMeans(n_clusters=sweep.bestK, random_state=0).fit_predict(scaled_features)
+print("Exact silhouette for k = %d: %.4f" % (sweep.bestK, silhouette_score_chunked(scaled_features, labels)))
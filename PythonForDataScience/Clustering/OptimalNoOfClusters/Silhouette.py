@@ -0,0 +1,120 @@
+"""
+Chunked and Sampled Silhouette
+------------------------------
+
+    The exact silhouette needs the distance of every point to every other point, which is O(n^2) in time and,
+    when done naively, in memory as well. Beyond a few tens of thousands of rows this is not practical.
+
+    This module provides
+        - silhouette_samples_chunked : exact silhouette values computed block by block, so only a (chunk x n)
+                                       slice of the distance matrix is ever held in memory. It can also score only
+                                       a subset of the rows (against all the data).
+        - sampled_silhouette         : stratified-sample estimator of the mean silhouette. Rows are sampled per
+                                       cluster, scored exactly against the full data, and combined into an
+                                       estimate with a standard error and confidence bounds.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import stats
+from sklearn.metrics import pairwise_distances
+
+SilhouetteEstimate = namedtuple('SilhouetteEstimate', ['score', 'stderr', 'lower', 'upper', 'n_samples'])
+
+# memory budget for one block of the distance matrix
+WORKING_MEMORY_MB = 256
+
+
+def silhouette_samples_chunked(data, labels, rows=None, metric='euclidean', working_memory=WORKING_MEMORY_MB):
+    """
+    Exact silhouette coefficient of each row, computed in blocks of the distance matrix.
+    Args:
+      * data -> (examples,attributes) format
+      * labels -> cluster label of every example
+      * rows -> indices of the examples to score (all of them when None); they are always compared with every example
+      * metric -> any metric accepted by sklearn's pairwise_distances
+      * working_memory -> size in MB of the largest distance block kept in memory
+    """
+    data = np.asarray(data)
+    uniq, codes = np.unique(labels, return_inverse=True)
+    assert 1 < uniq.size < data.shape[0], "number of labels has to be between 2 and n_samples - 1"
+    counts = np.bincount(codes)
+
+    # order the examples by cluster so the per-cluster distance sums are contiguous column slices
+    order = np.argsort(codes, kind='stable')
+    data_sorted = data[order]
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    rows = np.arange(data.shape[0]) if rows is None else np.asarray(rows)
+    chunk = max(1, int(working_memory * 2 ** 20 // (8 * data.shape[0])))
+    scores = np.empty(rows.size)
+    for start in range(0, rows.size, chunk):
+        block = rows[start:start + chunk]
+        dist = pairwise_distances(data[block], data_sorted, metric=metric)
+        # (chunk x n_clusters) sums of distances to the members of each cluster
+        sums = np.add.reduceat(dist, offsets, axis=1)
+        own = codes[block]
+        idx = np.arange(block.size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = sums[idx, own] / (counts[own] - 1)
+            mean_dist = sums / counts
+            mean_dist[idx, own] = np.inf
+            b = mean_dist.min(axis=1)
+            s = (b - a) / np.maximum(a, b)
+        # singleton clusters have a silhouette of 0 by convention
+        s[counts[own] == 1] = 0
+        scores[start:start + block.size] = np.nan_to_num(s)
+    return scores
+
+
+def silhouette_score_chunked(data, labels, metric='euclidean', working_memory=WORKING_MEMORY_MB):
+    """
+    Exact mean silhouette coefficient without materializing the full distance matrix.
+    """
+    return silhouette_samples_chunked(data, labels, metric=metric, working_memory=working_memory).mean()
+
+
+def sampled_silhouette(data, labels, sample_size=2000, confidence=0.95, metric='euclidean',
+                       working_memory=WORKING_MEMORY_MB, random_state=None):
+    """
+    Estimates the mean silhouette from a stratified sample. The sample is split over the clusters in proportion
+    to their sizes (at least 2 rows per cluster where possible), each sampled row is scored exactly against all
+    the data, and the stratum means are weighted by the cluster sizes.
+    When sample_size covers all the data the exact score is returned with a zero standard error.
+    Args:
+      * data -> (examples,attributes) format
+      * labels -> cluster label of every example
+      * sample_size -> total number of rows to score
+      * confidence -> level of the confidence bounds (normal approximation)
+      * random_state -> seed or np.random.RandomState used to draw the sample
+    Returns:
+      * SilhouetteEstimate(score, stderr, lower, upper, n_samples)
+    """
+    data = np.asarray(data)
+    labels = np.asarray(labels)
+    n = data.shape[0]
+    if sample_size >= n:
+        score = silhouette_score_chunked(data, labels, metric=metric, working_memory=working_memory)
+        return SilhouetteEstimate(score, 0.0, score, score, n)
+
+    rng = random_state if isinstance(random_state, np.random.RandomState) else np.random.RandomState(random_state)
+    uniq, codes = np.unique(labels, return_inverse=True)
+    counts = np.bincount(codes)
+    weights = counts / float(n)
+    alloc = np.minimum(counts, np.maximum(2, np.round(weights * sample_size).astype(int)))
+
+    members = np.split(np.argsort(codes, kind='stable'), np.cumsum(counts)[:-1])
+    rows = np.concatenate([rng.choice(m, size, replace=False) for m, size in zip(members, alloc)])
+    strata = np.repeat(np.arange(uniq.size), alloc)
+
+    s = silhouette_samples_chunked(data, labels, rows=rows, metric=metric, working_memory=working_memory)
+    means = np.bincount(strata, weights=s) / alloc
+    sq_dev = np.bincount(strata, weights=(s - means[strata]) ** 2)
+    variances = np.where(alloc > 1, sq_dev / np.maximum(alloc - 1, 1), 0.0)
+
+    score = np.dot(weights, means)
+    # stratified variance with finite population correction
+    stderr = np.sqrt(np.sum(weights ** 2 * (1 - alloc / counts) * variances / alloc))
+    z = stats.norm.ppf(0.5 + confidence / 2.0)
+    return SilhouetteEstimate(score, stderr, score - z * stderr, score + z * stderr, int(alloc.sum()))
@@ -0,0 +1,149 @@
+"""
+Out-of-core K-Means for Mixed Data
+----------------------------------
+
+    KMeans01.py one-hot encodes and standardizes the whole frame in memory before clustering. For multi-GB files
+    this does not fit in memory, so the same pipeline is run over chunks of the CSV in three streaming passes:
+        1. statistics : one-hot categories and the mean/std of every feature (numeric columns and dummies)
+                        are learned in a single pass (means and variances are merged per chunk with Chan's formula),
+                        with the min/max of every numeric column (e.g. the ranges of ClusterProfiler).
+        2. clustering : MiniBatchKMeans.partial_fit is called on every standardized chunk.
+        3. labelling  : every chunk is standardized, assigned to its closest cluster and written out.
+    Memory stays flat: only one chunk plus the learned statistics are held at any time.
+
+    The standardization matches scipy.stats.zscore (ddof=0) applied on the output of pd.get_dummies.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+
+class StreamingMixedKMeans:
+    """
+      Mini-batch k-means over chunks of a CSV file with numeric and categorical columns.
+      Args:
+        * numeric_cols -> columns used as they are (after standardization)
+        * categorical_cols -> columns one-hot encoded (and then standardized)
+        * n_clusters -> number of clusters
+        * chunksize -> number of rows read at once
+        * n_epochs -> number of passes over the file while clustering
+        * read_csv_kwargs -> extra arguments for pd.read_csv (sep, encoding...)
+        * categories -> learned categories of every categorical column
+        * mean, std -> learned statistics of every feature, in the order of feature_names
+        * min, max -> learned range of every numeric column, in the order of numeric_cols
+        * feature_names -> names of the features, following pd.get_dummies naming (column_value)
+      """
+
+    def __init__(self, numeric_cols, categorical_cols, n_clusters=2, chunksize=100000, n_epochs=1,
+                 batch_size=4096, random_state=None, **read_csv_kwargs):
+        self.numeric_cols_ = list(numeric_cols)
+        self.categorical_cols_ = list(categorical_cols)
+        self.chunksize_ = chunksize
+        self.n_epochs_ = n_epochs
+        self.read_csv_kwargs_ = read_csv_kwargs
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state)
+        self.categories = None
+        self.mean = None
+        self.std = None
+        self.min = None
+        self.max = None
+        self.feature_names = None
+
+    def _chunks(self, path):
+        usecols = self.numeric_cols_ + self.categorical_cols_
+        return pd.read_csv(path, chunksize=self.chunksize_, **dict(self.read_csv_kwargs_, usecols=usecols))
+
+    def fit_statistics(self, path):
+        """
+        First pass: learns the categories of every categorical column and the mean/std and min/max of every
+        numeric column
+        """
+        n = 0
+        mean = np.zeros(len(self.numeric_cols_))
+        m2 = np.zeros(len(self.numeric_cols_))
+        low = np.full(len(self.numeric_cols_), np.inf)
+        high = np.full(len(self.numeric_cols_), -np.inf)
+        counts = {col: {} for col in self.categorical_cols_}
+        for chunk in self._chunks(path):
+            values = chunk[self.numeric_cols_].to_numpy(dtype=float)
+            n_chunk = values.shape[0]
+            if n_chunk == 0:
+                continue
+            mean_chunk = values.mean(axis=0)
+            m2_chunk = ((values - mean_chunk) ** 2).sum(axis=0)
+            # Chan et al. parallel update of mean and sum of squared deviations
+            delta = mean_chunk - mean
+            total = n + n_chunk
+            mean = mean + delta * n_chunk / total
+            m2 = m2 + m2_chunk + delta ** 2 * n * n_chunk / total
+            n = total
+            low = np.minimum(low, values.min(axis=0))
+            high = np.maximum(high, values.max(axis=0))
+            for col in self.categorical_cols_:
+                for value, count in chunk[col].value_counts().items():
+                    counts[col][value] = counts[col].get(value, 0) + count
+
+        assert n > 0, "No rows found in %s" % path
+        self.categories = {col: sorted(counts[col]) for col in self.categorical_cols_}
+        # a dummy column with share p has mean p and (ddof=0) variance p * (1 - p)
+        shares = [np.array([counts[col][c] for c in self.categories[col]]) / float(n)
+                  for col in self.categorical_cols_]
+        self.mean = np.concatenate([mean] + shares)
+        variance = np.concatenate([m2 / n] + [p * (1 - p) for p in shares])
+        std = np.sqrt(variance)
+        self.std = np.where(std > 0, std, 1.0)
+        self.min, self.max = low, high
+        self.feature_names = self.numeric_cols_ + ['%s_%s' % (col, c) for col in self.categorical_cols_
+                                                   for c in self.categories[col]]
+        return self
+
+    def transform(self, chunk):
+        """
+        One-hot encodes and standardizes a chunk with the learned statistics.
+        Categories not seen in fit_statistics get all their dummies set to 0.
+        """
+        assert self.mean is not None, "First run fit_statistics"
+        features = np.zeros((len(chunk), self.mean.size))
+        n_num = len(self.numeric_cols_)
+        features[:, :n_num] = chunk[self.numeric_cols_].to_numpy(dtype=float)
+        offset = n_num
+        rows = np.arange(len(chunk))
+        for col in self.categorical_cols_:
+            codes = pd.Categorical(chunk[col], categories=self.categories[col]).codes
+            known = codes >= 0
+            features[rows[known], offset + codes[known]] = 1
+            offset += len(self.categories[col])
+        features -= self.mean
+        features /= self.std
+        return features
+
+    def fit(self, path):
+        """
+        Learns the statistics and then fits MiniBatchKMeans chunk by chunk
+        """
+        self.fit_statistics(path)
+        for _ in range(self.n_epochs_):
+            for chunk in self._chunks(path):
+                if len(chunk) >= self.kmeans.n_clusters or hasattr(self.kmeans, 'cluster_centers_'):
+                    self.kmeans.partial_fit(self.transform(chunk))
+        return self
+
+    def predict_chunks(self, path):
+        """
+        Generator over the chunks of the file (all columns) with the assigned cluster in a 'clusters' column
+        """
+        assert hasattr(self.kmeans, 'cluster_centers_'), "First run fit"
+        for chunk in pd.read_csv(path, chunksize=self.chunksize_, **self.read_csv_kwargs_):
+            chunk['clusters'] = self.kmeans.predict(self.transform(chunk))
+            yield chunk
+
+    def predict_to_csv(self, path, out_path, **to_csv_kwargs):
+        """
+        Assigns every row of path to a cluster and writes the rows, with their cluster, to out_path
+        """
+        header = True
+        for chunk in self.predict_chunks(path):
+            chunk.to_csv(out_path, mode='w' if header else 'a', header=header, index=False, **to_csv_kwargs)
+            header = False
+        return out_path
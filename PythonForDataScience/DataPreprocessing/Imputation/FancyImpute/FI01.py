@@ -19,10 +19,17 @@ BiScaler        : Iterative estimation of row/column means and standard deviatio
                     Not guaranteed to converge but works well in practice. Taken from Matrix Completion and Low-Rank SVD via Fast Alternating Least Squares.
 
 """
+import numpy as np
 from fancyimpute import KNN, NuclearNormMinimization, SoftImpute, IterativeImputer, BiScaler
 
-# X is the complete data matrix
+# X is the complete data matrix: a rank 5 matrix plus some noise
+n, m, rank = 200, 20, 5
+X = np.random.randn(n, rank).dot(np.random.randn(rank, m)) + 0.1 * np.random.randn(n, m)
+
 # X_incomplete has the same values as X except a subset have been replace with NaN
+missing_mask = np.random.rand(n, m) < 0.2
+X_incomplete = X.copy()
+X_incomplete[missing_mask] = np.nan
 
 # Model each feature with missing values as a function of other features, and
 # use that estimate for imputation.
@@ -51,4 +58,6 @@ softImpute_mse = ((X_filled_softimpute[missing_mask] - X[missing_mask]) ** 2).me
 print("SoftImpute MSE: %f" % softImpute_mse)
 
 knn_mse = ((X_filled_knn[missing_mask] - X[missing_mask]) ** 2).mean()
-print("knnImpute MSE: %f" % knn_mse)
\ No newline at end of file
+print("knnImpute MSE: %f" % knn_mse)
+
+# Imp02.py benchmarks these methods next to the Imputer methods on larger datasets, with runtime and peak memory
@@ -24,12 +24,9 @@ from __future__ import (
 from collections import defaultdict
 
 import numpy as np
-from fancyimpute.knn import KNN
-from fancyimpute.iterative_svd import IterativeSVD
-from fancyimpute.simple_fill import SimpleFill
-from fancyimpute.soft_impute import SoftImpute
-from fancyimpute.mice import MICE
-from fancyimpute.biscaler import BiScaler
+
+# fancyimpute (and its tensorflow/keras dependencies) is only imported by the
+# factories of the registry below, when an imputer that needs it is built
 
 
 def check_dense_pMHC_array(X, peptide_list, allele_list):
@@ -77,77 +74,205 @@ def prune_dense_matrix_and_labels(
         Drop allele columns with fewer than this number of observed values.
     """
     observed_mask = np.isfinite(X)
-    n_observed_per_peptide = observed_mask.sum(axis = 1)
-    too_few_peptide_observations = (
-            n_observed_per_peptide < min_observations_per_peptide)
-    if too_few_peptide_observations.any():
-        drop_peptide_indices = np.where(too_few_peptide_observations)[0]
-        keep_peptide_indices = np.where(~too_few_peptide_observations)[0]
+    # rows first, then columns on the kept rows, and X is indexed only once
+    keep_peptides = (
+            observed_mask.sum(axis = 1) >= min_observations_per_peptide)
+    n_observed_per_allele = observed_mask[keep_peptides].sum(axis = 0)
+    too_few_allele_observations = (
+            n_observed_per_allele < min_observations_per_allele)
+    keep_alleles = ~too_few_allele_observations
+
+    if not keep_peptides.all():
         print("Dropping %d peptides with <%d observations" % (
-            len(drop_peptide_indices),
+            (~keep_peptides).sum(),
             min_observations_per_peptide))
-        X = X[keep_peptide_indices]
-        observed_mask = observed_mask[keep_peptide_indices]
-        peptide_list = [peptide_list[i] for i in keep_peptide_indices]
-
-    n_observed_per_allele = observed_mask.sum(axis = 0)
-    too_few_allele_observations = (
-            n_observed_per_allele < min_observations_per_peptide)
-    if too_few_peptide_observations.any():
+        peptide_list = np.asarray(
+            peptide_list, dtype=object)[keep_peptides].tolist()
+    if too_few_allele_observations.any():
         drop_allele_indices = np.where(too_few_allele_observations)[0]
-        keep_allele_indices = np.where(~too_few_allele_observations)[0]
         print("Dropping %d alleles with <%d observations: %s" % (
             len(drop_allele_indices),
             min_observations_per_allele,
             [allele_list[i] for i in drop_allele_indices]))
-        X = X[:, keep_allele_indices]
-        observed_mask = observed_mask[:, keep_allele_indices]
-        allele_list = [allele_list[i] for i in keep_allele_indices]
+        allele_list = np.asarray(
+            allele_list, dtype=object)[keep_alleles].tolist()
+    if not (keep_peptides.all() and keep_alleles.all()):
+        X = X[np.ix_(keep_peptides, keep_alleles)]
     check_dense_pMHC_array(X, peptide_list, allele_list)
     return X, peptide_list, allele_list
 
 
+def _finite_entries(X):
+    """
+    Column, row and value of every finite entry of X, sorted by column
+    (allele) and then by row (peptide).
+    """
+    allele_indices, peptide_indices = np.nonzero(np.isfinite(X).T)
+    return allele_indices, peptide_indices, X[peptide_indices, allele_indices]
+
+
 def dense_pMHC_matrix_to_nested_dict(X, peptide_list, allele_list):
     """
     Converts a dense matrix of (n_peptides, n_alleles) floats to a nested
     dictionary from allele -> peptide -> affinity.
+
+    The finite entries are found with one np.nonzero call and every allele
+    dictionary is built in bulk from its slice of them.
     """
+    allele_indices, peptide_indices, affinities = _finite_entries(X)
+    peptides = np.asarray(peptide_list, dtype=object)[peptide_indices]
+    # entries are grouped by allele, split them at the allele boundaries
+    counts = np.bincount(allele_indices, minlength=len(allele_list))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
     allele_to_peptide_to_ic50_dict = defaultdict(dict)
-    for row_index, peptide in enumerate(peptide_list):
-        for column_index, allele_name in enumerate(allele_list):
-            affinity = X[row_index, column_index]
-            if np.isfinite(affinity):
-                allele_to_peptide_to_ic50_dict[allele_name][peptide] = affinity
+    for column_index in np.nonzero(counts)[0]:
+        start, end = bounds[column_index], bounds[column_index + 1]
+        allele_to_peptide_to_ic50_dict[allele_list[column_index]] = dict(
+            zip(peptides[start:end], affinities[start:end]))
     return allele_to_peptide_to_ic50_dict
 
 
-def imputer_from_name(imputation_method_name, **kwargs):
+def dense_pMHC_matrix_to_coo(X):
+    """
+    Sparse (n_peptides, n_alleles) COO matrix with the finite entries of a
+    dense pMHC matrix. Finite zero affinities are kept as explicit entries,
+    so the stored entries are exactly the observed ones.
+    """
+    from scipy.sparse import coo_matrix
+    allele_indices, peptide_indices, affinities = _finite_entries(X)
+    return coo_matrix(
+        (affinities, (peptide_indices, allele_indices)), shape=X.shape)
+
+
+# name -> factory building the imputer from keyword arguments
+_IMPUTER_REGISTRY = {}
+
+# (name, keyword arguments) -> imputer already built by imputer_from_name
+_IMPUTER_CACHE = {}
+
+
+def register_imputer(name, factory=None, aliases=()):
+    """
+    Registers a factory under a name (and aliases) for imputer_from_name.
+    Can be used as a decorator. The factory receives the keyword arguments
+    given to imputer_from_name and should import heavy dependencies itself,
+    so that they are only loaded when the imputer is first built.
+    """
+    def register(factory):
+        for key in (name,) + tuple(aliases):
+            _IMPUTER_REGISTRY[key.strip().lower()] = factory
+            _IMPUTER_CACHE.clear()
+        return factory
+    if factory is None:
+        return register
+    return register(factory)
+
+
+def registered_imputers():
+    return sorted(_IMPUTER_REGISTRY)
+
+
+class ColumnFill(object):
+    """
+    In-house replacement of fancyimpute's SimpleFill: fills the missing
+    (NaN) entries of every column with a statistic of its observed entries.
+
+    Parameters
+    ----------
+    fill_method : str
+        "mean", "median", "min" or "zero"
+    """
+    statistics = {
+        "mean": np.nanmean,
+        "median": np.nanmedian,
+        "min": np.nanmin,
+    }
+
+    def __init__(self, fill_method="mean"):
+        if fill_method != "zero" and fill_method not in self.statistics:
+            raise ValueError("Invalid fill method: %s" % fill_method)
+        self.fill_method = fill_method
+
+    def fit_transform(self, X):
+        X = np.array(X, dtype=float)
+        missing_mask = np.isnan(X)
+        if self.fill_method == "zero":
+            X[missing_mask] = 0
+            return X
+        observed = ~missing_mask.all(axis=0)
+        fill = np.zeros(X.shape[1])
+        fill[observed] = self.statistics[self.fill_method](
+            X[:, observed], axis=0)
+        rows, cols = np.nonzero(missing_mask)
+        X[rows, cols] = fill[cols]
+        return X
+
+    # fancyimpute < 0.4 name of fit_transform
+    complete = fit_transform
+
+
+for _fill_method in ("mean", "median", "min", "zero"):
+    register_imputer(
+        _fill_method,
+        lambda fill_method=_fill_method, **kwargs: ColumnFill(
+            fill_method, **kwargs))
+
+
+@register_imputer("mice")
+def _mice(n_burn_in=5, n_imputations=25, n_nearest_columns=25, **kwargs):
+    from fancyimpute.mice import MICE
+    return MICE(n_burn_in=n_burn_in, n_imputations=n_imputations,
+                n_nearest_columns=n_nearest_columns, **kwargs)
+
+
+@register_imputer("knn")
+def _knn(k=3, orientation="columns", print_interval=10, **kwargs):
+    from fancyimpute.knn import KNN
+    return KNN(k=k, orientation=orientation, print_interval=print_interval,
+               **kwargs)
+
+
+@register_imputer("svd")
+def _iterative_svd(rank=10, **kwargs):
+    from fancyimpute.iterative_svd import IterativeSVD
+    return IterativeSVD(rank=rank, **kwargs)
+
+
+@register_imputer("softimpute", aliases=("svt",))
+def _soft_impute(init_fill_method="min", normalizer=None, **kwargs):
+    from fancyimpute.soft_impute import SoftImpute
+    if normalizer is None:
+        from fancyimpute.biscaler import BiScaler
+        normalizer = BiScaler()
+    return SoftImpute(init_fill_method=init_fill_method,
+                      normalizer=normalizer, **kwargs)
+
+
+def imputer_from_name(imputation_method_name, cache=True, **kwargs):
     """
     Helper function for constructing an imputation object from a name given
     typically from a commandline argument.
+
+    Imputers are built by the factories of the registry (see
+    register_imputer), which import their backend on first use. With cache,
+    the imputer built for a name and hashable keyword arguments is returned
+    again by later calls with the same ones, so callers share the instance.
     """
     imputation_method_name = imputation_method_name.strip().lower()
-    if imputation_method_name == "mice":
-        kwargs["n_burn_in"] = kwargs.get("n_burn_in", 5)
-        kwargs["n_imputations"] = kwargs.get("n_imputations", 25)
-        kwargs["n_nearest_columns"] = kwargs.get("n_nearest_columns", 25)
-        return MICE(**kwargs)
-    elif imputation_method_name == "knn":
-        kwargs["k"] = kwargs.get("k", 3)
-        kwargs["orientation"] = kwargs.get("orientation", "columns")
-        kwargs["print_interval"] = kwargs.get("print_interval", 10)
-        return KNN(**kwargs)
-    elif imputation_method_name == "svd":
-        kwargs["rank"] = kwargs.get("rank", 10)
-        return IterativeSVD(**kwargs)
-    elif imputation_method_name in ("svt", "softimpute"):
-        kwargs["init_fill_method"] = kwargs.get("init_fill_method", "min")
-        kwargs["normalizer"] = kwargs.get("normalizer", BiScaler())
-        return SoftImpute(**kwargs)
-    elif imputation_method_name == "mean":
-        return SimpleFill("mean", **kwargs)
-    elif imputation_method_name == "none":
+    if imputation_method_name == "none":
         return None
-    else:
+    if imputation_method_name not in _IMPUTER_REGISTRY:
         raise ValueError(
-            "Invalid imputation method: %s" % imputation_method_name)
\ No newline at end of file
+            "Invalid imputation method: %s" % imputation_method_name)
+    factory = _IMPUTER_REGISTRY[imputation_method_name]
+    if not cache:
+        return factory(**kwargs)
+    try:
+        key = (imputation_method_name, frozenset(kwargs.items()))
+        hash(key)
+    except TypeError:
+        # unhashable arguments (e.g. arrays), build a new imputer
+        return factory(**kwargs)
+    if key not in _IMPUTER_CACHE:
+        _IMPUTER_CACHE[key] = factory(**kwargs)
+    return _IMPUTER_CACHE[key]
@@ -2,8 +2,14 @@
 https://stackoverflow.com/questions/45239256/data-imputation-with-fancyimpute-and-pandas
 I see the frustration with fancy impute and pandas. Here is a fairly basic wrapper using the recursive override method.
 Takes in and outputs a dataframe - column names intact. These sort of wrappers work well with pipelines.
+
+SoftImputeFrame.py has a DataFrame-native version: float32 numeric block, no copy of the other columns, and warm start
+from the previous fit when new rows arrive.
 """
+import numpy as np
+import pandas as pd
 from fancyimpute import SoftImpute
+from SoftImputeFrame import SoftImputeFrame
 
 class SoftImputeDf(SoftImpute):
     """DataFrame Wrapper around SoftImpute"""
@@ -26,9 +32,25 @@ class SoftImputeDf(SoftImpute):
 
         assert isinstance(X, pd.DataFrame), "Must be pandas dframe"
 
-        for col in X.columns:
-            if X[col].isnull().sum() < 10:
-                X[col].fillna(0.0, inplace=True)
+        # fill the columns with few missing values on a copy, the caller's frame is left as is
+        few_missing = X.columns[X.isnull().sum() < 10]
+        X = X.fillna(dict.fromkeys(few_missing, 0.0))
 
         z = super(SoftImputeDf, self).fit_transform(X.values)
         return pd.DataFrame(z, index=X.index, columns=X.columns)
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    values = rng.randn(10000, 3).dot(rng.randn(3, 20)).astype(np.float32)
+    values[rng.rand(*values.shape) < 0.2] = np.nan
+    df = pd.DataFrame(values, columns=['f%d' % i for i in range(20)])
+    df['id'] = ['row%d' % i for i in range(len(df))]
+
+    # yesterday's rows, then a refit on all rows warm-started from yesterday's components
+    imputer = SoftImputeFrame(warm_start=True)
+    imputer.fit_transform(df.iloc[:8000])
+    print('cold start: %d iterations' % imputer.n_iter_)
+    df_filled = imputer.fit_transform(df)
+    print('warm start: %d iterations' % imputer.n_iter_)
+    print(df_filled.head())
@@ -1,10 +1,27 @@
 """
-
+Multiple imputation instead of a single completed matrix: every one of the 25 MICE chains completes X_train in its own
+process, the model is cross-validated in the same process, and the 25 scores are pooled with Rubin's rules
+(see MultipleImputation.py).
 """
-import fancyimpute
+import numpy as np
+from sklearn.datasets import make_classification
+from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import cross_val_score
+from MultipleImputation import MultipleImputer
+
+
+def cv_score(X_completed, model, y, cv=10):
+    scores = cross_val_score(model, X_completed, y, cv=cv)
+    # estimate and its squared standard error
+    return scores.mean(), scores.var(ddof=1) / len(scores)
+
+
+if __name__ == '__main__':
+    X_train, y_train = make_classification(n_samples=2000, n_features=20, n_informative=8, random_state=0)
+    X_train[np.random.RandomState(0).rand(*X_train.shape) < 0.2] = np.nan
+    logreg = LogisticRegression(max_iter=1000)
 
-mice = fancyimpute.MICE(verbose=0)
-X_train_fancy_mice = mice.complete(X_train)
-scores = cross_val_score(logreg, X_train_fancy_mice, y_train, cv=10)
-scores.mean()
\ No newline at end of file
+    mice = MultipleImputer(n_imputations=25, random_state=0)
+    pooled = mice.analyze(X_train, cv_score, logreg, y_train)
+    print('Pooled CV accuracy: %.4f +/- %.4f (between imputations variance %.2e, fraction of missing information %.2f)'
+          % (pooled.estimate, pooled.stderr, pooled.between, pooled.fmi))
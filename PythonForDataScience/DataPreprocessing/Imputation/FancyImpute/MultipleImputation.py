@@ -0,0 +1,106 @@
+"""
+Multiple Imputation
+-------------------
+
+    A single completed matrix (FI04.py: fancyimpute.MICE().complete(X_train)) hides the uncertainty of the imputed
+    values. Multiple imputation (MICE-style) draws m completed datasets from chains with different seeds, analyses
+    every one of them, and pools the m estimates with Rubin's rules:
+        - estimate : mean of the m estimates
+        - within   : mean of the m variances
+        - between  : variance of the m estimates
+        - total    : within + (1 + 1/m) * between
+
+    MultipleImputer runs the chains in parallel processes (joblib) with one seed per chain, and streams the results:
+    with an analysis function, every completed dataset is analysed (e.g. a model is fitted) in the worker that
+    produced it and only the (estimate, variance) pair comes back, so the m completed copies are never in memory
+    together. Without one, the completed datasets are yielded one at a time, in the order of their seeds.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+from sklearn.impute import IterativeImputer
+
+PooledEstimate = namedtuple('PooledEstimate', ['estimate', 'within', 'between', 'total', 'stderr', 'df', 'fmi'])
+
+
+def mice_chain(seed, max_iter=10, n_nearest_features=25):
+    """
+    One MICE chain: chained equations that draw the imputed values from the posterior of every column model
+    """
+    return IterativeImputer(sample_posterior=True, max_iter=max_iter, n_nearest_features=n_nearest_features,
+                            random_state=seed)
+
+
+def _run_chain(make_imputer, X, seed, analysis, analysis_args):
+    completed = make_imputer(seed).fit_transform(X)
+    if analysis is None:
+        return completed
+    return analysis(completed, *analysis_args)
+
+
+def pool_estimates(estimates, variances):
+    """
+    Pools the estimates of the m completed datasets (and their variances) with Rubin's rules
+    Args:
+      * estimates -> (m,) or (m, p) estimates
+      * variances -> squared standard errors of the estimates, same shape
+    """
+    estimates = np.asarray(estimates, dtype=float)
+    variances = np.asarray(variances, dtype=float)
+    m = estimates.shape[0]
+    estimate = estimates.mean(axis=0)
+    within = variances.mean(axis=0)
+    between = estimates.var(axis=0, ddof=1) if m > 1 else np.zeros_like(estimate)
+    total = within + (1 + 1.0 / m) * between
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # relative increase in variance due to missingness, degrees of freedom and fraction of missing information
+        r = (1 + 1.0 / m) * between / within
+        df = (m - 1) * (1 + 1 / r) ** 2
+        fmi = (r + 2 / (df + 3)) / (r + 1)
+    return PooledEstimate(estimate, within, between, total, np.sqrt(total), df, fmi)
+
+
+class MultipleImputer:
+    """
+      Runs m imputation chains with different seeds in parallel processes.
+      Args:
+        * make_imputer -> function seed -> object with fit_transform (default: mice_chain)
+        * n_imputations -> number of chains m
+        * n_jobs -> processes running the chains (-1 uses all cores)
+        * random_state -> seed of the chain seeds
+        * seeds_ -> seed of every chain of the last run
+      """
+
+    def __init__(self, make_imputer=mice_chain, n_imputations=25, n_jobs=-1, random_state=None, verbose=0):
+        self.make_imputer = make_imputer
+        self.n_imputations = n_imputations
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.verbose = verbose
+        self.seeds_ = None
+
+    def _run(self, X, analysis=None, analysis_args=()):
+        rng = np.random.RandomState(self.random_state)
+        self.seeds_ = rng.randint(np.iinfo(np.int32).max, size=self.n_imputations)
+        # results come back in the order of the seeds (result i is the chain of seeds_[i]), each one as soon as it and
+        # the ones before it are done; only a few chains are dispatched ahead of the consumer
+        return Parallel(n_jobs=self.n_jobs, return_as='generator', verbose=self.verbose)(
+            delayed(_run_chain)(self.make_imputer, X, seed, analysis, analysis_args) for seed in self.seeds_)
+
+    def iter_imputations(self, X):
+        """
+        Yields the m completed datasets one at a time
+        """
+        return self._run(X)
+
+    def analyze(self, X, analysis, *analysis_args):
+        """
+        Analyses every completed dataset in the worker that produced it and pools the results
+        Args:
+          * analysis -> function (completed X, *analysis_args) -> (estimate, variance)
+        """
+        estimates, variances = zip(*self._run(X, analysis, analysis_args))
+        return pool_estimates(estimates, variances)
@@ -0,0 +1,143 @@
+"""
+SoftImpute for DataFrames
+-------------------------
+
+    SoftImpute (Mazumder, Hastie and Tibshirani, 2010) completes a matrix by iterative soft thresholding of its SVD:
+    the missing entries are replaced by the low rank approximation, the singular values of the filled matrix are
+    shrunk by a constant, and so on until the approximation stops changing.
+
+    SoftImputeFrame runs it directly on the numeric columns of a DataFrame:
+        - the numeric columns are taken as one float32 block; other columns are passed through untouched, so a
+          mixed frame is never upcast to object or float64 (X.values in FI03.py)
+        - the caller's frame is not modified, the result keeps its index and columns
+        - with warm_start, a refit (e.g. nightly, when new rows arrived) starts from the components of the previous
+          fit instead of from zeros: the missing entries are first set to their projection on the previous
+          components, with the same shrinkage, and the iterations only have to absorb the new rows
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.utils.extmath import randomized_svd
+
+
+class SoftImputeFrame(object):
+    """
+      Low rank imputation of the numeric columns of a DataFrame.
+      Args:
+        * shrinkage_value -> value subtracted from the singular values; 1/50 of the largest singular value of the
+                             initially filled matrix by default (as fancyimpute)
+        * convergence_threshold -> stop when the relative change of the imputed values is below it
+        * max_iters -> maximum number of iterations
+        * max_rank -> rank of a randomized truncated SVD; exact thin SVD when None
+        * init_fill_method -> 'zero' or 'mean', first value of the missing entries of a cold start
+        * min_value, max_value -> bounds of the imputed values
+        * warm_start -> start the next fit from the components of the previous one
+        * components_, singular_values_ -> low rank model of the last fit (rank x n_numeric, rank)
+        * shrinkage_value_, n_iter_ -> shrinkage and number of iterations of the last fit
+      Imputed columns are returned as float32.
+      """
+
+    def __init__(self, shrinkage_value=None, convergence_threshold=0.001, max_iters=100, max_rank=None,
+                 n_power_iterations=1, init_fill_method='zero', min_value=None, max_value=None, warm_start=False,
+                 random_state=None, verbose=False):
+        self.shrinkage_value = shrinkage_value
+        self.convergence_threshold = convergence_threshold
+        self.max_iters = max_iters
+        self.max_rank = max_rank
+        self.n_power_iterations = n_power_iterations
+        self.init_fill_method = init_fill_method
+        self.min_value = min_value
+        self.max_value = max_value
+        self.warm_start = warm_start
+        self.random_state = random_state
+        self.verbose = verbose
+        self.columns_ = None
+        self.components_ = None
+        self.singular_values_ = None
+        self.shrinkage_value_ = None
+        self.n_iter_ = None
+
+    def _svd(self, X):
+        if self.max_rank:
+            return randomized_svd(X, self.max_rank, n_iter=self.n_power_iterations, random_state=self.random_state)
+        return np.linalg.svd(X, full_matrices=False)
+
+    def _initial_fill(self, X, missing_mask, warm):
+        col_mean = (np.where(missing_mask, 0, X).sum(axis=0) /
+                    np.maximum((~missing_mask).sum(axis=0), 1)).astype(np.float32)
+        if warm:
+            # projection of the mean filled rows on the previous components, with their singular values shrunk as in
+            # the previous solution: a fixed point of the previous fit stays in place
+            X[missing_mask] = np.broadcast_to(col_mean, X.shape)[missing_mask]
+            shrink = self.singular_values_ / (self.singular_values_ + self.shrinkage_value_)
+            projected = (X.dot(self.components_.T) * shrink).dot(self.components_)
+            X[missing_mask] = projected[missing_mask]
+        elif self.init_fill_method == 'mean':
+            X[missing_mask] = np.broadcast_to(col_mean, X.shape)[missing_mask]
+        elif self.init_fill_method == 'zero':
+            X[missing_mask] = 0
+        else:
+            raise ValueError("Invalid init_fill_method: %s" % self.init_fill_method)
+
+    def _clip(self, X):
+        if self.min_value is not None or self.max_value is not None:
+            np.clip(X, self.min_value, self.max_value, out=X)
+        return X
+
+    def fit_transform(self, df):
+        """
+        Returns a copy of df with the missing values of its numeric columns imputed (df itself, copied, when it has
+        no missing value)
+        """
+        assert isinstance(df, pd.DataFrame), "Must be pandas dframe"
+        columns = df.select_dtypes(include='number').columns
+        # the only copy: the float32 block that is imputed and returned
+        X = df[columns].to_numpy(dtype=np.float32, copy=True)
+        missing_mask = np.isnan(X)
+        if not missing_mask.any():
+            # nothing to impute: no column is replaced, and the model of the previous fit is kept
+            self.n_iter_ = 0
+            return df.copy(deep=False)
+        warm = (self.warm_start and self.components_ is not None and list(columns) == list(self.columns_))
+        self._initial_fill(X, missing_mask, warm)
+
+        if warm:
+            shrinkage_value = self.shrinkage_value_
+        elif self.shrinkage_value is not None:
+            shrinkage_value = self.shrinkage_value
+        else:
+            shrinkage_value = self._svd(X)[1][0] / 50.0
+
+        U = s = Vt = None
+        n_iter = 0
+        previous = None
+        for n_iter in range(1, self.max_iters + 1):
+            U, s, Vt = self._svd(X)
+            s = np.maximum(s - shrinkage_value, 0)
+            rank = max(int((s > 0).sum()), 1)
+            U, s, Vt = U[:, :rank], s[:rank], Vt[:rank]
+            approx = self._clip((U * s).dot(Vt).astype(np.float32))
+            converged = False
+            if previous is not None:
+                # the change is only measured on the missing entries that the approximation replaces
+                old_norm = np.sqrt(np.sum(previous.astype(float) ** 2))
+                change = np.sqrt(np.sum((previous - approx[missing_mask]).astype(float) ** 2))
+                converged = old_norm > 0 and change / old_norm < self.convergence_threshold
+            previous = approx[missing_mask]
+            X[missing_mask] = previous
+            if self.verbose:
+                print("[SoftImpute] Iter %d: rank=%d" % (n_iter, rank))
+            if converged:
+                break
+
+        self.columns_ = list(columns)
+        self.components_ = Vt.astype(np.float32)
+        self.singular_values_ = s
+        self.shrinkage_value_ = shrinkage_value
+        self.n_iter_ = n_iter
+
+        # only the columns with missing values are replaced (by float32 columns)
+        imputed = missing_mask.any(axis=0)
+        result = df.copy(deep=False)
+        result[columns[imputed]] = pd.DataFrame(X[:, imputed], index=df.index, columns=columns[imputed])
+        return result
@@ -9,6 +9,7 @@ import numpy as np
 import pandas as pd
 import matplotlib
 import missingno as msno
+from Samples.chunked_imputation import ChunkedImputer
 # %matplotlib inline
 train_df = pd.read_csv('train_2016_v2.csv', parse_dates=["transactiondate"])
 properties_df = pd.read_csv('properties_2016.csv')
@@ -16,6 +17,14 @@ merged_df = pd.merge(train_df,properties_df)
 missingdata_df = merged_df.columns[merged_df.isnull().any()].tolist()
 msno.matrix(merged_df[missingdata_df])
 
+# properties_2016.csv is about 3 GB: impute it out of core, the statistics are fitted in streaming passes over
+# chunks and the imputed chunks are appended to the output file one at a time
+zillow_categorical = ['hashottuborspa', 'propertycountylandusecode', 'propertyzoningdesc', 'fireplaceflag',
+                      'taxdelinquencyflag']
+imputer = ChunkedImputer(strategy='mean', categorical=zillow_categorical, chunksize=200000)
+imputer.fit_transform('properties_2016.csv', 'properties_2016_imputed.csv')
+print(imputer.statistics_)
+
 x = np.genfromtxt('E:/DataScience/PythonForDataScience/PythonForDataScience/Data/adult-train-raw.csv', delimiter = ', ', dtype = object)
 df = pd.DataFrame(x)
 df.info()
\ No newline at end of file
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Imputation Benchmark
+--------------------
+
+    Compares the imputation methods of this package on datasets with controlled missingness:
+        - Samples/missing_data_imputation.Imputer : summarize (mean, median), replace (random observed value of
+                                                    the column), factor_analysis (iterated from the column means)
+        - Samples/fitted_imputation : KNNImputer and PredictiveImputer (regression tree), the fit/transform versions
+                                      of Imputer.knn and Imputer.predict, which one-hot encode or factorize every
+                                      column with missing data and so only suit categorical data; the trees
+                                      are fitted in this process (n_jobs=1) so that their memory is measured
+        - sklearn's SimpleImputer (MeanMedianMode/MMM01.py) : mean, median
+        - fancyimpute (FancyImpute/FI01.py) : KNN, SoftImpute on BiScaler normalized data, IterativeImputer,
+                                              NuclearNormMinimization (skipped above 20000 cells, too slow);
+                                              skipped when fancyimpute is not installed
+
+    Datasets are low rank matrices plus noise, with values removed
+        - MCAR : every cell independently with the same probability
+        - MAR  : with a probability that depends on the (always observed) first column of the row
+    For every dataset and method the report holds the runtime, the peak memory allocated during the imputation
+    (tracemalloc, numpy allocations included) and the reconstruction error on the removed cells (RMSE, and NRMSE,
+    the RMSE divided by the std of the removed values). best_methods picks the fastest method that meets an NRMSE
+    target.
+
+    Usage:
+        python Imp02.py --n 1000 10000 --m 10 50 --missing 0.1 0.3 --mechanism MCAR MAR --target 0.6
+"""
+
+import argparse
+import itertools
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.tree import DecisionTreeRegressor
+
+from Samples.missing_data_imputation import Imputer
+from Samples.fitted_imputation import KNNImputer, PredictiveImputer
+
+try:
+    import fancyimpute
+except ImportError:
+    fancyimpute = None
+
+
+def make_dataset(n, m, missing=0.2, mechanism='MCAR', rank=5, noise=0.1, seed=0):
+    """
+    Low rank (n, m) matrix plus gaussian noise, and the mask of the cells to remove
+    Args:
+      * missing -> average share of removed cells
+      * mechanism -> 'MCAR' or 'MAR' (the first column is then always observed and drives the missingness)
+    """
+    rng = np.random.RandomState(seed)
+    X = rng.randn(n, rank).dot(rng.randn(rank, m)) + noise * rng.randn(n, m)
+    if mechanism == 'MCAR':
+        prob = np.full((n, m), missing)
+    elif mechanism == 'MAR':
+        # rows with a high first column lose more values, on average missing of the other cells
+        driver = (X[:, 0] - X[:, 0].mean()) / X[:, 0].std()
+        weight = 1 / (1 + np.exp(-2 * driver))
+        prob = np.repeat(np.clip(missing * weight / weight.mean(), 0, 1)[:, None], m, axis=1)
+        prob[:, 0] = 0
+    else:
+        raise ValueError("mechanism has to be 'MCAR' or 'MAR'")
+    missing_mask = rng.rand(n, m) < prob
+    # keep at least one observed value per column
+    missing_mask[rng.randint(n, size=m), np.arange(m)] = False
+    return X, missing_mask
+
+
+def _fancy(name):
+    def run(X):
+        if name == 'softimpute':
+            # imputed on the normalized scale, then brought back to the scale of X
+            biscaler = fancyimpute.BiScaler(verbose=False)
+            return biscaler.inverse_transform(
+                fancyimpute.SoftImpute(verbose=False).fit_transform(biscaler.fit_transform(X)))
+        model = {'knn': lambda: fancyimpute.KNN(k=3, verbose=False),
+                 'iterative': lambda: fancyimpute.IterativeImputer(),
+                 'nuclear_norm': lambda: fancyimpute.NuclearNormMinimization(verbose=False)}[name]()
+        return model.fit_transform(X)
+    return run
+
+
+METHODS = {
+    'imputer_mean': lambda X: Imputer().summarize(X, np.mean, np.isnan),
+    'imputer_median': lambda X: Imputer().summarize(X, np.median, np.isnan),
+    'imputer_replace': lambda X: Imputer().replace(X, np.isnan),
+    'imputer_knn': lambda X: KNNImputer(np.isnan, k=5, summary_func=np.mean).fit_transform(X),
+    # mean first guess (the default mode is meant for categorical data) refined by up to 50 rounds of low rank
+    # approximation
+    'imputer_factor': lambda X: Imputer().factor_analysis(X, (), np.isnan, threshold=0.8, n_iter=50,
+                                                          summary_func=np.mean),
+    # tracemalloc only sees this process: worker processes would hide the memory of the trees
+    'imputer_predict': lambda X: PredictiveImputer(np.isnan, DecisionTreeRegressor(max_depth=8),
+                                                   n_jobs=1).fit_transform(X),
+    'simple_mean': lambda X: SimpleImputer(strategy='mean').fit_transform(X),
+    'simple_median': lambda X: SimpleImputer(strategy='median').fit_transform(X),
+    'fancy_knn': _fancy('knn'),
+    'fancy_softimpute': _fancy('softimpute'),
+    'fancy_iterative': _fancy('iterative'),
+    'fancy_nuclear_norm': _fancy('nuclear_norm'),
+}
+
+# NuclearNormMinimization solves a semidefinite program, too slow for larger matrices
+MAX_NUCLEAR_NORM_CELLS = 20000
+
+
+def run_one(method, X, missing_mask):
+    """
+    Imputes X with the missing_mask cells removed; returns runtime, peak memory and errors of the imputation
+    """
+    X_incomplete = X.copy()
+    X_incomplete[missing_mask] = np.nan
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        filled = np.asarray(METHODS[method](X_incomplete), dtype=float)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        # a failed run must not leave its peak to the next one
+        tracemalloc.stop()
+    truth = X[missing_mask]
+    rmse = np.sqrt(np.mean((filled[missing_mask] - truth) ** 2))
+    return dict(wall_time=wall, peak_mem_mb=peak / 2.0 ** 20, rmse=rmse, nrmse=rmse / truth.std(),
+                unfilled=int(np.isnan(filled).sum()))
+
+
+def available_methods(methods=None):
+    """
+    Requested methods (all by default) that can run here
+    """
+    methods = list(methods or METHODS)
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        raise ValueError("Unknown methods: %s" % unknown)
+    if fancyimpute is None:
+        methods = [method for method in methods if not method.startswith('fancy_')]
+    return methods
+
+
+def run_benchmark(n, m, missing, mechanisms, methods=None, seed=0, verbose=True):
+    """
+    Runs every method on every dataset and returns a DataFrame with one row per run. Methods that fail on a
+    dataset (e.g. knn without complete rows) are reported with their error instead of measurements.
+    """
+    results = []
+    for n_rows, n_cols, rate, mechanism in itertools.product(n, m, missing, mechanisms):
+        X, missing_mask = make_dataset(n_rows, n_cols, rate, mechanism, seed=seed)
+        for method in available_methods(methods):
+            if method == 'fancy_nuclear_norm' and n_rows * n_cols > MAX_NUCLEAR_NORM_CELLS:
+                continue
+            result = dict(n=n_rows, m=n_cols, missing=rate, mechanism=mechanism, method=method, error='')
+            try:
+                result.update(run_one(method, X, missing_mask))
+            except Exception as e:
+                result['error'] = '%s: %s' % (type(e).__name__, e)
+            if verbose:
+                if result['error']:
+                    print('{method:>18} n={n:<7} m={m:<4} {mechanism} {missing:.0%}: {error}'.format(**result))
+                else:
+                    print('{method:>18} n={n:<7} m={m:<4} {mechanism} {missing:.0%}: {wall_time:8.3f}s, '
+                          'peak {peak_mem_mb:8.1f} MB, RMSE {rmse:.4f}, NRMSE {nrmse:.3f}'.format(**result))
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def best_methods(report, target):
+    """
+    Fastest method meeting the NRMSE target on every dataset (NaN where none does)
+    """
+    keys = ['n', 'm', 'missing', 'mechanism']
+    ok = report[(report['error'] == '') & (report['nrmse'] <= target)]
+    best = ok.loc[ok.groupby(keys)['wall_time'].idxmin()]
+    return best.set_index(keys)[['method', 'wall_time', 'peak_mem_mb', 'nrmse']].reindex(
+        report.groupby(keys).size().index)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='imputation methods benchmark')
+    parser.add_argument('--n', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--m', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--missing', type=float, nargs='+', default=[0.1, 0.3])
+    parser.add_argument('--mechanism', nargs='+', default=['MCAR', 'MAR'])
+    parser.add_argument('--methods', nargs='+', help='subset of %s' % ', '.join(METHODS))
+    parser.add_argument('--target', type=float, default=0.6, help='NRMSE target of the best method')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='imputation_benchmark', help='prefix of the .json and .csv result files')
+    args = parser.parse_args()
+
+    if fancyimpute is None:
+        print('fancyimpute is not installed, its methods are skipped')
+    df = run_benchmark(args.n, args.m, args.missing, args.mechanism, args.methods, seed=args.seed)
+    df.to_csv(args.out + '.csv', index=False)
+    with open(args.out + '.json', 'w') as f:
+        json.dump(df.to_dict(orient='records'), f, indent=2)
+    print(df.pivot_table(index=['mechanism', 'missing', 'n', 'm'], columns='method', values='nrmse'))
+    print(best_methods(df, args.target))
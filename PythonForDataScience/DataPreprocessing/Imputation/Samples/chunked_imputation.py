@@ -0,0 +1,449 @@
+"""
+Out-of-core imputation
+----------------------
+
+    The Imputer methods (missing_data_imputation.py) copy the whole matrix,
+    often as an object array, and compute their statistics from the data
+    they impute. ChunkedImputer fits the same kind of statistics in streaming
+    passes over the chunks of a CSV or Parquet file:
+        - means, modes and category encoders from per-chunk sums and value
+          counts (first pass)
+        - medians from a per-column histogram between the fitted min and max
+          (second pass, approximate within one bin width)
+        - low rank components ('svd') from the Gram matrix X^T X of the
+          summarized data, accumulated chunk by chunk (second pass)
+        - the neighbour index ('knn') on a uniform sample of the complete
+          rows, kept with bottom-k sampling (first pass)
+    and then imputes chunk by chunk, writing every chunk to the output file,
+    so only one chunk and the fitted statistics are in memory at a time.
+"""
+import numpy as np
+import pandas as pd
+from scipy.linalg import eigh
+from scipy.stats import mode
+from sklearn.neighbors import NearestNeighbors
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    from missing_data_imputation import Imputer, factorize
+except ImportError:
+    from .missing_data_imputation import Imputer, factorize
+
+
+def _is_parquet(path):
+    return str(path).endswith(('.parquet', '.pq'))
+
+
+def iter_chunks(source, chunksize=100000, columns=None, **read_csv_kwargs):
+    """ Yields DataFrames of at most chunksize rows of a CSV or Parquet file
+
+    Parameters
+    ----------
+    source : str
+        Path of a CSV file, or of a Parquet file (.parquet, needs pyarrow)
+    columns : list
+        Columns to read, all by default
+    read_csv_kwargs : dict
+        Extra arguments of pd.read_csv
+    """
+    if _is_parquet(source):
+        if pq is None:
+            raise ImportError("Reading Parquet files requires pyarrow")
+        batches = pq.ParquetFile(source).iter_batches(batch_size=chunksize,
+                                                      columns=columns)
+        for batch in batches:
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source, chunksize=chunksize, usecols=columns,
+                                 **read_csv_kwargs):
+            yield chunk
+
+
+def _mode_of_counts(counts):
+    """ Most frequent value of a value -> count Series, ties going to the
+    smallest value like in mode """
+    labels, _ = factorize(counts.index.to_numpy())
+    return counts.reindex(labels).idxmax()
+
+
+class ChunkedImputer(object):
+    def __init__(self, strategy='mean', categorical=None,
+                 missing_data_cond=None, chunksize=100000, threshold=0.9,
+                 max_rank=None, k=5, n_reference=20000, n_bins=4096,
+                 n_jobs=None, random_state=None):
+        """
+        Parameters
+        ----------
+        strategy : str
+            'mean', 'median' or 'mode' of every column, 'svd' for the low
+            rank approximation of factor_analysis, 'knn' for the mean (mode
+            for categorical columns) of the k nearest complete rows.
+            Categorical columns always use the mode with 'mean' and 'median'
+        categorical : list
+            Categorical columns; by default the non numeric columns of the
+            first chunk. The other columns are parsed as numbers, and values
+            that cannot be parsed are treated as missing
+        missing_data_cond : function
+            Method that takes an array and returns True where it represents
+            missing data, on top of NaN/None
+        threshold : float
+            Share of the sum of singular values kept by 'svd'
+        max_rank : int
+            Upper bound of the rank of 'svd'
+        k : int
+            Number of nearest neighbors of 'knn'
+        n_reference : int
+            Number of complete rows sampled as neighbors of 'knn'
+        n_bins : int
+            Number of histogram bins of the median sketch
+
+        Attributes
+        ----------
+        numeric_, categorical_ : list
+            Numeric and categorical columns
+        n_rows_ : int
+            Number of rows seen by fit
+        count_, mean_, std_, min_, max_ : np.ndarray
+            Observed count and moments of the numeric columns
+        categories_ : dict
+            Categorical column -> sorted array of its categories
+        statistics_ : pd.Series
+            Column -> value imputed by 'mean', 'median' and 'mode', and first
+            guess of 'svd'
+        components_ : np.ndarray
+            (rank, n_columns) right singular vectors of 'svd'
+        reference_ : tuple
+            Numeric values and categorical codes of the rows sampled by 'knn'
+        """
+        self.strategy = strategy
+        self.categorical = categorical
+        self.missing_data_cond = missing_data_cond
+        self.chunksize = chunksize
+        self.threshold = threshold
+        self.max_rank = max_rank
+        self.k = k
+        self.n_reference = n_reference
+        self.n_bins = n_bins
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _split(self, df):
+        """ Numeric block (float), categorical block (object) and missing
+        masks of both blocks of a chunk """
+        numeric = np.array(df[self.numeric_].apply(pd.to_numeric,
+                                                   errors='coerce'),
+                           dtype=float)
+        categorical = np.array(df[self.categorical_], dtype=object)
+        num_mask = np.isnan(numeric)
+        cat_mask = pd.isna(categorical)
+        if self.missing_data_cond is not None:
+            raw = df[self.numeric_].to_numpy(dtype=object)
+            num_mask |= self.missing_data_cond(raw)
+            cat_mask |= self.missing_data_cond(categorical)
+        return numeric, categorical, num_mask, cat_mask
+
+    def _encode(self, categorical, cat_mask):
+        """ Integer codes of the categorical block, -1 for missing and
+        unseen values """
+        codes = np.empty(categorical.shape, dtype=int)
+        for j, col in enumerate(self.categorical_):
+            codes[:, j] = pd.Categorical(categorical[:, j],
+                                         categories=self.categories_[col]).codes
+        codes[cat_mask] = -1
+        return codes
+
+    def _summarized(self, numeric, codes, num_mask):
+        """ Float matrix of the numeric block and the categorical codes with
+        missing cells replaced by their first guess """
+        return np.hstack((
+            np.where(num_mask, np.nan_to_num(self._num_fill), numeric),
+            np.where(codes < 0, self._mode_codes, codes)))
+
+    def _first_pass(self, chunks):
+        rng = np.random.RandomState(self.random_state)
+        self.n_rows_ = 0
+        shift = None
+        value_counts = {}
+        reference, keys = None, np.empty(0)
+        for chunk in chunks:
+            if shift is None:
+                columns = list(chunk.columns)
+                categorical = self.categorical
+                if categorical is None:
+                    categorical = [col for col in columns
+                                   if not pd.api.types.is_numeric_dtype(
+                                       chunk[col])]
+                self.categorical_ = list(categorical)
+                self.numeric_ = [col for col in columns
+                                 if col not in self.categorical_]
+                self.columns_ = columns
+            numeric, categorical, num_mask, cat_mask = self._split(chunk)
+            if shift is None:
+                # sums are taken around the first chunk means
+                shift = (np.where(num_mask, 0, numeric).sum(axis=0) /
+                         np.maximum((~num_mask).sum(axis=0), 1))
+                n_num = len(self.numeric_)
+                count, total, total_sq = (np.zeros(n_num) for _ in range(3))
+                low = np.full(n_num, np.inf)
+                high = np.full(n_num, -np.inf)
+
+            self.n_rows_ += len(chunk)
+            shifted = np.where(num_mask, 0, numeric - shift)
+            count += (~num_mask).sum(axis=0)
+            total += shifted.sum(axis=0)
+            total_sq += (shifted ** 2).sum(axis=0)
+            low = np.minimum(low, np.where(num_mask, np.inf, numeric).min(
+                axis=0, initial=np.inf))
+            high = np.maximum(high, np.where(num_mask, -np.inf, numeric).max(
+                axis=0, initial=-np.inf))
+
+            # value counts of the categorical (and, for 'mode', numeric)
+            # columns, merged chunk after chunk
+            blocks = [(self.categorical_, categorical, cat_mask)]
+            if self.strategy == 'mode':
+                blocks.append((self.numeric_, numeric, num_mask))
+            for cols, values, mask in blocks:
+                for j, col in enumerate(cols):
+                    counts = pd.Series(values[~mask[:, j], j]).value_counts()
+                    if col in value_counts:
+                        counts = value_counts[col].add(counts, fill_value=0)
+                    value_counts[col] = counts
+
+            if self.strategy == 'knn':
+                # bottom-k sampling: the complete rows with the n_reference
+                # smallest random keys are a uniform sample of all of them
+                complete = ~(num_mask.any(axis=1) | cat_mask.any(axis=1))
+                rows = np.column_stack((numeric[complete],
+                                        categorical[complete]))
+                rows = rows if reference is None else np.vstack((reference,
+                                                                rows))
+                keys = np.concatenate((keys,
+                                       rng.random_sample(complete.sum())))
+                keep = np.argsort(keys)[:self.n_reference]
+                reference, keys = rows[keep], keys[keep]
+
+        if shift is None:
+            raise ValueError("The source has no rows")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            var = (total_sq - count * mean ** 2) / (count - 1)
+        self.count_ = count
+        self.mean_ = mean + shift
+        self.std_ = np.sqrt(np.maximum(var, 0))
+        self.min_, self.max_ = low, high
+        self.categories_ = {}
+        for col in self.categorical_:
+            counts = value_counts.get(col, pd.Series(dtype=float))
+            self.categories_[col] = factorize(counts.index.to_numpy())[0]
+        self._value_counts = value_counts
+        self._reference_rows = reference
+
+    def _median_pass(self, chunks):
+        n_num, n_bins = len(self.numeric_), self.n_bins
+        width = np.where(self.max_ > self.min_, self.max_ - self.min_, 1)
+        hist = np.zeros(n_num * n_bins)
+        for chunk in chunks:
+            numeric, _, num_mask, _ = self._split(chunk)
+            rows, cols = np.nonzero(~num_mask)
+            bins = ((numeric[rows, cols] - self.min_[cols]) /
+                    width[cols] * n_bins).astype(int)
+            bins = np.clip(bins, 0, n_bins - 1)
+            hist += np.bincount(cols * n_bins + bins, minlength=hist.size)
+        hist = hist.reshape(n_num, n_bins)
+
+        # linear interpolation inside the bin that holds the middle rank
+        cum = np.cumsum(hist, axis=1)
+        target = .5 * cum[:, -1]
+        b = np.minimum((cum < target[:, None]).sum(axis=1), n_bins - 1)
+        cols = np.arange(n_num)
+        below = np.where(b > 0, cum[cols, np.maximum(b - 1, 0)], 0)
+        in_bin = hist[cols, b]
+        frac = np.where(in_bin > 0, (target - below) /
+                        np.where(in_bin > 0, in_bin, 1), 0)
+        return self.min_ + (b + frac) * width / n_bins
+
+    def _svd_pass(self, chunks):
+        n_cols = len(self.numeric_) + len(self.categorical_)
+        gram = np.zeros((n_cols, n_cols))
+        for chunk in chunks:
+            numeric, categorical, num_mask, cat_mask = self._split(chunk)
+            data = self._summarized(numeric,
+                                    self._encode(categorical, cat_mask),
+                                    num_mask)
+            gram += data.T.dot(data)
+
+        # X = U S V^T  ->  X^T X = V S^2 V^T
+        eigval, eigvec = eigh(gram)
+        order = np.argsort(eigval)[::-1]
+        sval = np.sqrt(np.maximum(eigval[order], 0))
+        explained = np.cumsum(sval) / np.sum(sval)
+        n_singv = min(np.searchsorted(explained, self.threshold) + 1,
+                      len(sval), self.max_rank or len(sval))
+        self.singular_values_ = sval
+        self.components_ = eigvec[:, order[:n_singv]].T
+
+    def _knn_features(self, numeric, codes, num_mask):
+        """ Standardized numeric columns (missing -> mean) next to one-hot
+        categorical columns (missing -> all zeros) """
+        std = np.where(self.std_ > 0, self.std_, 1)
+        scaled = np.where(num_mask, 0, (numeric - self.mean_) / std)
+        blocks = [scaled]
+        for j, col in enumerate(self.categorical_):
+            n_levels = len(self.categories_[col])
+            block = np.zeros((len(codes), n_levels))
+            valid = codes[:, j] >= 0
+            block[np.where(valid)[0], codes[valid, j]] = 1
+            blocks.append(block)
+        return np.hstack(blocks)
+
+    def _knn_fit(self):
+        if self._reference_rows is None or len(self._reference_rows) == 0:
+            raise ValueError("knn needs complete rows to use as neighbors")
+        n_num = len(self.numeric_)
+        numeric = self._reference_rows[:, :n_num].astype(float)
+        categorical = self._reference_rows[:, n_num:]
+        codes = self._encode(categorical, np.zeros(categorical.shape, bool))
+        self.reference_ = (numeric, codes)
+        features = self._knn_features(numeric, codes,
+                                      np.zeros(numeric.shape, bool))
+        self.nbrs_ = NearestNeighbors(n_neighbors=min(self.k, len(features)),
+                                      n_jobs=self.n_jobs).fit(features)
+
+    def fit_chunks(self, chunks):
+        """ Fits the statistics of the strategy
+
+        Parameters
+        ----------
+        chunks : function
+            Called without arguments, returns an iterator over the chunks
+            (DataFrames); called once per pass over the data
+        """
+        self._first_pass(chunks())
+        self.statistics_ = pd.Series(index=self.columns_, dtype=object)
+        for col in self.categorical_:
+            counts = self._value_counts.get(col)
+            self.statistics_[col] = (np.nan if counts is None or counts.empty
+                                     else _mode_of_counts(counts))
+        if self.strategy == 'mode':
+            numeric = [_mode_of_counts(self._value_counts[col])
+                       if not self._value_counts[col].empty else np.nan
+                       for col in self.numeric_]
+        elif self.strategy == 'median':
+            numeric = self._median_pass(chunks())
+        elif self.strategy in ('mean', 'svd', 'knn'):
+            numeric = self.mean_
+        else:
+            raise ValueError("Strategy {} is not supported".format(
+                self.strategy))
+        self.statistics_[self.numeric_] = list(numeric)
+        del self._value_counts
+
+        self._num_fill = np.asarray(numeric, dtype=float)
+        self._mode_codes = np.array(
+            [np.searchsorted(self.categories_[col], self.statistics_[col])
+             if len(self.categories_[col]) else -1
+             for col in self.categorical_], dtype=int)
+        if self.strategy == 'svd':
+            self._svd_pass(chunks())
+        elif self.strategy == 'knn':
+            self._knn_fit()
+        del self._reference_rows
+        return self
+
+    def fit(self, source, columns=None, **read_csv_kwargs):
+        """ Fits the statistics of the strategy in streaming passes over a CSV
+        or Parquet file, see iter_chunks """
+        return self.fit_chunks(lambda: iter_chunks(source, self.chunksize,
+                                                   columns, **read_csv_kwargs))
+
+    def transform_chunk(self, df):
+        """ Returns a copy of the chunk with the missing values imputed """
+        numeric, categorical, num_mask, cat_mask = self._split(df)
+        n_num = len(self.numeric_)
+        codes = self._encode(categorical, cat_mask)
+        if self.strategy in ('mean', 'median', 'mode'):
+            # categorical columns take their mode
+            numeric = np.where(num_mask, self._num_fill, numeric)
+            codes = np.where(cat_mask, self._mode_codes, codes)
+        elif self.strategy == 'svd':
+            # evaluate the low rank approximation at the missing cells only
+            data = self._summarized(numeric, codes, num_mask)
+            rows, cols = np.nonzero(np.hstack((num_mask, cat_mask)))
+            imputed = np.einsum('ij,ij->i',
+                                data[rows].dot(self.components_.T),
+                                self.components_.T[cols])
+            num = cols < n_num
+            numeric[rows[num], cols[num]] = imputed[num]
+            # clip low rank approximation to be within factor labels
+            n_levels = np.array([len(self.categories_[col])
+                                 for col in self.categorical_], dtype=int)
+            cat_cols = cols[~num] - n_num
+            codes[rows[~num], cat_cols] = np.clip(
+                imputed[~num], 0, n_levels[cat_cols] - 1).round()
+        elif self.strategy == 'knn':
+            missing_rows = np.where(num_mask.any(axis=1) |
+                                    cat_mask.any(axis=1))[0]
+            if len(missing_rows):
+                features = self._knn_features(numeric, codes, num_mask)
+                neighbors = self.nbrs_.kneighbors(features[missing_rows],
+                                                  return_distance=False)
+                ref_numeric, ref_codes = self.reference_
+                for col in np.where(num_mask.any(axis=0))[0]:
+                    sel = num_mask[missing_rows, col]
+                    numeric[missing_rows[sel], col] = np.mean(
+                        ref_numeric[neighbors[sel], col], axis=1)
+                for col in np.where(cat_mask.any(axis=0))[0]:
+                    sel = cat_mask[missing_rows, col]
+                    codes[missing_rows[sel], col] = Imputer._summarize_rows(
+                        ref_codes[neighbors[sel], col], mode)
+
+        # decode the imputed categorical cells
+        for col in np.where(cat_mask.any(axis=0))[0]:
+            labels = self.categories_[self.categorical_[col]]
+            rows = np.where(cat_mask[:, col] & (codes[:, col] >= 0))[0]
+            categorical[rows, col] = labels[codes[rows, col]]
+
+        out = df[self.columns_].copy()
+        out[self.numeric_] = numeric
+        out[self.categorical_] = categorical
+        return out
+
+    def transform_to_file(self, chunks, out):
+        """ Imputes the chunks one at a time and appends them to out, a CSV
+        file or a Parquet file (.parquet, needs pyarrow) """
+        writer = None
+        try:
+            for i, chunk in enumerate(chunks):
+                imputed = self.transform_chunk(chunk)
+                if not _is_parquet(out):
+                    imputed.to_csv(out, mode='w' if i == 0 else 'a',
+                                   header=i == 0, index=False)
+                    continue
+                if pq is None:
+                    raise ImportError("Writing Parquet files requires pyarrow")
+                if writer is None:
+                    table = pa.Table.from_pandas(imputed, preserve_index=False)
+                    writer = pq.ParquetWriter(out, table.schema)
+                else:
+                    table = pa.Table.from_pandas(imputed, schema=writer.schema,
+                                                 preserve_index=False)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return out
+
+    def transform(self, source, out, columns=None, **read_csv_kwargs):
+        """ Imputes a CSV or Parquet file chunk by chunk into out """
+        return self.transform_to_file(
+            iter_chunks(source, self.chunksize, columns, **read_csv_kwargs),
+            out)
+
+    def fit_transform(self, source, out, columns=None, **read_csv_kwargs):
+        return self.fit(source, columns, **read_csv_kwargs).transform(
+            source, out, columns, **read_csv_kwargs)
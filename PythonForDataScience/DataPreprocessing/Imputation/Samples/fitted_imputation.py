@@ -0,0 +1,452 @@
+"""
+Fitted imputers
+---------------
+
+    The Imputer methods (missing_data_imputation.py) compute their statistics
+    from the data they impute, so every batch recomputes modes, encoders and
+    models. The imputers below split the same methods into fit, which learns
+    the statistics once, and transform, which only applies them:
+        - SummaryImputer -> Imputer.summarize
+        - KNNImputer     -> Imputer.knn
+        - PredictiveImputer -> Imputer.predict
+        - FactorImputer  -> Imputer.factor_analysis
+    The fitted state is kept in numeric arrays (codes instead of objects), so
+    it can be saved with joblib and memory-mapped back in: a serving process
+    loads it without copying the arrays, and transforming a small batch does
+    not refit anything.
+
+    The missing_data_cond functions (and summary_func, clf) are saved with the
+    imputer, so they must be picklable, e.g. module level functions instead
+    of lambdas.
+"""
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import joblib
+from joblib import Parallel, delayed
+from scipy.stats import mode
+from sklearn.base import clone
+from sklearn.neighbors import NearestNeighbors
+
+try:
+    from missing_data_imputation import Imputer, factorize
+except ImportError:
+    from .missing_data_imputation import Imputer, factorize
+
+
+def _encode(values, labels):
+    """ Index of every value in labels, -1 for values not in labels """
+    return pd.Index(labels).get_indexer(values)
+
+
+def _numeric(x, cols, missing_mask):
+    """ Float block of the given columns, missing cells set to 0 """
+    return np.where(missing_mask[:, cols], 0, x[:, cols]).astype(float)
+
+
+def _fit_column(clf, features, target):
+    return clf.fit(features, target)
+
+
+class FittedImputer(ABC):
+    """ fit/transform interface and persistence of the fitted state """
+
+    @abstractmethod
+    def fit(self, x):
+        """ Learns the statistics of x, returns self """
+
+    @abstractmethod
+    def transform(self, x, in_place=False):
+        """ Imputes the missing values of x with the fitted statistics """
+
+    def fit_transform(self, x):
+        return self.fit(x).transform(x)
+
+    def _check_fitted(self):
+        if not getattr(self, 'fitted_', False):
+            raise ValueError("{} is not fitted, first run fit".format(
+                type(self).__name__))
+
+    def _copy(self, x, in_place):
+        if in_place:
+            return x
+        return np.copy(x)
+
+    def save(self, path):
+        """ Saves the imputer with joblib, uncompressed so that load can
+        memory-map its arrays """
+        self._check_fitted()
+        joblib.dump(self, path)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """ Loads a saved imputer; with mmap_mode the fitted arrays are
+        memory-mapped from the file instead of being read in memory """
+        imputer = joblib.load(path, mmap_mode=mmap_mode)
+        if not isinstance(imputer, cls):
+            raise TypeError("{} does not hold a {}".format(path, cls.__name__))
+        return imputer
+
+
+class SummaryImputer(FittedImputer):
+    def __init__(self, missing_data_cond, summary_func=mode):
+        """ Replaces missing values with a statistical summary of each
+        feature vector, see Imputer.summarize
+
+        Parameters
+        ----------
+        missing_data_cond : function
+            Method that takes an array and returns True where it represents
+            missing data or false otherwise.
+        summary_func : function
+            Summarization function (mode, np.mean, np.median...)
+
+        Attributes
+        ----------
+        statistics_ : np.ndarray
+            Summary of every column, NaN for columns without observed values
+        """
+        self.missing_data_cond = missing_data_cond
+        self.summary_func = summary_func
+
+    def fit(self, x):
+        missing_mask = self.missing_data_cond(x)
+        cols = np.where((~missing_mask).any(axis=0))[0]
+        summaries = Imputer._summarize_columns(x, missing_mask,
+                                               self.summary_func, cols)
+        dtype = float if summaries.dtype.kind in 'biuf' else object
+        self.statistics_ = np.full(x.shape[1], np.nan, dtype=dtype)
+        self.statistics_[cols] = summaries
+        self.fitted_ = True
+        return self
+
+    def transform(self, x, in_place=False):
+        self._check_fitted()
+        data = self._copy(x, in_place)
+        miss_rows, miss_cols = np.nonzero(self.missing_data_cond(x))
+        data[miss_rows, miss_cols] = self.statistics_[miss_cols]
+        return data
+
+
+class KNNImputer(FittedImputer):
+    def __init__(self, missing_data_cond, cat_cols=(), k=5, summary_func=mode,
+                 n_reference=None, n_jobs=None, random_state=None):
+        """ Replaces missing values with the summary of the k nearest
+        complete observations seen by fit, see Imputer.knn
+
+        Observations are compared on the standardized numeric columns
+        (missing -> mean) and the one-hot categorical columns (missing or
+        unseen -> all zeros).
+
+        Parameters
+        ----------
+        cat_cols : int tuple
+            Index of columns that are categorical; they are always imputed
+            with the mode of the neighbors
+        summary_func : function
+            mode, or a function accepting an axis argument (np.mean...),
+            for the numeric columns
+        n_reference : int
+            Number of complete observations kept as neighbors, all of them
+            by default
+
+        Attributes
+        ----------
+        labels_ : dict
+            Categorical column -> labels of its codes; for object data, also
+            numeric column -> labels of its values, so that their mode is
+            imputed with the original value (e.g. digit strings) as in
+            Imputer.knn
+        reference_ : tuple
+            Numeric values, categorical codes and, for object data, codes of
+            the numeric values of the neighbors (None otherwise)
+        nbrs_ : NearestNeighbors
+            Index of the neighbors
+        """
+        self.missing_data_cond = missing_data_cond
+        self.cat_cols = cat_cols
+        self.k = k
+        self.summary_func = summary_func
+        self.n_reference = n_reference
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _features(self, numeric, codes, num_mask):
+        scaled = np.where(num_mask, 0, (numeric - self.mean_) / self.scale_)
+        blocks = [scaled]
+        for j, col in enumerate(self.cat_cols_):
+            block = np.zeros((len(codes), len(self.labels_[col])))
+            valid = np.where(codes[:, j] >= 0)[0]
+            block[valid, codes[valid, j]] = 1
+            blocks.append(block)
+        return np.hstack(blocks)
+
+    def _codes(self, x, missing_mask):
+        codes = np.empty((x.shape[0], len(self.cat_cols_)), dtype=int)
+        for j, col in enumerate(self.cat_cols_):
+            codes[:, j] = _encode(x[:, col], self.labels_[col])
+        codes[missing_mask[:, self.cat_cols_]] = -1
+        return codes
+
+    def fit(self, x):
+        missing_mask = self.missing_data_cond(x)
+        complete = np.where(~missing_mask.any(axis=1))[0]
+        if len(complete) == 0:
+            raise ValueError("knn needs complete observations as neighbors")
+        if self.n_reference is not None and len(complete) > self.n_reference:
+            rng = np.random.RandomState(self.random_state)
+            complete = np.sort(rng.choice(complete, self.n_reference,
+                                          replace=False))
+        reference = x[complete]
+        no_missing = np.zeros(reference.shape, dtype=bool)
+
+        self.cat_cols_ = list(self.cat_cols)
+        self.num_cols_ = [col for col in range(x.shape[1])
+                          if col not in self.cat_cols_]
+        self.labels_ = dict((col, factorize(reference[:, col])[0])
+                            for col in self.cat_cols_)
+        numeric = _numeric(reference, self.num_cols_, no_missing)
+        self.mean_ = numeric.mean(axis=0)
+        std = numeric.std(axis=0)
+        self.scale_ = np.where(std > 0, std, 1)
+        codes = self._codes(reference, no_missing)
+        num_codes = None
+        if x.dtype == object:
+            num_codes = np.empty(numeric.shape, dtype=int)
+            for j, col in enumerate(self.num_cols_):
+                self.labels_[col], num_codes[:, j] = factorize(
+                    reference[:, col])
+        self.reference_ = (numeric, codes, num_codes)
+        self.nbrs_ = NearestNeighbors(
+            n_neighbors=min(self.k, len(complete)), n_jobs=self.n_jobs).fit(
+            self._features(numeric, codes, no_missing[:, self.num_cols_]))
+        self.fitted_ = True
+        return self
+
+    def transform(self, x, in_place=False):
+        self._check_fitted()
+        data = self._copy(x, in_place)
+        missing_mask = self.missing_data_cond(x)
+        missing_rows = np.where(missing_mask.any(axis=1))[0]
+        if len(missing_rows) == 0:
+            return data
+        rows = x[missing_rows]
+        mask = missing_mask[missing_rows]
+        num_mask = mask[:, self.num_cols_]
+        features = self._features(_numeric(rows, self.num_cols_, mask),
+                                  self._codes(rows, mask), num_mask)
+        neighbors = self.nbrs_.kneighbors(features, return_distance=False)
+
+        ref_numeric, ref_codes, ref_num_codes = self.reference_
+        by_code = ref_num_codes is not None and self.summary_func in (None,
+                                                                      mode)
+        for j, col in enumerate(self.num_cols_):
+            sel = num_mask[:, j]
+            if not sel.any():
+                continue
+            if by_code:
+                # mode of the original values, not of their float conversion
+                codes = Imputer._summarize_rows(
+                    ref_num_codes[neighbors[sel], j], mode)
+                data[missing_rows[sel], col] = self.labels_[col][codes]
+            else:
+                data[missing_rows[sel], col] = Imputer._summarize_rows(
+                    ref_numeric[neighbors[sel], j], self.summary_func)
+        for j, col in enumerate(self.cat_cols_):
+            sel = mask[:, col]
+            if sel.any():
+                codes = Imputer._summarize_rows(ref_codes[neighbors[sel], j],
+                                                mode)
+                data[missing_rows[sel], col] = self.labels_[col][codes]
+        return data
+
+
+class PredictiveImputer(FittedImputer):
+    def __init__(self, missing_data_cond, clf, cat_cols=(), inc_miss=True,
+                 n_jobs=None):
+        """ Predicts missing values with one model per column, trained by fit
+        on the observations where the column is valid, see Imputer.predict
+
+        Categorical columns are factorized with the labels seen by fit
+        (unseen values get code -1) and numeric columns are converted to
+        float, with missing values set to -1 like the missing data codes.
+        A model does not use its own column as a feature.
+
+        Parameters
+        ----------
+        clf : object
+            Object with fit and predict methods, e.g. sklearn's Decision Tree
+        cat_cols : int tuple
+            Index of columns that are categorical
+        inc_miss : bool
+            Include the columns with missing data in fit as features?
+        n_jobs : int
+            Number of models trained in parallel (-1 uses all cores)
+
+        Attributes
+        ----------
+        labels_ : dict
+            Categorical column -> labels of its codes
+        feature_cols_ : np.ndarray
+            Columns used as features
+        models_ : dict
+            Column -> fitted model
+        """
+        self.missing_data_cond = missing_data_cond
+        self.clf = clf
+        self.cat_cols = cat_cols
+        self.inc_miss = inc_miss
+        self.n_jobs = n_jobs
+
+    def _factorized(self, x, missing_mask):
+        data = np.full(x.shape, -1.)
+        num_cols = [col for col in range(x.shape[1]) if col not in self.labels_]
+        numeric = _numeric(x, num_cols, missing_mask)
+        numeric[missing_mask[:, num_cols]] = -1
+        data[:, num_cols] = numeric
+        for col, labels in self.labels_.items():
+            data[:, col] = _encode(x[:, col], labels)
+        return data
+
+    def fit(self, x):
+        missing_mask = self.missing_data_cond(x)
+        self.labels_ = dict((col, factorize(x[~missing_mask[:, col], col])[0])
+                            for col in self.cat_cols)
+        data = self._factorized(x, missing_mask)
+        if self.inc_miss:
+            self.feature_cols_ = np.arange(x.shape[1])
+        else:
+            self.feature_cols_ = np.where(~missing_mask.any(axis=0))[0]
+
+        # one model per column with observed values, trained in parallel
+        cols = np.where((~missing_mask).any(axis=0))[0]
+        models = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_column)(
+                clone(self.clf, safe=False),
+                data[~missing_mask[:, col]][:, self.feature_cols_[
+                    self.feature_cols_ != col]],
+                data[~missing_mask[:, col], col])
+            for col in cols)
+        self.models_ = dict(zip(cols, models))
+        self.fitted_ = True
+        return self
+
+    def transform(self, x, in_place=False):
+        self._check_fitted()
+        data = self._copy(x, in_place)
+        missing_mask = self.missing_data_cond(x)
+        factorized = self._factorized(x, missing_mask)
+        for col in np.where(missing_mask.any(axis=0))[0]:
+            if col not in self.models_:
+                continue
+            miss_obs = missing_mask[:, col]
+            features = factorized[miss_obs][:, self.feature_cols_[
+                self.feature_cols_ != col]]
+            y_hat = self.models_[col].predict(features)
+            if col in self.labels_:
+                data[miss_obs, col] = self.labels_[col][y_hat.astype(int)]
+            else:
+                data[miss_obs, col] = y_hat
+        return data
+
+
+class FactorImputer(FittedImputer):
+    def __init__(self, missing_data_cond, cat_cols=(), threshold=0.9,
+                 technique='SVD', max_rank=None, random_state=None):
+        """ Replaces missing values with their low rank approximation, with
+        the components fitted once, see Imputer.factor_analysis
+
+        A new observation is first summarized with the modes seen by fit and
+        then projected onto the components: x V^T V at its missing cells,
+        which for the fitted data equals the U S V^T approximation of
+        factor_analysis.
+
+        Parameters
+        ----------
+        cat_cols : int tuple
+            Index of columns that are categorical
+        threshold : float
+            Variance threshold that must be explained by eigen values.
+        technique : str
+            'SVD' or 'randomized', see Imputer.factor_analysis
+
+        Attributes
+        ----------
+        labels_ : dict
+            Categorical column -> labels of its codes
+        fill_ : np.ndarray
+            Mode of every column, as code for categorical columns
+        components_ : np.ndarray
+            (rank, n_columns) right singular vectors
+        """
+        self.missing_data_cond = missing_data_cond
+        self.cat_cols = cat_cols
+        self.threshold = threshold
+        self.technique = technique
+        self.max_rank = max_rank
+        self.random_state = random_state
+
+    def _summarized(self, x, missing_mask):
+        data = np.array(x, dtype=object)
+        for col, labels in self.labels_.items():
+            data[:, col] = _encode(x[:, col], labels)
+        data = np.where(missing_mask, 0, data).astype(float)
+        # missing and unseen values take the fitted modes
+        unknown = missing_mask.copy()
+        for col in self.labels_:
+            unknown[:, col] |= data[:, col] < 0
+        return np.where(unknown, self.fill_, data)
+
+    def fit(self, x):
+        missing_mask = self.missing_data_cond(x)
+        imp = Imputer()
+        summarized = imp.summarize(x, mode, self.missing_data_cond)
+        self.labels_ = {}
+        for col in self.cat_cols:
+            self.labels_[col] = factorize(summarized[:, col])[0]
+        modes = SummaryImputer(self.missing_data_cond, mode).fit(x)
+        self.fill_ = np.zeros(x.shape[1])
+        for col in range(x.shape[1]):
+            if col in self.labels_:
+                self.fill_[col] = _encode([modes.statistics_[col]],
+                                          self.labels_[col])[0]
+            elif not pd.isna(modes.statistics_[col]):
+                self.fill_[col] = float(modes.statistics_[col])
+
+        data = self._summarized(x, missing_mask)
+        _, sval, rsvec = imp._low_rank(data, self.technique, self.max_rank,
+                                       self.random_state)
+        # find number of singular values that explain 90% of variance
+        explained = np.cumsum(sval) / np.sum(sval)
+        n_singv = min(np.searchsorted(explained, self.threshold) + 1,
+                      len(sval))
+        self.singular_values_ = sval
+        self.components_ = np.ascontiguousarray(rsvec[:n_singv])
+        self.fitted_ = True
+        return self
+
+    def transform(self, x, in_place=False):
+        self._check_fitted()
+        data = self._copy(x, in_place)
+        missing_mask = self.missing_data_cond(x)
+        miss_rows, miss_cols = np.nonzero(missing_mask)
+        if len(miss_rows) == 0:
+            return data
+        summarized = self._summarized(x, missing_mask)
+        # evaluate the low rank approximation at the missing cells only
+        imputed = np.einsum('ij,ij->i',
+                            summarized[miss_rows].dot(self.components_.T),
+                            self.components_.T[miss_cols])
+
+        for col in np.unique(miss_cols):
+            sel = miss_cols == col
+            obs_ids = miss_rows[sel]
+            if col not in self.labels_:
+                data[obs_ids, col] = imputed[sel]
+                continue
+            # clip low rank approximation to be within factor labels
+            labels = self.labels_[col]
+            proj_cats = np.clip(imputed[sel], 0, len(labels) - 1)
+            data[obs_ids, col] = labels[proj_cats.round().astype(int)]
+        return data
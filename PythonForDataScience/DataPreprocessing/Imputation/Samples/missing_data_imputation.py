@@ -1,13 +1,87 @@
 """
 https://github.com/rafaelvalle/MDI/blob/master/missing_data_imputation.py
 """
+import weakref
 import numpy as np
-# import pandas as pd
+import pandas as pd
+import scipy.sparse as sp
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
 from scipy.stats import mode
 from scipy.linalg import svd
-from collections import defaultdict
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.utils.extmath import randomized_svd
+
+
+def _fit_predict_column(clf, features, target, miss_obs):
+    """ Trains clf on the observations where target is valid and predicts
+    target where it is missing """
+    clf.fit(features[~miss_obs], target[~miss_obs])
+    return clf.predict(features[miss_obs])
+
+
+def factorize(values):
+    """ Labels and integer codes of a column in one hash-based pass
+    (pd.factorize), labels sorted like np.unique """
+    codes, labels = pd.factorize(values, sort=True, use_na_sentinel=False)
+    return np.asarray(labels), codes
+
+
+def _indicator_matrix(base, blocks, sparse=False):
+    """ Appends indicator blocks to base, allocating the result once
+
+    Parameters
+    ----------
+    base : np.ndarray
+        Columns copied in front of the blocks
+    blocks : list of tuple
+        (codes, n_levels, on, off, extra) per block: the block has n_levels
+        columns set to off, except column codes[i] of row i set to on, and
+        one more constant column of value extra unless extra is None
+    sparse : bool
+        Return a scipy.sparse csr matrix (base must then be numeric)
+    """
+    n_rows = base.shape[0]
+    rows = np.arange(n_rows)
+    if sparse:
+        parts = [sp.csr_matrix(base.astype(float))]
+        for codes, n_levels, on, off, extra in blocks:
+            if off != 0:
+                raise ValueError("Sparse indicators need off values of 0")
+            parts.append(sp.csr_matrix(
+                (np.full(n_rows, on, dtype=float), (rows, codes)),
+                shape=(n_rows, n_levels)))
+            if extra is not None:
+                parts.append(sp.csr_matrix(np.full((n_rows, 1), extra,
+                                                   dtype=float)))
+        return sp.hstack(parts, format='csr')
+
+    width = base.shape[1] + sum(n_levels + (extra is not None)
+                                for _, n_levels, _, _, extra in blocks)
+    data = np.empty((n_rows, width), dtype=np.result_type(base.dtype, int))
+    data[:, :base.shape[1]] = base
+    offset = base.shape[1]
+    for codes, n_levels, on, off, extra in blocks:
+        data[:, offset:offset + n_levels] = off
+        data[rows, offset + codes] = on
+        offset += n_levels
+        if extra is not None:
+            data[:, offset] = extra
+            offset += 1
+    return data
+
+
+def _columns_as_rows(x, cols, block_size=2 ** 16):
+    """ Contiguous copy of x[:, cols].T, transposed by blocks of about
+    block_size values that stay in cache (a strided copy of the whole matrix
+    is much slower) """
+    rows = np.empty((len(cols), x.shape[0]), dtype=x.dtype)
+    block_rows = max(1, block_size // max(len(cols), 1))
+    for start in range(0, x.shape[0], block_rows):
+        rows[:, start:start + block_rows] = x[start:start + block_rows,
+                                              cols].T
+    return rows
 
 
 class Imputer(object):
@@ -15,8 +89,47 @@ class Imputer(object):
         """
         Attributes
         ----------
+        _encoding_source : weakref.ref
+            Weak reference to the matrix whose column encodings are cached
+        _encodings : dict
+            Column index -> (labels, codes) of _encoding_source, emptied
+            when the matrix is garbage collected
+        """
+        self._encoding_source = None
+        self._encodings = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_encoding_source'], state['_encodings'] = None, {}
+        return state
+
+    def encode(self, x, cols):
+        """ Factorizes columns of x, each one in a single hash-based pass, and
+        caches labels and codes so that every method called on the same array
+        reuses them. The cache holds a weak reference to x, it does not keep
+        x alive. Methods working in place clear the cache; call clear_cache()
+        after modifying x outside of the Imputer.
 
+        Returns
+        -------
+        encodings : dict
+            Column index -> (labels, codes)
         """
+        if (self._encoding_source is None or
+                self._encoding_source() is not x):
+            self.clear_cache()
+            # the callback holds the dict only, not the Imputer
+            encodings = self._encodings
+            self._encoding_source = weakref.ref(
+                x, lambda _: encodings.clear())
+        for col in cols:
+            if col not in self._encodings:
+                self._encodings[col] = factorize(x[:, col])
+        return dict((col, self._encodings[col]) for col in cols)
+
+    def clear_cache(self):
+        self._encoding_source = None
+        self._encodings = {}
 
     def drop(self, x, missing_data_cond):
         """ Drops all observations that have missing data
@@ -51,10 +164,35 @@ class Imputer(object):
         else:
             data = np.copy(x)
 
-        for col in range(x.shape[1]):
-            nan_ids = missing_data_cond(x[:, col])
-            val_ids = np.random.choice(np.where(~nan_ids)[0],  np.sum(nan_ids))
-            data[nan_ids, col] = data[val_ids, col]
+        missing_mask = missing_data_cond(x)
+        missing = np.flatnonzero(missing_mask)
+        if len(missing) == 0:
+            return data
+
+        # missing cells column after column, rows ascending
+        n_rows = x.shape[0]
+        miss_rows, miss_cols = np.divmod(missing, x.shape[1])
+        order = np.argsort(miss_cols * n_rows + miss_rows)
+        miss_rows, miss_cols = miss_rows[order], miss_cols[order]
+        n_missing = np.bincount(miss_cols, minlength=x.shape[1])
+        n_observed = n_rows - n_missing
+        if (n_observed[miss_cols] == 0).any():
+            raise ValueError("Columns without observed values can't be "
+                             "replaced")
+        starts = np.cumsum(n_missing) - n_missing
+        rank = np.arange(len(miss_rows)) - starts[miss_cols]
+
+        # a random observed row of its column for every missing cell: the
+        # u-th observed row is u plus the number of missing rows before it,
+        # found by searching the observed counts before every missing row
+        # (columns kept apart by an offset of n_rows)
+        keys = miss_cols * n_rows + (miss_rows - rank)
+        u = np.random.randint(0, n_observed[miss_cols])
+        donors = u + np.searchsorted(keys, miss_cols * n_rows + u,
+                                     side='right') - starts[miss_cols]
+        data[miss_rows, miss_cols] = x[donors, miss_cols]
+        if in_place:
+            self.clear_cache()
         return data
 
     def summarize(self, x, summary_func, missing_data_cond, in_place=False):
@@ -68,27 +206,88 @@ class Imputer(object):
             digit string features to float.
         summary_func : function
             Summarization function to be used for imputation
-            (mean, median, mode, max, min...)
+            (mean, median, mode, max, min...). scipy's mode (or None) takes
+            the most frequent value, ties going to the smallest one, and also
+            works on string features. Functions accepting an axis argument
+            (np.mean, np.median...) summarize all the columns with the same
+            number of observed values in one call, with the same results as
+            one call per column; other functions are called once per column.
         missing_data_cond : function
             Method that takes one value and returns True if it represents
             missing data or false otherwise.
         """
 
-        if in_place:
-            data = x
-        else:
-            data = np.copy(x)
+        # the missing mask is computed once for the whole matrix
+        missing_mask = missing_data_cond(x)
+        cols = np.flatnonzero(missing_mask.any(axis=0))
+        data = x if in_place else np.copy(x)
+        if len(cols) == 0:
+            return data
 
-        # replace missing values with the summarization function
-        for col in range(x.shape[1]):
-            nan_ids = missing_data_cond(x[:, col])
-            if True in nan_ids:
-                val = summary_func(x[~nan_ids, col])
-                data[nan_ids, col] = val
+        summaries = self._summarize_columns(x, missing_mask, summary_func,
+                                            cols)
+        fill = np.empty(x.shape[1], dtype=summaries.dtype)
+        fill[cols] = summaries
+        # every missing cell takes the summary of its column in one pass
+        np.copyto(data, fill, casting='unsafe', where=missing_mask)
 
+        if in_place:
+            self.clear_cache()
         return data
 
-    def one_hot(self, x, missing_data_cond, weighted=False, in_place=False):
+    @staticmethod
+    def _summarize_columns(x, missing_mask, summary_func, cols=None,
+                           batch_size=2 ** 20):
+        """ Summary of the observed values of the columns cols of x (all the
+        columns by default) """
+        if cols is None:
+            cols = np.arange(x.shape[1])
+        if summary_func is None or summary_func is mode:
+            # mode over integer codes of (column, value) pairs, ties go to
+            # the smallest value like in mode
+            observed = ~missing_mask.T[cols]
+            values = x.T[cols][observed]
+            labels, codes = factorize(values)
+            col_ids = np.repeat(np.arange(len(cols)), observed.sum(axis=1))
+            keys, freqs = np.unique(col_ids * len(labels) + codes,
+                                    return_counts=True)
+            key_cols = keys // len(labels)
+            order = np.lexsort((-freqs, key_cols))
+            _, first = np.unique(key_cols[order], return_index=True)
+            return labels[keys[order[first]] % len(labels)]
+
+        # the columns go by batches of neighbouring columns (about
+        # batch_size values), so that the copies stay small. Within a batch,
+        # the observed values of the columns sorted by their number, column
+        # after column: the values of consecutive columns with the same
+        # count reshape to a block reduced along its rows, in the same order
+        # (hence with the same rounding) as the 1-D calls
+        counts = x.shape[0] - np.count_nonzero(missing_mask, axis=0)[cols]
+        batch = max(1, batch_size // max(x.shape[0], 1))
+        fill = np.empty(len(cols), dtype=object)
+        try:
+            for start in range(0, len(cols), batch):
+                order = start + np.argsort(counts[start:start + batch],
+                                           kind='stable')
+                observed = ~_columns_as_rows(missing_mask, cols[order])
+                values = _columns_as_rows(x, cols[order])[observed]
+                if values.dtype.kind in 'OSU':
+                    values = values.astype(float)
+                part_counts = counts[order]
+                offsets = np.r_[0, np.cumsum(part_counts)]
+                bounds = np.flatnonzero(np.diff(part_counts)) + 1
+                for lo, hi in zip(np.r_[0, bounds],
+                                  np.r_[bounds, len(part_counts)]):
+                    block = values[offsets[lo]:offsets[hi]].reshape(
+                        hi - lo, part_counts[lo])
+                    fill[order[lo:hi]] = list(summary_func(block, axis=1))
+        except TypeError:
+            for i, col in enumerate(cols):
+                fill[i] = summary_func(x[~missing_mask[:, col], col])
+        return np.array(fill.tolist()).reshape(len(cols))
+
+    def one_hot(self, x, missing_data_cond, weighted=False, in_place=False,
+                sparse=False):
         """Create a one-hot row for each observation
 
         Parameters
@@ -101,6 +300,9 @@ class Imputer(object):
             missing data or false otherwise.
         weighted : bool
             Replaces one-hot by n_classes-hot.
+        sparse : bool
+            Return a scipy.sparse csr matrix; the columns without missing
+            data must then be numeric.
 
         Returns
         -------
@@ -108,34 +310,28 @@ class Imputer(object):
             Matrix with categorical data replaced with one-hot rows
         """
 
-        if in_place:
-            data = x
-        else:
-            data = np.copy(x)
+        # find columns with missing data
+        miss_cols_uniq = np.where(missing_data_cond(x).any(axis=0))[0]
+        keep_cols = np.setdiff1d(np.arange(x.shape[1]), miss_cols_uniq)
 
-        # find rows and columns with missing data
-        _, miss_cols = np.where(missing_data_cond(data))
-        miss_cols_uniq = np.unique(miss_cols)
+        blocks = []
+        for labels, codes in (self.encode(x, miss_cols_uniq)[col]
+                              for col in miss_cols_uniq):
+            on = len(labels) if weighted else 1
+            blocks.append((codes, len(labels), on, 0, None))
 
-        for miss_col in miss_cols_uniq:
-            uniq_vals, indices = np.unique(data[:, miss_col],
-                                           return_inverse=True)
-            if weighted:
-                data = np.column_stack((data, np.eye(uniq_vals.shape[0],
-                                        dtype=int)[indices]*uniq_vals.shape[0]))
-            else:
-                data = np.column_stack((data, np.eye(uniq_vals.shape[0],
-                                                     dtype=int)[indices]))
-
-        # remove categorical columns with missing data
-        data = np.delete(data, miss_cols, 1)
-        return data
+        # columns with missing data are replaced by their one-hot blocks
+        return _indicator_matrix(x[:, keep_cols], blocks, sparse=sparse)
 
     def knn(self, x, k, summary_func, missing_data_cond, cat_cols,
-            weighted=False, in_place=False):
+            weighted=False, in_place=False, n_jobs=None, batch_size=10000):
         """ Replace missing values with the summary function of K-Nearest
         Neighbors
 
+        Neighbours are searched among the complete observations, in batches of
+        missing observations, and the summary of the neighbours is computed for
+        all the missing cells of a column with one vectorized reduction.
+
         Parameters
         ----------
         x : np.ndarray
@@ -144,65 +340,95 @@ class Imputer(object):
         k : int
             Number of nearest neighbors to be used
         summary_func : function
-            Summarization function to be used for imputation
-            (mean, median, mode, max, min...)
+            Summarization function to be used for imputation. scipy's mode
+            (or None) takes the most frequent value among the neighbors; any
+            other function must accept an axis argument (np.mean, np.median...)
+            and is applied on the neighbor values converted to float
         missing_data_cond : function
             Method that takes one value and returns True if it represents
             missing data or false otherwise.
         cat_cols : int tuple
             Index of columns that are categorical
+        n_jobs : int
+            Number of parallel jobs of the neighbor search
+        batch_size : int
+            Number of missing observations queried at once
         """
         if in_place:
             data = x
         else:
             data = np.copy(x)
 
-        imp = Imputer()
-
         # first transform features with categorical missing data into one hot
-        data_complete = imp.one_hot(data, missing_data_cond, weighted=weighted)
+        data_complete = self.one_hot(x, missing_data_cond, weighted=weighted)
 
         # binarize complete categorical variables and convert to int
-        col = 0
-        cat_ids_comp = []
-        while col < max(cat_cols):
-            if isinstance(data_complete[0, col], np.basestring) and not data_complete[0, col].isdigit():
-                cat_ids_comp.append(col)
-            col += 1
+        cat_ids_comp = [col for col in range(data_complete.shape[1])
+                        if isinstance(data_complete[0, col], str) and
+                        not data_complete[0, col].isdigit()]
 
-        data_complete = imp.binarize_data(data_complete,
-                                          cat_ids_comp).astype(float)
+        data_complete = self.binarize_data(data_complete,
+                                           cat_ids_comp).astype(float)
 
         # normalize features
         scaler = StandardScaler().fit(data_complete)
         data_complete = scaler.transform(data_complete)
-        # create dict with missing rows and respective columns
-        missing = defaultdict(list)
-        map(lambda(a, b): missing[a].append(b),
-            np.argwhere(missing_data_cond(data)))
-        # create mask to build NearestNeighbors with complete observations only
-        mask = np.ones(len(data_complete), bool)
-        mask[missing.keys()] = False
+
+        # rows with missing data, and complete rows used as neighbors
+        missing_mask = missing_data_cond(data)
+        missing_rows = np.where(missing_mask.any(axis=1))[0]
+        complete_rows = np.where(~missing_mask.any(axis=1))[0]
+        if len(missing_rows) == 0:
+            return data
+
         # fit nearest neighbors and get knn ids of missing observations
         print('Computing k-nearest neighbors')
-        nbrs = NearestNeighbors(n_neighbors=k, metric='euclidean').fit(
-            data_complete[mask])
-        ids = nbrs.kneighbors(data_complete[missing.keys()],
-                              return_distance=False)
-
-        def substituteValues(i):
-            row = missing.keys()[i]
-            cols = missing[row]
-            data[row, cols] = mode(data[mask][ids[i]][:, cols])[0].flatten()
+        nbrs = NearestNeighbors(n_neighbors=k, metric='euclidean',
+                                n_jobs=n_jobs).fit(data_complete[complete_rows])
+        neighbors = np.empty((len(missing_rows), k), dtype=int)
+        for start in range(0, len(missing_rows), batch_size):
+            batch = missing_rows[start:start + batch_size]
+            neighbors[start:start + len(batch)] = nbrs.kneighbors(
+                data_complete[batch], return_distance=False)
+        # row ids of the neighbors in data
+        neighbors = complete_rows[neighbors]
 
         print('Substituting missing values')
-        map(substituteValues, range(len(missing)))
+        for col in np.where(missing_mask.any(axis=0))[0]:
+            sel = missing_mask[missing_rows, col]
+            # (n missing cells, k) matrix with the values of the neighbors
+            values = data[neighbors[sel], col]
+            data[missing_rows[sel], col] = self._summarize_rows(values,
+                                                                summary_func)
+        if in_place:
+            self.clear_cache()
         return data
 
+    @staticmethod
+    def _summarize_rows(values, summary_func):
+        """ Summary of every row of a matrix of neighbor values, mode by
+        default, in one vectorized reduction """
+        if summary_func is not None and summary_func is not mode:
+            return summary_func(values.astype(float), axis=1)
+        # mode over integer codes, ties go to the smallest value like in mode
+        labels, codes = np.unique(values, return_inverse=True)
+        codes = codes.reshape(values.shape)
+        n_rows, n_labels = codes.shape[0], len(labels)
+        if n_rows * n_labels <= 5e7:
+            counts = np.bincount(
+                (np.arange(n_rows)[:, None] * n_labels + codes).ravel(),
+                minlength=n_rows * n_labels).reshape(n_rows, n_labels)
+            return labels[counts.argmax(axis=1)]
+        return labels[mode(codes, axis=1)[0].ravel()]
+
     def predict(self, x, cat_cols, missing_data_cond, clf, inc_miss=True,
-                in_place=False):
+                in_place=False, n_jobs=-1):
         """ Uses random forest for predicting missing values
 
+        One model is trained per column with missing data. The models are
+        independent (each one is a clone of clf, trained on the data before
+        imputation) and run in parallel processes.
+
         Parameters
         ----------
         cat_cols : int tuple
@@ -214,6 +440,9 @@ class Imputer(object):
             Object with fit and predict methods, e.g. sklearn's Decision Tree
         inc_miss : bool
             Include missing data in fitting the model?
+        n_jobs : int
+            Number of columns imputed in parallel, all cores by default (None
+            or 1 imputes them one after the other in this process)
         """
 
         if in_place:
@@ -221,64 +450,60 @@ class Imputer(object):
         else:
             data = np.copy(x)
 
-        # find rows and columns with missing data
-        miss_rows, miss_cols = np.where(missing_data_cond(data))
-        miss_cols_uniq = np.unique(miss_cols)
-
-        if inc_miss:
-            valid_cols = np.arange(data.shape[1])
-        else:
-            valid_cols = [n for n in range(data.shape[1])
-                          if n not in miss_cols_uniq]
+        # find rows and columns with missing data, once
+        missing_mask = missing_data_cond(data)
+        miss_cols_uniq = np.where(missing_mask.any(axis=0))[0]
 
         # factorize valid cols
         data_factorized = np.copy(data)
 
         # factorize categorical variables and store transformation
         factor_labels = {}
-        for cat_col in cat_cols:
-            # factors, labels = pd.factorize(data[:, cat_col])
-            labels, factors = np.unique(data[:, cat_col], return_inverse=True)
+        for cat_col, (labels, factors) in self.encode(x, cat_cols).items():
             factor_labels[cat_col] = labels
             data_factorized[:, cat_col] = factors
 
         # values are integers, convert accordingly
         data_factorized = data_factorized.astype(int)
 
-        # update each column with missing features
-        for miss_col in miss_cols_uniq:
-            # extract valid observations given current column missing data
-            valid_obs = [n for n in range(len(data))
-                         if data[n, miss_col] != '?']
-
-            # prepare independent and dependent variables, valid obs only
-            data_train = data_factorized[:, valid_cols][valid_obs]
-            y_train = data_factorized[valid_obs, miss_col]
-
-            # train random forest classifier
-            clf.fit(data_train, y_train)
-
-            # given current feature, find obs with missing vals
-            miss_obs_iddata = miss_rows[miss_cols == miss_col]
-
-            # predict missing values
-            y_hat = clf.predict(data_factorized[:, valid_cols][miss_obs_iddata])
+        # independent variables: a single column selection shared by all models
+        if inc_miss:
+            features = data_factorized
+        else:
+            features = data_factorized[:, ~missing_mask.any(axis=0)]
 
-            # replace missing data with prediction
-            data_factorized[miss_obs_iddata, miss_col] = y_hat
+        # train one model per column with missing data and predict its
+        # missing values
+        predictions = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_predict_column)(clone(clf, safe=False), features,
+                                         data_factorized[:, miss_col],
+                                         missing_mask[:, miss_col])
+            for miss_col in miss_cols_uniq)
 
         # replace values on original data
-        for col in factor_labels.keys():
-            data[:, col] = factor_labels[col][data_factorized[:, col]]
+        for miss_col, y_hat in zip(miss_cols_uniq, predictions):
+            miss_obs = missing_mask[:, miss_col]
+            if miss_col in factor_labels:
+                data[miss_obs, miss_col] = factor_labels[miss_col][y_hat]
+            else:
+                data[miss_obs, miss_col] = y_hat
 
+        if in_place:
+            self.clear_cache()
         return data
 
     def factor_analysis(self, x, cat_cols, missing_data_cond, threshold=0.9,
-                        technique='SVD', in_place=False):
+                        technique='SVD', in_place=False, max_rank=None,
+                        n_iter=1, tol=1e-3, random_state=None,
+                        summary_func=mode):
         """ Performs low-rank matrix approximation via dimensioality reduction
         and replaces missing data with values obtained from the data projected
         onto N principal components or singular values or eigenvalues...
 
+        Only the thin factors (n x rank and rank x m) are kept, and the low
+        rank approximation is evaluated at the missing cells only, so memory
+        scales with n * rank instead of n^2.
+
         cat_cols : int tuple
             Index of columns that are categorical
         missing_data_cond : function
@@ -287,57 +512,96 @@ class Imputer(object):
         threshold : float
             Variance threshold that must be explained by eigen values.
         technique : str
-            Technique used for low-rank approximation. 'SVD' is supported
+            Technique used for low-rank approximation. 'SVD' (thin exact SVD)
+            and 'randomized' (randomized truncated SVD of max_rank components,
+            the threshold then applies to those components) are supported
+        max_rank : int
+            Number of components computed by the randomized SVD, and upper
+            bound of the rank for both techniques
+        n_iter : int
+            Number of imputation rounds; every round refits the low rank
+            approximation on the data completed by the previous one
+        tol : float
+            Stop iterating when the largest change of an imputed cell,
+            relative to the largest imputed value, is below tol
+        summary_func : function
+            Summary of every column taken as first guess of its missing
+            cells, see summarize; np.mean suits continuous data, whose mode
+            is meaningless
         """
 
-        def _mode(d):
-            return mode(d)[0].flatten()
-
         if in_place:
             data = x
         else:
             data = np.copy(x)
 
-        data_summarized = self.summarize(x, _mode, missing_data_cond)
+        data_summarized = self.summarize(x, summary_func, missing_data_cond)
 
         # factorize categorical variables and store encoding
         factor_labels = {}
         for cat_col in cat_cols:
-            labels, factors = np.unique(data_summarized[:, cat_col],
-                                        return_inverse=True)
+            labels, factors = factorize(data_summarized[:, cat_col])
             factor_labels[cat_col] = labels
             data_summarized[:, cat_col] = factors
 
         data_summarized = data_summarized.astype(float)
-        if technique == 'SVD':
-            lsvec, sval, rsvec = svd(data_summarized)
-            # find number of singular values that explain 90% of variance
-            n_singv = 1
-            while np.sum(sval[:n_singv]) / np.sum(sval) < threshold:
-                n_singv += 1
-
-            # compute low rank approximation
-            data_summarized = np.dot(
-                lsvec[:, :n_singv],
-                np.dot(np.diag(sval[:n_singv]), rsvec[:n_singv, ]))
-        else:
-            raise Exception("Technique {} is not supported".format(technique))
 
         # get missing data indices
         nans = np.argwhere(missing_data_cond(x))
+        miss_rows, miss_cols = nans[:, 0], nans[:, 1]
+
+        imputed = data_summarized[miss_rows, miss_cols]
+        for _ in range(n_iter):
+            lsvec, sval, rsvec = self._low_rank(data_summarized, technique,
+                                                max_rank, random_state)
+            # find number of singular values that explain 90% of variance
+            explained = np.cumsum(sval) / np.sum(sval)
+            n_singv = min(np.searchsorted(explained, threshold) + 1,
+                          len(sval))
+
+            # evaluate the low rank approximation at the missing cells only
+            previous = imputed
+            imputed = np.einsum('ij,ij->i',
+                                lsvec[miss_rows, :n_singv] * sval[:n_singv],
+                                rsvec[:n_singv, miss_cols].T)
+            data_summarized[miss_rows, miss_cols] = imputed
+            change = np.max(np.abs(imputed - previous), initial=0)
+            if change <= tol * max(np.max(np.abs(imputed), initial=0), 1):
+                break
 
         # update data given projection
-        for col in np.unique(nans[:, 1]):
-            obs_ids = nans[nans[:, 1] == col, 0]
+        for col in np.unique(miss_cols):
+            sel = miss_cols == col
+            obs_ids = miss_rows[sel]
+            if col not in factor_labels:
+                data[obs_ids, col] = imputed[sel]
+                continue
             # clip low rank approximation to be within factor labels
-            proj_cats = np.clip(
-                data_summarized[obs_ids, col], 0, len(factor_labels[col])-1)
+            proj_cats = np.clip(imputed[sel], 0, len(factor_labels[col])-1)
             # round categorical variable factors to int
             proj_cats = proj_cats.round().astype(int)
             data[obs_ids, col] = factor_labels[col][proj_cats]
 
+        if in_place:
+            self.clear_cache()
         return data
 
+    @staticmethod
+    def _low_rank(data, technique, max_rank, random_state):
+        """ Thin singular value decomposition with the given technique """
+        if technique == 'SVD':
+            lsvec, sval, rsvec = svd(data, full_matrices=False)
+        elif technique == 'randomized':
+            n_components = max_rank or min(50, min(data.shape))
+            lsvec, sval, rsvec = randomized_svd(data, n_components,
+                                                random_state=random_state)
+        else:
+            raise Exception("Technique {} is not supported".format(technique))
+        if max_rank is not None:
+            lsvec, sval, rsvec = (lsvec[:, :max_rank], sval[:max_rank],
+                                  rsvec[:max_rank])
+        return lsvec, sval, rsvec
+
     def factorize_data(self, x, cols, in_place=False):
         """Replace column in cols with factors of cols
 
@@ -360,16 +624,16 @@ class Imputer(object):
             data = np.copy(x)
 
         factors_labels = {}
-        for col in cols:
-            # factors, labels = pd.factorize(data[:, col])
-            labels, factors = np.unique(data[:, col], return_inverse=True)
+        for col, (labels, factors) in self.encode(x, cols).items():
             factors_labels[col] = labels
             data[:, col] = factors
 
+        if in_place:
+            self.clear_cache()
         return data, factors_labels
 
     def binarize_data(self, x, cols, miss_data_symbol=False,
-                      one_minus_one=True, in_place=False):
+                      one_minus_one=True, in_place=False, sparse=False):
         """Replace column in cols with one-hot representation of cols
 
         Parameters
@@ -379,6 +643,9 @@ class Imputer(object):
             columns are features
         cols: tuple <int>
             Index of columns with categorical data
+        sparse : bool
+            Return a scipy.sparse csr matrix (requires one_minus_one=False
+            and numeric non categorical columns)
 
         Returns
         -------
@@ -386,27 +653,19 @@ class Imputer(object):
             Matrix with categorical data replaced with one-hot rows
         """
 
-        if in_place:
-            data = x
-        else:
-            data = np.copy(x)
+        blocks = []
         for col in cols:
-            uniq_vals, indices = np.unique(data[:, col], return_inverse=True)
-
-            if one_minus_one:
-                data = np.column_stack(
-                    (data,
-                     (np.eye(uniq_vals.shape[0], dtype=int)[indices] * 2) - 1))
-            else:
-                data = np.column_stack((data, np.eye(uniq_vals.shape[0],
-                                                     dtype=int)[indices]))
+            uniq_vals, indices = self.encode(x, [col])[col]
             # add missing data column to feature
+            extra = None
             if miss_data_symbol is not False and \
                     miss_data_symbol not in uniq_vals:
-                data = np.column_stack(
-                    (data, -one_minus_one * np.ones((len(data), 1), dtype=int)))
+                extra = -one_minus_one
+            if one_minus_one:
+                blocks.append((indices, len(uniq_vals), 1, -1, extra))
+            else:
+                blocks.append((indices, len(uniq_vals), 1, 0, extra))
 
         # remove columns with categorical variables
-        val_cols = [n for n in range(data.shape[1]) if n not in cols]
-        data = data[:, val_cols]
-        return data
\ No newline at end of file
+        val_cols = [n for n in range(x.shape[1]) if n not in cols]
+        return _indicator_matrix(x[:, val_cols], blocks, sparse=sparse)
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Gap Filling for Many Series
+---------------------------
+
+    DataFrame.interpolate (LinearInterpolation/LI04.py) fills one series at a time: with many series in a long format
+    frame (series_id, timestamp, value), a groupby(...).interpolate() or a loop over the series pays the pandas
+    overhead once per series. fill_gaps sorts the frame once by (series, timestamp) and fills the gaps of all the series
+    together with array operations:
+        - for every row, the previous and the next valid row of its series are found with running max / min over the
+          row positions; the gap runs (leading, inside, trailing) and the position of a NaN in its run follow from them
+        - the rows to fill are selected with the limit, limit_direction and limit_area rules of DataFrame.interpolate
+        - the fill value is computed from the two surrounding valid rows
+
+    Methods (as DataFrame.interpolate on every series indexed by its timestamps):
+        - 'linear'  : values treated as equally spaced; leading / trailing NaNs take the first / last valid value
+        - 'time'    : linear in the timestamps (datetime or numeric)
+        - 'nearest' : value of the nearest valid timestamp, the previous one on ties; leading / trailing NaNs stay NaN
+        - 'pad'     : previous valid value (forward fill), limit_direction has to be 'forward'
+
+    With n_jobs != 1 the sorted rows are cut at series boundaries into n_jobs partitions filled in parallel threads.
+"""
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+METHODS = ('linear', 'time', 'nearest', 'pad')
+
+
+def _series_bounds(codes):
+    """
+    First and last row of the series of every row, for rows sorted by series
+    """
+    n = len(codes)
+    starts = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, n])
+    first = np.repeat(starts, lengths)
+    return first, first + np.repeat(lengths, lengths) - 1
+
+
+def _time_axis(times):
+    """
+    Timestamps as int64 (nanoseconds for datetimes) or float
+    """
+    times = pd.Series(times)
+    if pd.api.types.is_datetime64_any_dtype(times):
+        return pd.DatetimeIndex(times).asi8
+    return times.to_numpy(dtype=float)
+
+
+def _neighbours(values, first, last):
+    """
+    Previous and next valid row of every row within its series (-1 / len(values) when there is none)
+    """
+    n = len(values)
+    position = np.arange(n)
+    valid = ~np.isnan(values)
+    prev = np.maximum.accumulate(np.where(valid, position, -1))
+    nxt = np.minimum.accumulate(np.where(valid, position, n)[::-1])[::-1]
+    prev[prev < first] = -1
+    nxt[nxt > last] = n
+    return prev, nxt
+
+
+def _rows_to_fill(values, prev, nxt, limit, limit_direction, limit_area):
+    n = len(values)
+    position = np.arange(n)
+    has_prev, has_next = prev >= 0, nxt < n
+    fill = np.isnan(values) & (has_prev | has_next)
+    inside = has_prev & has_next
+    if limit_direction == 'forward':
+        fill &= has_prev
+        if limit is not None:
+            fill &= position - prev <= limit
+    elif limit_direction == 'backward':
+        fill &= has_next
+        if limit is not None:
+            fill &= nxt - position <= limit
+    elif limit is not None:
+        fill &= (has_prev & (position - prev <= limit)) | (has_next & (nxt - position <= limit))
+    if limit_area == 'inside':
+        fill &= inside
+    elif limit_area == 'outside':
+        fill &= ~inside
+    return fill, inside
+
+
+def fill_array(values, codes, times=None, method='linear', limit=None, limit_direction='forward', limit_area=None):
+    """
+    Fills the NaNs of values, rows sorted by series code, then by time
+    Args:
+      * values -> float array, not modified
+      * codes -> series code of every row (equal codes contiguous)
+      * times -> int64 or float timestamps of the rows, for 'time' and 'nearest'
+      * method, limit, limit_direction, limit_area -> as DataFrame.interpolate
+    """
+    if method not in METHODS:
+        raise ValueError("method has to be one of %s" % (METHODS,))
+    if limit_direction not in ('forward', 'backward', 'both'):
+        raise ValueError("limit_direction has to be 'forward', 'backward' or 'both'")
+    if limit_area not in (None, 'inside', 'outside'):
+        raise ValueError("limit_area has to be None, 'inside' or 'outside'")
+    if method == 'pad' and limit_direction != 'forward':
+        raise ValueError("limit_direction has to be 'forward' for method 'pad'")
+    if limit is not None and limit < 1:
+        raise ValueError("limit has to be greater than 0")
+    values = np.asarray(values, dtype=float)
+    codes = np.asarray(codes)
+    first, last = _series_bounds(codes)
+    prev, nxt = _neighbours(values, first, last)
+    fill, inside = _rows_to_fill(values, prev, nxt, limit, limit_direction, limit_area)
+    if method == 'nearest':
+        # interp1d(kind='nearest') leaves the points outside the valid timestamps unfilled
+        fill &= inside
+
+    rows = np.flatnonzero(fill)
+    before, after = prev[rows], nxt[rows]
+    inner = inside[rows]
+    # rows with only one neighbour take its value, the others are set below
+    filled = np.where(before >= 0, values[np.maximum(before, 0)], values[np.minimum(after, len(values) - 1)])
+    if method != 'pad':
+        r, b, a = rows[inner], before[inner], after[inner]
+        if method == 'linear':
+            x, xb, xa = r, b, a
+        else:
+            times = np.asarray(times)
+            x, xb, xa = times[r], times[b], times[a]
+        if method == 'nearest':
+            filled[inner] = np.where(x <= (xb + xa) / 2.0, values[b], values[a])
+        else:
+            # same operations as np.interp; time differences are taken before the conversion to float
+            slope = (values[a] - values[b]) / (xa - xb).astype(float)
+            filled[inner] = slope * (x - xb).astype(float) + values[b]
+
+    result = values.copy()
+    result[rows] = filled
+    return result
+
+
+def _partitions(codes, n_parts):
+    """
+    Row ranges of about the same size cut at series boundaries
+    """
+    n = len(codes)
+    starts = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1]
+    cuts = np.unique(starts[np.searchsorted(starts, np.linspace(0, n, n_parts + 1)[1:-1])])
+    bounds = np.r_[0, cuts, n]
+    return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def fill_gaps(df, method='linear', limit=None, limit_direction='forward', limit_area=None, series_col='series_id',
+              time_col='timestamp', value_col='value', assume_sorted=False, n_jobs=1):
+    """
+    Fills the gaps of every series of a long format frame
+    Args:
+      * df -> one row per (series, timestamp)
+      * value_col -> name or list of names of the columns to fill
+      * assume_sorted -> rows are already sorted by series, then by timestamp
+      * n_jobs -> threads filling partitions of series (-1 uses all cores)
+    Returns a copy of df sorted by (series, timestamp), index kept, with the value columns filled.
+    """
+    if not assume_sorted:
+        df = df.sort_values([series_col, time_col], kind='stable')
+    codes = pd.factorize(df[series_col])[0]
+    times = _time_axis(df[time_col]) if method in ('time', 'nearest') else None
+    value_cols = [value_col] if isinstance(value_col, str) else list(value_col)
+    kwargs = dict(method=method, limit=limit, limit_direction=limit_direction, limit_area=limit_area)
+
+    result = df.copy()
+    for col in value_cols:
+        values = df[col].to_numpy(dtype=float)
+        if n_jobs == 1:
+            filled = fill_array(values, codes, times, **kwargs)
+        else:
+            parts = _partitions(codes, effective_n_jobs(n_jobs))
+            filled = np.concatenate(Parallel(n_jobs=n_jobs, prefer='threads')(
+                delayed(fill_array)(values[lo:hi], codes[lo:hi], None if times is None else times[lo:hi], **kwargs)
+                for lo, hi in parts))
+        result[col] = filled
+    return result
+
+
+def gap_runs(df, series_col='series_id', time_col='timestamp', value_col='value', assume_sorted=False):
+    """
+    One row per run of consecutive NaNs: series, timestamps of its first and last NaN, length and
+    position ('leading', 'inside', 'trailing' or 'all' for a series without valid value)
+    """
+    if not assume_sorted:
+        df = df.sort_values([series_col, time_col], kind='stable')
+    values = df[value_col].to_numpy(dtype=float)
+    codes = pd.factorize(df[series_col])[0]
+    first, last = _series_bounds(codes)
+    prev, nxt = _neighbours(values, first, last)
+    missing = np.isnan(values)
+    # a run starts on a NaN that begins its series or follows a valid value
+    starts = np.flatnonzero(missing & ((np.arange(len(values)) == first) | ~np.r_[True, missing[:-1]]))
+    ends = np.minimum(nxt[starts], last[starts] + 1) - 1
+    has_prev, has_next = prev[starts] >= 0, nxt[starts] < len(values)
+    position = np.select([has_prev & has_next, has_next, has_prev], ['inside', 'leading', 'trailing'], 'all')
+    return pd.DataFrame({series_col: df[series_col].to_numpy()[starts],
+                         'start': df[time_col].to_numpy()[starts],
+                         'end': df[time_col].to_numpy()[ends],
+                         'length': ends - starts + 1,
+                         'position': position})
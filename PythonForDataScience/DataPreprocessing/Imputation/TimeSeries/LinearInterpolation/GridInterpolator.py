@@ -0,0 +1,167 @@
+"""
+Cached Scattered Data Interpolation
+-----------------------------------
+
+    Every scipy.interpolate.griddata call (LI03.py) triangulates the data points again, and locates every target point
+    in the triangulation again. With a fixed station layout and many value fields to interpolate onto the same grid,
+    both can be done once:
+        - GridInterpolator triangulates the points once (Delaunay), and builds a cKDTree for 'nearest'
+        - for a target grid, the simplex of every target point and its barycentric coordinates are computed once and
+          kept as a sparse (n_targets, n_points) weight matrix, cached per grid
+        - interpolating a field is then a sparse matrix product, and many fields (columns of values) go through one
+          product
+    With 1-D points there is nothing to triangulate: the 'linear' weights of a target come from the two data points
+    around it (np.searchsorted on the sorted points), as griddata's interp1d.
+    'linear' and 'nearest' give the griddata values. 'cubic' (2-D, CloughTocher2DInterpolator) is not a fixed weighting
+    of the values (the gradients are estimated from them); it reuses the triangulation and interpolates all the fields
+    of a call together.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import Delaunay, cKDTree
+
+
+class GridInterpolator(object):
+    """
+      Interpolation of many value fields from fixed scattered points.
+      Args:
+        * points -> (n, D) data point coordinates, a tuple of D arrays, (n,) coordinates for D = 1, or a Delaunay
+                    triangulation of them to share
+        * method -> 'linear', 'nearest' or 'cubic' (D = 2)
+        * fill_value -> value outside the convex hull of the points ('linear', 'cubic')
+        * rescale -> rescale the points to the unit cube first, as griddata
+        * cache_size -> number of target grids whose weights are kept
+      """
+
+    def __init__(self, points, method='linear', fill_value=np.nan, rescale=False, cache_size=8):
+        if method not in ('linear', 'nearest', 'cubic'):
+            raise ValueError("method has to be 'linear', 'nearest' or 'cubic'")
+        tri = None
+        if isinstance(points, Delaunay):
+            if rescale:
+                raise ValueError("rescale needs the points, not their triangulation")
+            tri, points = points, points.points
+        points = self._as_points(points)
+        if method == 'cubic' and points.shape[1] != 2:
+            raise ValueError("method 'cubic' needs 2-D points")
+        self.method = method
+        self.fill_value = fill_value
+        self.cache_size = cache_size
+        self.n_points = len(points)
+        self.ndim = points.shape[1]
+        if self.ndim == 1 and method == 'linear' and self.n_points < 2:
+            raise ValueError("method 'linear' needs at least 2 points")
+        if rescale:
+            self._offset = points.min(axis=0)
+            self._scale = np.ptp(points, axis=0)
+            self._scale[self._scale == 0] = 1.0
+        else:
+            self._offset, self._scale = 0.0, 1.0
+        points = (points - self._offset) / self._scale
+        if self.ndim == 1:
+            # sorted coordinates and their point indices, for the 1-D 'linear' weights
+            self._order = np.argsort(points[:, 0], kind='stable')
+            self._sorted = points[self._order, 0]
+        elif method != 'nearest' and tri is None:
+            tri = Delaunay(points)
+        self.tri = tri if method != 'nearest' else None
+        self.tree = cKDTree(points) if method == 'nearest' else None
+        self._weights = OrderedDict()
+
+    @staticmethod
+    def _as_points(points):
+        if isinstance(points, tuple):
+            points = np.column_stack([np.ravel(p) for p in points])
+        points = np.asarray(points, dtype=float)
+        return points[:, None] if points.ndim == 1 else points
+
+    def _targets(self, xi):
+        """
+        (M, D) target coordinates and the shape of the result of one field
+        """
+        if self.ndim == 1:
+            # as griddata with 1-D points: every value of xi is a coordinate
+            xi = np.asarray(xi[0] if isinstance(xi, tuple) else xi, dtype=float)
+            shape = xi.shape
+            xi = xi.reshape(-1, 1)
+        elif isinstance(xi, tuple):
+            xi = np.broadcast_arrays(*xi)
+            shape = xi[0].shape
+            xi = np.column_stack([x.ravel() for x in xi])
+        else:
+            xi = np.asarray(xi, dtype=float)
+            shape = xi.shape[:-1]
+            xi = xi.reshape(-1, xi.shape[-1])
+        return (np.asarray(xi, dtype=float) - self._offset) / self._scale, shape
+
+    def weights(self, xi):
+        """
+        Sparse (M, n_points) interpolation weights of the target points, and the mask of the targets outside the hull
+        """
+        return self._cached_weights(self._targets(xi)[0])
+
+    def _cached_weights(self, targets):
+        key = hashlib.sha1(np.ascontiguousarray(targets).view(np.uint8)).hexdigest()
+        if key in self._weights:
+            self._weights.move_to_end(key)
+            return self._weights[key]
+
+        n_targets = len(targets)
+        if self.method == 'nearest':
+            index = self.tree.query(targets)[1]
+            matrix = sp.csr_matrix((np.ones(n_targets), index, np.arange(n_targets + 1)),
+                                   shape=(n_targets, self.n_points))
+            outside = np.zeros(n_targets, dtype=bool)
+        elif self.ndim == 1:
+            x = targets[:, 0]
+            outside = ~((x >= self._sorted[0]) & (x <= self._sorted[-1]))
+            # the two sorted points around every target and its position between them
+            right = np.clip(np.searchsorted(self._sorted, x, side='right'), 1, self.n_points - 1)
+            x0, x1 = self._sorted[right - 1], self._sorted[right]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.where(x1 > x0, (x - x0) / (x1 - x0), 0.0)
+            b = np.c_[1 - t, t]
+            b[outside] = 0
+            vertices = self._order[np.c_[right - 1, right]]
+            matrix = sp.csr_matrix((b.ravel(), vertices.ravel(), np.arange(0, b.size + 1, 2)),
+                                   shape=(n_targets, self.n_points))
+        else:
+            simplex = self.tri.find_simplex(targets)
+            outside = simplex < 0
+            # barycentric coordinates: the first D from the affine transform of the simplex, the last one completes 1
+            transform = self.tri.transform[simplex]
+            ndim = targets.shape[1]
+            b = np.einsum('ijk,ik->ij', transform[:, :ndim], targets - transform[:, ndim])
+            b = np.c_[b, 1 - b.sum(axis=1)]
+            b[outside] = 0
+            vertices = self.tri.simplices[simplex]
+            matrix = sp.csr_matrix((b.ravel(), vertices.ravel(), np.arange(0, b.size + 1, ndim + 1)),
+                                   shape=(n_targets, self.n_points))
+        self._weights[key] = matrix, outside
+        if len(self._weights) > self.cache_size:
+            self._weights.popitem(last=False)
+        return matrix, outside
+
+    def __call__(self, values, xi):
+        """
+        Interpolates values, (n_points,) or (n_points, n_fields), at xi (as griddata); the result has the shape of xi
+        followed by n_fields
+        """
+        values = np.asarray(values)
+        if len(values) != self.n_points:
+            raise ValueError("values has to have one row per point")
+        targets, shape = self._targets(xi)
+        if self.method == 'cubic':
+            result = CloughTocher2DInterpolator(self.tri, values, fill_value=self.fill_value)(targets)
+        else:
+            matrix, outside = self._cached_weights(targets)
+            result = matrix.dot(values)
+            if outside.any():
+                result = result.astype(np.result_type(result, self.fill_value))
+                result[outside] = self.fill_value
+        return result.reshape(shape + values.shape[1:])
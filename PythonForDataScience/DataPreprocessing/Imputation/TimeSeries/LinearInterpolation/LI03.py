@@ -69,10 +69,20 @@ plt.gcf().set_size_inches(6, 6)
 plt.show()
 
 
-# Example 0
-
-
-# Example 0
-
-
-# Example 0
\ No newline at end of file
+# Example 02: Many value fields on the same points.
+# Each griddata call above triangulates the 1000 points again and locates every grid point in the triangulation again.
+# When the points are fixed (e.g. a station layout) and many fields are interpolated on the same grid,
+# GridInterpolator (GridInterpolator.py) triangulates once and keeps the weights of every grid point:
+# each field is then a sparse matrix product, and the columns of values are interpolated together.
+from scipy.spatial import Delaunay
+from GridInterpolator import GridInterpolator
+
+tri = Delaunay(points)                               # one triangulation, shared by 'linear' and 'cubic'
+nearest = GridInterpolator(points, method='nearest')
+linear = GridInterpolator(tri, method='linear')
+cubic = GridInterpolator(tri, method='cubic')
+grid_z0, grid_z1, grid_z2 = nearest(values, (grid_x, grid_y)), linear(values, (grid_x, grid_y)), cubic(values, (grid_x, grid_y))
+
+# 100 fields (e.g. hourly readings of the stations): one sparse product, result of shape (100, 200, 100)
+fields = np.column_stack([func(points[:,0], points[:,1]) * np.cos(t) for t in np.linspace(0, np.pi, 100)])
+grid_fields = linear(fields, (grid_x, grid_y))
@@ -0,0 +1,202 @@
+"""
+Streaming Gap Filling
+---------------------
+
+    GapFill.fill_gaps (and DataFrame.interpolate) need the whole series: a gap can only be interpolated once the valid
+    value after it is known. For live feeds StreamingInterpolator fills the gaps as the events arrive, with a bounded
+    state per series:
+        - the last valid event, the number of NaNs since it, and the NaNs waiting for the next valid event (pending)
+        - a NaN is emitted as soon as its value is known: at once when it cannot be filled (no valid event before it
+          in the series, or more than limit NaNs since the last valid one), otherwise with the next valid event
+        - with limit, at most limit NaNs are pending per series
+
+    Methods are those of GapFill with limit_direction='forward' and, except for 'pad', limit_area='inside' (a stream has
+    no trailing gap, flush emits the NaNs still pending unfilled):
+        - 'linear'  : values treated as equally spaced
+        - 'time'    : linear in the timestamps
+        - 'nearest' : value of the nearest valid timestamp, the previous one on ties
+        - 'pad'     : last valid value, emitted at once
+
+    The state is kept in arrays indexed by a series code, and push_batch handles an array of events (of many series,
+    in arrival order within every series) without a python loop: the state rows of the series in the batch are put in
+    front of their batch rows and GapFill.fill_array fills them all at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from GapFill import METHODS, fill_array, _neighbours, _series_bounds
+
+
+class StreamingInterpolator(object):
+    """
+      Fills the gaps of many series batch by batch.
+      Args:
+        * method -> 'linear', 'time', 'nearest' or 'pad'
+        * limit -> maximum number of consecutive NaNs to fill; None fills whole gaps (and keeps them pending)
+      Times are int, float (e.g. epoch seconds) or datetime64, of the same kind in every batch.
+      """
+
+    def __init__(self, method='linear', limit=None):
+        if method not in METHODS:
+            raise ValueError("method has to be one of %s" % (METHODS,))
+        if limit is not None and limit < 1:
+            raise ValueError("limit has to be greater than 0")
+        self.method = method
+        self.limit = limit
+        self._reset()
+
+    def _reset(self):
+        self._ids = pd.Index([], dtype=object)
+        self._time_dtype = None
+        self._is_datetime = False
+        # per series: events seen, counter, time and value of the last valid event (NaN: none yet), NaNs since it
+        self._count = np.zeros(0, dtype=np.int64)
+        self._last_x = np.zeros(0, dtype=np.int64)
+        self._last_t = np.zeros(0)
+        self._last_v = np.zeros(0)
+        self._gap = np.zeros(0, dtype=np.int64)
+        # pending NaNs, sorted by series code, in arrival order within a series
+        self._pending_code = np.zeros(0, dtype=np.int64)
+        self._pending_x = np.zeros(0, dtype=np.int64)
+        self._pending_t = np.zeros(0)
+
+    @property
+    def n_pending(self):
+        """
+        Number of NaNs waiting for the next valid event
+        """
+        return len(self._pending_code)
+
+    def _series_codes(self, series_ids):
+        """
+        Codes of the series ids, new series get new codes and an empty state
+        """
+        codes = self._ids.get_indexer(series_ids)
+        new = codes < 0
+        if new.any():
+            new_ids = pd.unique(series_ids[new])
+            n_new = len(new_ids)
+            self._ids = self._ids.append(pd.Index(new_ids, dtype=object))
+            self._count = np.r_[self._count, np.zeros(n_new, dtype=np.int64)]
+            self._last_x = np.r_[self._last_x, np.zeros(n_new, dtype=np.int64)]
+            self._last_t = np.r_[self._last_t, np.zeros(n_new, dtype=self._time_dtype)]
+            self._last_v = np.r_[self._last_v, np.full(n_new, np.nan)]
+            self._gap = np.r_[self._gap, np.zeros(n_new, dtype=np.int64)]
+            codes[new] = self._ids.get_indexer(series_ids[new])
+        return codes
+
+    def _state_rows(self, batch_codes):
+        """
+        Rows standing for the state of the series in the batch: last valid event, pending NaNs and, when more NaNs
+        than pending ones followed the last valid event, already emitted NaNs so that the limit keeps counting.
+        Returns code, counter, time, value and emitted flag of every row.
+        """
+        has_last = ~np.isnan(self._last_v[batch_codes])
+        last_codes = batch_codes[has_last]
+        in_batch = np.isin(self._pending_code, batch_codes)
+        pending_codes = self._pending_code[in_batch]
+        if self.limit is None:
+            n_emitted = np.zeros(len(last_codes), dtype=np.int64)
+        else:
+            n_pending = np.bincount(pending_codes, minlength=len(self._ids))[last_codes]
+            n_emitted = np.minimum(self._gap[last_codes], self.limit + 1) - n_pending
+        emitted_codes = np.repeat(last_codes, n_emitted)
+        n_last, n_pending_rows, n_emitted_rows = len(last_codes), len(pending_codes), len(emitted_codes)
+        return (np.r_[last_codes, pending_codes, emitted_codes],
+                np.r_[self._last_x[last_codes], self._pending_x[in_batch], self._last_x[emitted_codes]],
+                np.r_[self._last_t[last_codes], self._pending_t[in_batch], self._last_t[emitted_codes]],
+                np.r_[self._last_v[last_codes], np.full(n_pending_rows + n_emitted_rows, np.nan)],
+                np.r_[np.ones(n_last, dtype=bool), np.zeros(n_pending_rows, dtype=bool),
+                      np.ones(n_emitted_rows, dtype=bool)],
+                ~in_batch)
+
+    def push_batch(self, series_ids, times, values):
+        """
+        Adds a batch of events; returns the (series_ids, times, values) arrays of the events that are now resolved,
+        grouped by series, in arrival order within every series
+        """
+        series_ids = np.asarray(series_ids, dtype=object)
+        values = np.asarray(values, dtype=float)
+        times = np.asarray(times)
+        is_datetime = np.issubdtype(times.dtype, np.datetime64)
+        if is_datetime:
+            times = times.astype('datetime64[ns]').view(np.int64)
+        if self._time_dtype is None:
+            self._time_dtype = np.int64 if np.issubdtype(times.dtype, np.integer) else np.float64
+            self._is_datetime = is_datetime
+            self._last_t = self._last_t.astype(self._time_dtype)
+            self._pending_t = self._pending_t.astype(self._time_dtype)
+        times = times.astype(self._time_dtype, copy=False)
+        if not len(values):
+            return series_ids, times.view('datetime64[ns]') if is_datetime else times, values
+
+        codes = self._series_codes(series_ids)
+        order = np.argsort(codes, kind='stable')
+        codes, times, values = codes[order], times[order], values[order]
+        first, _ = _series_bounds(codes)
+        batch_codes = codes[first == np.arange(len(codes))]
+        counts = np.diff(np.r_[np.flatnonzero(first == np.arange(len(codes))), len(codes)])
+
+        # the state rows come before the batch rows of their series
+        s_code, s_x, s_t, s_v, s_emitted, keep_pending = self._state_rows(batch_codes)
+        all_codes = np.r_[s_code, codes]
+        order = np.argsort(all_codes, kind='stable')
+        all_codes = all_codes[order]
+        x = np.r_[s_x, self._count[codes] + np.arange(len(codes)) - first][order]
+        t = np.r_[s_t, times][order]
+        v = np.r_[s_v, values][order]
+        emitted = np.r_[s_emitted, np.zeros(len(codes), dtype=bool)][order]
+
+        all_first, all_last = _series_bounds(all_codes)
+        prev, nxt = _neighbours(v, all_first, all_last)
+        if self.method == 'pad':
+            filled = fill_array(v, all_codes, method='pad', limit=self.limit)
+            resolved = np.ones(len(v), dtype=bool)
+        else:
+            axis = x if self.method == 'linear' else t
+            method = 'time' if self.method == 'linear' else self.method
+            filled = fill_array(v, all_codes, axis, method=method, limit=self.limit, limit_area='inside')
+            # a NaN waits for the next valid event unless it can never be filled
+            resolved = ~np.isnan(v) | (nxt < len(v)) | (prev < 0)
+            if self.limit is not None:
+                resolved |= np.arange(len(v)) - prev > self.limit
+
+        # new state of the series in the batch
+        self._count[batch_codes] += counts
+        series_last = all_last[np.r_[0, np.flatnonzero(all_codes[1:] != all_codes[:-1]) + 1]]
+        last_valid = prev[series_last]
+        has_valid = last_valid >= 0
+        updated, last_valid = batch_codes[has_valid], last_valid[has_valid]
+        self._last_x[updated] = x[last_valid]
+        self._last_t[updated] = t[last_valid]
+        self._last_v[updated] = v[last_valid]
+        self._gap[updated] = series_last[has_valid] - last_valid
+        waiting = ~resolved
+        pending_code = np.r_[self._pending_code[keep_pending], all_codes[waiting]]
+        order = np.argsort(pending_code, kind='stable')
+        self._pending_code = pending_code[order]
+        self._pending_x = np.r_[self._pending_x[keep_pending], x[waiting]][order]
+        self._pending_t = np.r_[self._pending_t[keep_pending], t[waiting]][order]
+
+        out = resolved & ~emitted
+        out_times = t[out].view('datetime64[ns]') if is_datetime else t[out]
+        return self._ids.values[all_codes[out]], out_times, filled[out]
+
+    def push(self, series_id, time, value):
+        """
+        Adds one event; returns the list of (time, value) of the events of the series that are now resolved.
+        A batch of one, for occasional events: feeds should be pushed in batches (e.g. every few milliseconds)
+        """
+        _, times, values = self.push_batch([series_id], [time], [value])
+        return list(zip(times.tolist(), values.tolist()))
+
+    def flush(self):
+        """
+        Emits the pending NaNs unfilled and clears the state of every series; returns (series_ids, times, values)
+        """
+        ids, times = self._ids.values[self._pending_code], self._pending_t
+        if self._is_datetime:
+            times = times.view('datetime64[ns]')
+        self._reset()
+        return ids, times, np.full(len(times), np.nan)
@@ -1,9 +1,152 @@
 import numpy as np
-from scipy import stats
+import pandas as pd
 
 threshold = 3
+METHODS = ('stddev', 'zscore', 'iqr')
 
 
+# region =========== Fitted bounds for all the methods ==================
+def _quartiles(values):
+    """
+    First and third quartiles of every column (linear interpolation, as DataFrame.quantile), NaNs ignored.
+    Without NaNs both quartiles come from one partition of the data; otherwise every column is sorted once.
+    """
+    mask = np.isnan(values)
+    if not mask.any():
+        return np.quantile(values, [.25, .75], axis=0)
+    ordered = np.sort(values, axis=0)
+    count = (~mask).sum(axis=0)
+    columns = np.arange(values.shape[1])
+    quartiles = []
+    for q in (.25, .75):
+        position = (count - 1) * q
+        low = np.floor(position).astype(int)
+        high = np.minimum(low + 1, np.maximum(count - 1, 0))
+        low, high = np.maximum(low, 0), np.maximum(high, 0)
+        t = position - low
+        a, b = ordered[low, columns], ordered[high, columns]
+        diff = b - a
+        # same interpolation as np.quantile
+        quartile = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+        quartiles.append(np.where(count > 0, quartile, np.nan))
+    return np.array(quartiles)
+
+
+class OutlierBounds(object):
+    """
+    Statistics of every column (count, mean, standard deviations, quartiles), computed together by fit, and the
+    inlier bounds of the **Standard deviation**, **ZScore** and **IQR** methods derived from them. Fit on one
+    DataFrame, the bounds can be applied to others (e.g. new batches of the same data).
+    :param threshold: number of standard deviations (Standard deviation and ZScore methods).
+    :param iqr_factor: number of IQRs beyond the quartiles (IQR method).
+    """
+
+    def __init__(self, threshold=threshold, iqr_factor=1.5):
+        self.threshold = threshold
+        self.iqr_factor = iqr_factor
+        self.columns_ = None
+
+    def fit(self, inputDF):
+        """
+        Computes the statistics of every column of inputDF, NaNs ignored.
+        :param inputDF: DataFrame with the data of reference.
+        :return: self
+        """
+        values = inputDF.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(valid, values, 0).sum(axis=0) / count
+        squares = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+        q1, q3 = _quartiles(values)
+        return self.set_statistics(inputDF.columns, count, mean, squares, q1, q3)
+
+    def set_statistics(self, columns, count, mean, squares, q1, q3):
+        """
+        Sets statistics computed elsewhere (e.g. from sketches of data too large for memory, StreamingOutliers.py).
+        :param squares: sum of the squared deviations from the mean of every column.
+        :return: self
+        """
+        count = np.asarray(count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.std_ = np.sqrt(squares / (count - 1))   # DataFrame.std
+            self.std0_ = np.sqrt(squares / count)        # scipy.stats.zscore
+        self.columns_ = pd.Index(columns)
+        self.count_ = count
+        self.mean_ = np.asarray(mean, dtype=float)
+        self.q1_, self.q3_ = np.asarray(q1, dtype=float), np.asarray(q3, dtype=float)
+        return self
+
+    def bounds(self, method):
+        """
+        Lower and upper inlier bounds of every column for a method.
+        :param method: 'stddev', 'zscore' or 'iqr'.
+        :return: DataFrame with one row per column, lower and upper bounds.
+        """
+        if self.columns_ is None:
+            raise ValueError("OutlierBounds is not fitted yet")
+        if method in ('stddev', 'zscore'):
+            spread = self.threshold * (self.std_ if method == 'stddev' else self.std0_)
+            lower, upper = self.mean_ - spread, self.mean_ + spread
+        elif method == 'iqr':
+            iqr = self.q3_ - self.q1_
+            lower, upper = self.q1_ - (self.iqr_factor * iqr), self.q3_ + (self.iqr_factor * iqr)
+        else:
+            raise ValueError("method has to be one of %s" % (METHODS,))
+        return pd.DataFrame({'lower': lower, 'upper': upper}, index=self.columns_)
+
+    def _inliers(self, values, method):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if method == 'stddev':
+                return np.abs(values - self.mean_) <= self.threshold * self.std_
+            if method == 'zscore':
+                return np.abs((values - self.mean_) / self.std0_) < self.threshold
+            if method == 'iqr':
+                iqr = self.q3_ - self.q1_
+                return ((values >= (self.q1_ - (self.iqr_factor * iqr))) &
+                        (values <= (self.q3_ + (self.iqr_factor * iqr))))
+        raise ValueError("method has to be one of %s" % (METHODS,))
+
+    def masks(self, inputDF, methods=METHODS):
+        """
+        Masks of the outliers of inputDF for several methods, from one conversion of the data. NaNs are outliers.
+        :param inputDF: DataFrame with the columns of the fitted one.
+        :param methods: methods to apply.
+        :return: dict method -> DataFrame of booleans, True for the outliers.
+        """
+        if self.columns_ is None:
+            raise ValueError("OutlierBounds is not fitted yet")
+        values = inputDF[self.columns_].to_numpy(dtype=float)
+        return {method: pd.DataFrame(~self._inliers(values, method), index=inputDF.index, columns=self.columns_)
+                for method in methods}
+
+    def outliers(self, inputDF, method):
+        """
+        Mask of the outliers of inputDF for one method.
+        :return: DataFrame of booleans, True for the outliers.
+        """
+        return self.masks(inputDF, (method,))[method]
+
+    def inliers(self, inputDF, method):
+        """
+        Rows of inputDF without outlier for one method.
+        :return: DataFrame with only inliers.
+        """
+        return inputDF[~self.outliers(inputDF, method).any(axis=1)]
+
+
+def Outlier_Masks(inputDF):
+    """
+    Detects the outliers with the **Standard deviation**, **ZScore** and **IQR** methods together: the statistics of
+    every column are computed once and shared by the three methods.
+    :param inputDF: DataFrame which contains the data to detect the outliers.
+    :return: dict method -> DataFrame with boolean values, True for the outliers.
+    """
+    return OutlierBounds().fit(inputDF).masks(inputDF)
+
+
+# endregion
+
 # region =========== Standard Deviation Method ==================
 def StdDev_Method(inputDF):
     """
@@ -12,7 +155,7 @@ def StdDev_Method(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: DataFrame with only inliers.
     """
-    return inputDF[((inputDF - inputDF.mean()).abs() <= threshold * inputDF.std()).all(axis = 1)]
+    return OutlierBounds().fit(inputDF).inliers(inputDF, 'stddev')
 
 
 def StdDev_Method_With_Inliers(inputDF):
@@ -22,7 +165,7 @@ def StdDev_Method_With_Inliers(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: Detects the Outliers and returns the dataframe with boolean values, for each row.
     """
-    return inputDF[((inputDF - inputDF.mean()).abs() > threshold * inputDF.std()).isnull().any(1)]
+    return OutlierBounds().fit(inputDF).outliers(inputDF, 'stddev')
 
 
 # endregion
@@ -35,7 +178,7 @@ def ZScore_Method(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: DataFrame with only inliers
     """
-    return inputDF[(np.abs(stats.zscore(inputDF)) < threshold).all(axis = 1)]
+    return OutlierBounds().fit(inputDF).inliers(inputDF, 'zscore')
 
 
 def ZScore_Method_With_Inliers(inputDF):
@@ -45,7 +188,7 @@ def ZScore_Method_With_Inliers(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: Detects the Outliers and returns the dataframe with boolean values, for each row.
     """
-    return inputDF[(np.abs(stats.zscore(inputDF)) < threshold).all(axis = 1)]
+    return OutlierBounds().fit(inputDF).outliers(inputDF, 'zscore')
 
 # inputDF = 0
 # mean_y = np.mean(inputDF)
@@ -64,7 +207,7 @@ def IQR_Method(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: DataFrame with only inliers
     """
-    return inputDF[((inputDF >= (inputDF.quantile(.25) - (1.5 * (inputDF.quantile(.75) - inputDF.quantile(.25))))) & (inputDF <= (inputDF.quantile(.75) + (1.5 * (inputDF.quantile(.75) - inputDF.quantile(.25)))))).all(axis = 1)]
+    return OutlierBounds().fit(inputDF).inliers(inputDF, 'iqr')
 
 
 def IQR_Method_With_Inliers(inputDF):
@@ -74,7 +217,7 @@ def IQR_Method_With_Inliers(inputDF):
     :param inputDF: DataFrame which contains the data to remove the outliers.
     :return: Detects the Outliers and returns the dataframe with boolean values, for each row.
     """
-    return inputDF.mask(~((inputDF >= (inputDF.quantile(.25) - (1.5 * (inputDF.quantile(.75) - inputDF.quantile(.25))))) & (inputDF <= (inputDF.quantile(.75) + (1.5 * (inputDF.quantile(.75) - inputDF.quantile(.25))))))).isnull()
+    return OutlierBounds().fit(inputDF).outliers(inputDF, 'iqr')
 
 # quartile_1, quartile_3 = np.percentile(inputDF, [25, 75])
 # iqr = quartile_3 - quartile_1
@@ -83,4 +226,3 @@ def IQR_Method_With_Inliers(inputDF):
 # return np.where((inputDF > upper_bound) | (inputDF < lower_bound))
 
 # endregion
-
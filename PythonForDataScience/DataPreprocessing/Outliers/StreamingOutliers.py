@@ -0,0 +1,239 @@
+"""
+Streaming Outlier Detection
+---------------------------
+
+    The methods of Out01.py need the whole DataFrame in memory for their statistics. For data read in chunks (e.g. a
+    multi-GB csv), StreamingOutliers works in two passes over the chunks, with memory bounded by the chunk size:
+        - first pass: every chunk is summarized in a sketch, and the sketches are merged. Sketches of chunks can be
+          built in parallel worker processes and merged in any order.
+            - mean and variance: count, mean and sum of squared deviations of every column, merged with the formulas
+              of Chan et al. (the parallel form of Welford's algorithm); exact
+            - quartiles: a KLL sketch of every column (Karnin, Lang and Liberty, 2016), a hierarchy of compactors
+              that keep a sorted sample of the values with weights 1, 2, 4, ...; fewer than 3k values per column whatever
+              the number of rows, rank error in O(1/k). Exact while no more than k values are seen.
+        - the merged sketch gives an Out01.OutlierBounds, and a second pass filters or flags every chunk with it
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from Out01 import METHODS, OutlierBounds, threshold
+
+
+class QuantileSketch(object):
+    """
+    KLL quantile sketch of one column.
+    :param k: size of the top compactor; the rank error decreases as 1/k.
+    """
+
+    def __init__(self, k=1000, random_state=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.zeros(0)]
+        self._rng = np.random.RandomState(random_state)
+
+    def _capacity(self, level):
+        # the compactors shrink geometrically from the top level down
+        return max(2, int(np.ceil(self.k * (2.0 / 3) ** (len(self.levels) - level - 1))))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                # one item of an odd count stays, every other one of the rest moves up with twice the weight
+                kept, items = items[:len(items) % 2], items[len(items) % 2:]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.r_[self.levels[level + 1], items[self._rng.randint(2)::2]]
+            level += 1
+
+    def update(self, values):
+        """
+        Adds an array of values, NaNs ignored.
+        :return: self
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.r_[self.levels[0], values]
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Adds the values summarized by another sketch.
+        :return: self
+        """
+        self.levels.extend(np.zeros(0) for _ in range(len(other.levels) - len(self.levels)))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.r_[self.levels[level], items]
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Quantiles of the values (linear interpolation between the ranks of the sketch items).
+        """
+        if not self.n:
+            return np.full(np.shape(q), np.nan)
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], q)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, weights = items[order], weights[order]
+        # rank of the middle of the block of rows every item stands for
+        centers = np.cumsum(weights) - (weights + 1) / 2.0
+        return np.interp(np.asarray(q) * (self.n - 1), centers, items)
+
+
+class ChunkSketch(object):
+    """
+    Mergeable summary of the numeric columns of a chunk: count, mean, sum of squared deviations and quantile sketch
+    of every column.
+    """
+
+    def __init__(self, columns, k=1000, random_state=None):
+        self.columns = list(columns)
+        self.count = np.zeros(len(self.columns))
+        self.mean = np.zeros(len(self.columns))
+        self.squares = np.zeros(len(self.columns))
+        rng = np.random.RandomState(random_state)
+        self.quantiles = [QuantileSketch(k, rng.randint(np.iinfo(np.int32).max)) for _ in self.columns]
+
+    def _merge_moments(self, count, mean, squares):
+        # Chan et al.: exact combination of the counts, means and sums of squared deviations of two parts
+        total = self.count + count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = mean - self.mean
+            new_mean = np.where(total > 0, self.mean + delta * count / total, 0)
+            new_squares = np.where(total > 0, self.squares + squares + delta ** 2 * self.count * count / total, 0)
+        self.count, self.mean, self.squares = total, new_mean, new_squares
+
+    def update(self, chunk):
+        """
+        Adds the rows of a DataFrame chunk.
+        :return: self
+        """
+        values = chunk[self.columns].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, np.where(valid, values, 0).sum(axis=0) / count, 0)
+        squares = (np.where(valid, values - mean, 0) ** 2).sum(axis=0)
+        self._merge_moments(count, mean, squares)
+        for j, sketch in enumerate(self.quantiles):
+            sketch.update(values[:, j])
+        return self
+
+    def merge(self, other):
+        """
+        Adds the rows summarized by another sketch of the same columns.
+        :return: self
+        """
+        if other.columns != self.columns:
+            raise ValueError("sketches of different columns")
+        self._merge_moments(other.count, other.mean, other.squares)
+        for sketch, other_sketch in zip(self.quantiles, other.quantiles):
+            sketch.merge(other_sketch)
+        return self
+
+    def outlier_bounds(self, threshold=threshold, iqr_factor=1.5):
+        """
+        Out01.OutlierBounds with the statistics of the sketch.
+        """
+        q1, q3 = np.array([sketch.quantile([.25, .75]) for sketch in self.quantiles]).T
+        with np.errstate(invalid='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+        return OutlierBounds(threshold, iqr_factor).set_statistics(self.columns, self.count.astype(np.int64), mean,
+                                                                   self.squares, q1, q3)
+
+
+def _sketch_chunk(chunk, columns, k, seed):
+    return ChunkSketch(columns, k, seed).update(chunk)
+
+
+class StreamingOutliers(object):
+    """
+    Outlier detection on data read in chunks, with the rules of Out01.py.
+    :param columns: columns to check; numeric columns of the first chunk by default.
+    :param threshold: number of standard deviations (Standard deviation and ZScore methods).
+    :param iqr_factor: number of IQRs beyond the quartiles (IQR method).
+    :param k: size of the quantile sketches.
+    :param chunksize: rows per chunk when the source is a csv file.
+    :param n_jobs: worker processes building the sketches of the chunks (-1 uses all cores).
+    """
+
+    def __init__(self, columns=None, threshold=threshold, iqr_factor=1.5, k=1000, chunksize=100000, n_jobs=1,
+                 random_state=None):
+        self.columns = columns
+        self.threshold = threshold
+        self.iqr_factor = iqr_factor
+        self.k = k
+        self.chunksize = chunksize
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.sketch_ = None
+        self.bounds_ = None
+
+    def _chunks(self, source):
+        if isinstance(source, str):
+            return pd.read_csv(source, chunksize=self.chunksize)
+        if isinstance(source, pd.DataFrame):
+            return (source.iloc[start:start + self.chunksize] for start in range(0, len(source), self.chunksize))
+        return iter(source)
+
+    def fit(self, source):
+        """
+        First pass: sketches every chunk of source and merges the sketches.
+        :param source: csv file path, DataFrame or iterable of DataFrame chunks.
+        :return: self
+        """
+        chunks = self._chunks(source)
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("no data in source")
+        columns = self.columns or list(first.select_dtypes(include='number').columns)
+        rng = np.random.RandomState(self.random_state)
+        seeds = iter(lambda: rng.randint(np.iinfo(np.int32).max), None)
+        # the chunks are read as the workers need them, and their sketches merged as they come back
+        sketches = Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(
+            delayed(_sketch_chunk)(chunk, columns, self.k, seed)
+            for chunk, seed in zip(itertools.chain([first], chunks), seeds))
+        self.sketch_ = None
+        for sketch in sketches:
+            self.sketch_ = sketch if self.sketch_ is None else self.sketch_.merge(sketch)
+        self.bounds_ = self.sketch_.outlier_bounds(self.threshold, self.iqr_factor)
+        return self
+
+    def _check_fitted(self):
+        if self.bounds_ is None:
+            raise ValueError("StreamingOutliers is not fitted yet")
+
+    def filter(self, source, method='iqr'):
+        """
+        Second pass: yields the rows of every chunk without outlier for one method.
+        """
+        self._check_fitted()
+        for chunk in self._chunks(source):
+            yield self.bounds_.inliers(chunk, method)
+
+    def flag(self, source, methods=METHODS):
+        """
+        Second pass: yields every chunk with a boolean column outlier_<method> per method, True for the rows with
+        an outlier.
+        """
+        self._check_fitted()
+        for chunk in self._chunks(source):
+            masks = self.bounds_.masks(chunk, methods)
+            chunk = chunk.copy()
+            for method in methods:
+                chunk['outlier_' + method] = masks[method].any(axis=1).to_numpy()
+            yield chunk